@@ -13,13 +13,78 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.http import HttpResponse, FileResponse
-from django.db.models import Q, Avg, Count, Sum, Case, When, F, Value
+from django.db.models import Q, Avg, Count, Sum, Case, When, F, Value, DateField
+from django.db.models.functions import Trunc
 from django.conf import settings
 from django.utils import timezone
 from Backend.models.report_models import ReportTemplate, ReportData, Metric, ChartType, BackendCustomChart as CustomChart, Report
 from FlowTestApp.models import TestRun, TestCase, AutomationProject, AutomationTest
+from collections import defaultdict
 from datetime import datetime, timedelta
 
+# Статусы запусков на графиках отчетов
+CHART_STATUSES = ('passed', 'failed', 'skipped')
+
+
+def _status_counts(test_runs):
+    """Количество запусков по статусам одним запросом (индекс project, status, started_at)"""
+    counts = dict(test_runs.order_by().values_list('status').annotate(count=Count('id')))
+    return {status: counts.get(status, 0) for status in CHART_STATUSES}
+
+
+def _status_counts_by_period(test_runs, kind):
+    """Количество запусков по периодам kind ('day', 'week', 'month') и статусам: {начало периода: {статус: количество}}"""
+    rows = test_runs.order_by().annotate(
+        period=Trunc('started_at', kind, output_field=DateField())
+    ).values('period', 'status').annotate(count=Count('id'))
+    periods = defaultdict(dict)
+    for row in rows:
+        periods[row['period']][row['status']] = row['count']
+    return periods
+
+
+def _period_starts(start_date, end_date, kind):
+    """Начала периодов kind в диапазоне дат, в том же виде, что и ключи _status_counts_by_period"""
+    current = start_date.date()
+    if kind == 'week':
+        current -= timedelta(days=current.weekday())
+    elif kind == 'month':
+        current = current.replace(day=1)
+    while current <= end_date.date():
+        yield current
+        if kind == 'day':
+            current += timedelta(days=1)
+        elif kind == 'week':
+            current += timedelta(weeks=1)
+        else:
+            current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _test_stability(test_runs, min_runs):
+    """Число запусков и процент успешных по тест-кейсам одним запросом"""
+    rows = test_runs.order_by().values('test_case', 'test_case__title').annotate(
+        total_runs=Count('id'),
+        passed_runs=Count('id', filter=Q(status='passed'))
+    ).filter(total_runs__gte=min_runs)
+    return [
+        {
+            'name': row['test_case__title'],
+            'stability': row['passed_runs'] / row['total_runs'] * 100,
+            'runs': row['total_runs']
+        }
+        for row in rows if row['test_case']
+    ]
+
+
+def _average_execution_times(test_runs, limit):
+    """Тест-кейсы с наибольшим средним временем выполнения"""
+    return list(
+        test_runs.filter(execution_time__isnull=False, test_case__isnull=False)
+        .order_by().values('test_case', 'test_case__title')
+        .annotate(avg_duration=Avg('execution_time'))
+        .order_by('-avg_duration')[:limit]
+    )
+
 class CustomChartSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomChart
@@ -141,7 +206,7 @@ class CustomChartViewSet(viewsets.ModelViewSet):
         test_runs = TestRun.objects.filter(
             project_id=project_id,
             started_at__range=(start_date, end_date)
-        ).order_by('started_at')
+        )
         
         # Группировка по дням
         days = []
@@ -149,16 +214,12 @@ class CustomChartViewSet(viewsets.ModelViewSet):
         failed_counts = []
         skipped_counts = []
         
-        current_date = start_date.date()
-        while current_date <= end_date.date():
-            days.append(current_date.strftime('%Y-%m-%d'))
-            
-            day_runs = test_runs.filter(started_at__date=current_date)
-            passed_counts.append(day_runs.filter(status='passed').count())
-            failed_counts.append(day_runs.filter(status='failed').count())
-            skipped_counts.append(day_runs.filter(status='skipped').count())
-            
-            current_date += timedelta(days=1)
+        counts = _status_counts_by_period(test_runs, 'day')
+        for day in _period_starts(start_date, end_date, 'day'):
+            days.append(day.strftime('%Y-%m-%d'))
+            passed_counts.append(counts[day].get('passed', 0))
+            failed_counts.append(counts[day].get('failed', 0))
+            skipped_counts.append(counts[day].get('skipped', 0))
         
         datasets = []
         if config.get('show_passed', True):
@@ -197,9 +258,8 @@ class CustomChartViewSet(viewsets.ModelViewSet):
             started_at__range=(start_date, end_date)
         )
         
-        passed = test_runs.filter(status='passed').count()
-        failed = test_runs.filter(status='failed').count()
-        skipped = test_runs.filter(status='skipped').count()
+        counts = _status_counts(test_runs)
+        passed, failed, skipped = counts['passed'], counts['failed'], counts['skipped']
         
         return {
             'labels': ['Успешно', 'Ошибка', 'Пропущено'],
@@ -217,12 +277,7 @@ class CustomChartViewSet(viewsets.ModelViewSet):
         """Время выполнения тестов"""
         test_runs = TestRun.objects.filter(
             project_id=project_id,
-            started_at__range=(start_date, end_date),
-            duration__isnull=False
-        )
-        
-        test_cases = TestCase.objects.filter(
-            id__in=test_runs.values_list('test_case', flat=True)
+            started_at__range=(start_date, end_date)
         )
         
         labels = []
@@ -231,23 +286,10 @@ class CustomChartViewSet(viewsets.ModelViewSet):
         # Ограничиваем количество тестов для отображения
         limit = config.get('limit', 10)
         
-        # Собираем среднее время выполнения для каждого теста
-        test_data = []
-        for test_case in test_cases[:limit]:
-            avg_duration = test_runs.filter(test_case=test_case).aggregate(avg=Avg('duration'))['avg']
-            if avg_duration:
-                test_data.append({
-                    'name': test_case.name,
-                    'duration': avg_duration
-                })
-        
-        # Сортируем по длительности
-        test_data.sort(key=lambda x: x['duration'], reverse=True)
-        
-        # Ограничиваем количество тестов для отображения
-        for test in test_data[:limit]:
-            labels.append(test['name'])
-            data.append(test['duration'])
+        # Среднее время выполнения по тестам, от самых долгих
+        for test in _average_execution_times(test_runs, limit):
+            labels.append(test['test_case__title'])
+            data.append(test['avg_duration'])
         
         return {
             'labels': labels,
@@ -267,10 +309,6 @@ class CustomChartViewSet(viewsets.ModelViewSet):
             started_at__range=(start_date, end_date)
         )
         
-        test_cases = TestCase.objects.filter(
-            id__in=test_runs.values_list('test_case', flat=True)
-        )
-        
         labels = []
         data = []
         
@@ -279,17 +317,7 @@ class CustomChartViewSet(viewsets.ModelViewSet):
         min_runs = config.get('min_runs', 5)
         
         # Собираем стабильность для каждого теста
-        test_data = []
-        for test_case in test_cases:
-            test_runs_count = test_runs.filter(test_case=test_case).count()
-            if test_runs_count >= min_runs:
-                passed_count = test_runs.filter(test_case=test_case, status='passed').count()
-                stability = (passed_count / test_runs_count) * 100
-                test_data.append({
-                    'name': test_case.name,
-                    'stability': stability,
-                    'runs': test_runs_count
-                })
+        test_data = _test_stability(test_runs, min_runs)
         
         # Сортируем по стабильности (от наименее стабильных к наиболее)
         test_data.sort(key=lambda x: x['stability'])
@@ -376,7 +404,7 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
         
         # Get all test runs for this project (we'll filter by date later if needed)
         all_test_runs = TestRun.objects.filter(
-            test_case__project_id=project_id
+            project_id=project_id
         )
             
         # Get metrics data
@@ -931,8 +959,8 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
         avg_duration = TestRun.objects.filter(
             project_id=project_id,
             started_at__range=(start_date, end_date),
-            duration__isnull=False
-        ).aggregate(avg=Avg('duration'))['avg']
+            execution_time__isnull=False
+        ).aggregate(avg=Avg('execution_time'))['avg']
         
         if not avg_duration:
             return "0s"
@@ -1019,88 +1047,23 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
             group_by = 'month'
             date_format = '%Y-%m'
         
-        # Группируем результаты
+        # Группируем результаты одним запросом по индексу (project, started_at)
         labels = []
         successful = []
         failed = []
         skipped = []
         
-        if group_by == 'day':
-            current_date = start_date.date()
-            while current_date <= end_date.date():
-                labels.append(current_date.strftime(date_format))
-                
-                day_runs = test_runs.filter(started_at__date=current_date)
-                successful.append(day_runs.filter(status='passed').count())
-                failed.append(day_runs.filter(status='failed').count())
-                skipped.append(day_runs.filter(status='skipped').count())
-                
-                current_date += timedelta(days=1)
-        elif group_by == 'week':
-            # Группировка по неделям
-            weeks = {}
-            current_date = start_date
-            while current_date <= end_date:
-                week_key = current_date.strftime(date_format)
-                if week_key not in weeks:
-                    weeks[week_key] = {
-                        'label': f"Week {current_date.strftime('%U')}",
-                        'passed': 0,
-                        'failed': 0,
-                        'skipped': 0
-                    }
-                
-                current_date += timedelta(days=1)
-            
-            for run in test_runs:
-                week_key = run.started_at.strftime(date_format)
-                if week_key in weeks:
-                    if run.status == 'passed':
-                        weeks[week_key]['passed'] += 1
-                    elif run.status == 'failed':
-                        weeks[week_key]['failed'] += 1
-                    elif run.status == 'skipped':
-                        weeks[week_key]['skipped'] += 1
-            
-            # Сортируем недели и заполняем данные
-            for week_key in sorted(weeks.keys()):
-                labels.append(weeks[week_key]['label'])
-                successful.append(weeks[week_key]['passed'])
-                failed.append(weeks[week_key]['failed'])
-                skipped.append(weeks[week_key]['skipped'])
-        elif group_by == 'month':
-            # Группировка по месяцам
-            months = {}
-            current_date = start_date
-            while current_date <= end_date:
-                month_key = current_date.strftime(date_format)
-                if month_key not in months:
-                    months[month_key] = {
-                        'label': current_date.strftime('%b %Y'),
-                        'passed': 0,
-                        'failed': 0,
-                        'skipped': 0
-                    }
-                
-                # Переходим к следующему дню
-                current_date += timedelta(days=1)
-            
-            for run in test_runs:
-                month_key = run.started_at.strftime(date_format)
-                if month_key in months:
-                    if run.status == 'passed':
-                        months[month_key]['passed'] += 1
-                    elif run.status == 'failed':
-                        months[month_key]['failed'] += 1
-                    elif run.status == 'skipped':
-                        months[month_key]['skipped'] += 1
-            
-            # Сортируем месяцы и заполняем данные
-            for month_key in sorted(months.keys()):
-                labels.append(months[month_key]['label'])
-                successful.append(months[month_key]['passed'])
-                failed.append(months[month_key]['failed'])
-                skipped.append(months[month_key]['skipped'])
+        counts = _status_counts_by_period(test_runs, group_by)
+        for period in _period_starts(start_date, end_date, group_by):
+            if group_by == 'week':
+                labels.append(f"Week {period.strftime('%U')}")
+            elif group_by == 'month':
+                labels.append(period.strftime('%b %Y'))
+            else:
+                labels.append(period.strftime(date_format))
+            successful.append(counts[period].get('passed', 0))
+            failed.append(counts[period].get('failed', 0))
+            skipped.append(counts[period].get('skipped', 0))
 
         return {
             'labels': labels,
@@ -1133,9 +1096,8 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
             started_at__range=(start_date, end_date)
         )
         
-        passed = test_runs.filter(status='passed').count()
-        failed = test_runs.filter(status='failed').count()
-        skipped = test_runs.filter(status='skipped').count()
+        counts = _status_counts(test_runs)
+        passed, failed, skipped = counts['passed'], counts['failed'], counts['skipped']
 
         return {
             'labels': ['Успешно', 'Неуспешно', 'Пропущено'],
@@ -1154,23 +1116,15 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
         # Выбираем топ-10 тестов с самой большой средней длительностью
         test_runs = TestRun.objects.filter(
             project_id=project_id,
-            started_at__range=(start_date, end_date),
-            duration__isnull=False
-        ).values('test_case').annotate(
-            avg_duration=Avg('duration')
-        ).order_by('-avg_duration')[:10]
+            started_at__range=(start_date, end_date)
+        )
         
         labels = []
         data = []
         
-        for run in test_runs:
-            if run['test_case']:
-                try:
-                    test_case = TestCase.objects.get(id=run['test_case'])
-                    labels.append(test_case.name)
-                    data.append(run['avg_duration'])
-                except TestCase.DoesNotExist:
-                    continue
+        for run in _average_execution_times(test_runs, 10):
+            labels.append(run['test_case__title'])
+            data.append(run['avg_duration'])
         
         return {
             'labels': labels,
@@ -1188,43 +1142,12 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
         # Выбираем тесты с количеством запусков не менее 5 и вычисляем их стабильность
         min_runs = 5
         
-        # Находим тесты с достаточным количеством запусков
-        test_cases_with_runs = TestRun.objects.filter(
+        # Стабильность тестов с достаточным количеством запусков
+        test_runs = TestRun.objects.filter(
             project_id=project_id,
             started_at__range=(start_date, end_date)
-        ).values('test_case').annotate(
-            total_runs=Count('id')
-        ).filter(total_runs__gte=min_runs)
-        
-        # Собираем данные о стабильности для каждого теста
-        stability_data = []
-        for tc in test_cases_with_runs:
-            if not tc['test_case']:
-                continue
-                
-            test_case_id = tc['test_case']
-            total_runs = tc['total_runs']
-            
-            # Считаем успешные запуски
-            passed_runs = TestRun.objects.filter(
-                project_id=project_id,
-                test_case_id=test_case_id,
-                status='passed',
-                started_at__range=(start_date, end_date)
-            ).count()
-            
-            # Вычисляем стабильность как процент успешных запусков
-            stability = (passed_runs / total_runs) * 100
-            
-            try:
-                test_case = TestCase.objects.get(id=test_case_id)
-                stability_data.append({
-                    'name': test_case.name,
-                    'stability': stability,
-                    'runs': total_runs
-                })
-            except TestCase.DoesNotExist:
-                continue
+        )
+        stability_data = _test_stability(test_runs, min_runs)
         
         # Сортируем по стабильности (от наименее стабильных к наиболее)
         stability_data.sort(key=lambda x: x['stability'])
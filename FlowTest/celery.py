@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from kombu import Queue
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'FlowTest.settings')
@@ -15,6 +16,27 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.conf.broker_url = 'redis://localhost:6379/0'
 app.conf.result_backend = 'redis://localhost:6379/1'
 
+# Очереди: интерактивные запуски пользователей не ждут за массовыми запусками по расписанию.
+# Под очередь interactive запускается отдельный воркер, который не берет другие очереди:
+#   celery -A FlowTest worker -Q interactive -n interactive@%h
+#   celery -A FlowTest worker -Q scheduled,sync,interactive -n bulk@%h
+app.conf.task_queues = (
+    Queue('interactive', routing_key='interactive'),
+    Queue('scheduled', routing_key='scheduled'),
+    Queue('sync', routing_key='sync'),
+)
+app.conf.task_default_queue = 'scheduled'
+app.conf.task_routes = {
+    'FlowTestApp.tasks.execute_test': {'queue': 'interactive'},
+    'FlowTestApp.tasks.run_test': {'queue': 'interactive'},
+    'FlowTestApp.tasks.run_scheduled_tests': {'queue': 'scheduled'},
+    'FlowTestApp.tasks.check_scheduled_tests': {'queue': 'scheduled'},
+    'FlowTestApp.tasks.run_test_shard': {'queue': 'scheduled'},
+    'FlowTestApp.tasks.aggregate_suite_run': {'queue': 'scheduled'},
+    'FlowTestApp.tasks.dispatch_fair_share_queue': {'queue': 'scheduled'},
+    'FlowTestApp.tasks.sync_automation_project': {'queue': 'sync'},
+}
+
 # Настройки для Windows
 # app.conf.broker_connection_retry_on_startup = True
 # app.conf.worker_pool_restarts = True
@@ -235,6 +235,19 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = 'FlowTestApp.CustomUser'
 
+# execution - общий кэш воркеров и веб-серверов для координации выполнения тестов:
+# флаги отмены, объединение запросов, слоты справедливого распределения, состояние
+# контроллеров параллельности (FlowTestApp.services.execution_cache)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'execution': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/2'),
+    }
+}
+
 # Celery Configuration
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/1'
@@ -245,9 +258,116 @@ CELERY_TIMEZONE = 'Europe/Moscow'
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+# Неподтвержденная задача (acks_late) возвращается в очередь по истечении этого времени,
+# оно должно быть больше самого долгого шарда
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 2 * 60 * 60}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Число слотов воркеров на очередь, по нему оценивается время ожидания в очереди
+EXECUTION_QUEUE_CONCURRENCY = {
+    'interactive': int(os.environ.get('CELERY_INTERACTIVE_CONCURRENCY', 2)),
+    'scheduled': int(os.environ.get('CELERY_SCHEDULED_CONCURRENCY', 4)),
+    'sync': int(os.environ.get('CELERY_SYNC_CONCURRENCY', 1)),
+}
+# Сколько последних запусков учитывать в оценке времени ожидания
+QUEUE_ETA_HISTORY = 50
 
 # Путь для хранения локальных копий репозиториев с тестами
 AUTOMATION_PROJECTS_DIR = os.path.join(BASE_DIR, 'automation_projects')
+# Сколько рабочих копий на коммитах распределенных прогонов хранить на узле для каждого проекта
+COMMIT_CHECKOUTS_KEEP = 3
+
+# Пул теплых браузеров Playwright в каждом процессе воркера
+BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', 2))
+# Количество тестов, после которого браузер перезапускается
+BROWSER_POOL_MAX_USES = int(os.environ.get('BROWSER_POOL_MAX_USES', 50))
+
+# Изоляция кода тестов, выполняемого через exec() (TestCase.test_code):
+# zygote - в процессе, порожденном fork() от зиготы с заранее импортированными модулями
+#          EXEC_ZYGOTE_PRELOAD; падение теста не затрагивает воркер. Playwright-тесты
+#          выполняются в долгоживущем процессе-хосте с пулом теплых браузеров, хост
+#          заменяется после EXEC_HOST_MAX_TASKS тестов, таймаута или падения;
+# inline - в потоке процесса воркера, Playwright-тесты получают браузер из пула.
+EXEC_ISOLATION = os.environ.get('EXEC_ISOLATION', 'zygote')
+EXEC_ZYGOTE_PRELOAD = ['FlowTest.zygote_preload']
+EXEC_HOST_MAX_TASKS = 100
+
+# Кэш скомпилированного кода тестов: записей в памяти процесса и каталог файлов marshal
+TEST_CODE_CACHE_SIZE = 512
+TEST_CODE_CACHE_DIR = os.environ.get('TEST_CODE_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'test_code'))
+
+# Отложенная запись событий запуска (TestEvent): буфер сбрасывается при EVENT_BUFFER_SIZE событиях
+# или через EVENT_BUFFER_FLUSH_INTERVAL секунд. Несброшенные события хранятся в локальном спуле
+# и дописываются при старте воркера или командой replay_event_spool
+EVENT_BUFFER_SIZE = 50
+EVENT_BUFFER_FLUSH_INTERVAL = 1.0
+EVENT_SPOOL_DIR = os.environ.get('EVENT_SPOOL_DIR', os.path.join(BASE_DIR, 'spool', 'events'))
+
+# Потоковый вывод процессов тестов: период отправки порций и размер хвоста в памяти
+EXECUTION_STREAM_FLUSH_INTERVAL = 0.5
+EXECUTION_OUTPUT_TAIL_CHARS = 1000000
+# Вывод прогонов (TestRunLogChunk): после завершения порции объединяются до LOG_COMPACT_CHUNK_BYTES
+# и сжимаются zlib; LOG_READ_LIMIT_BYTES - сколько байт лога по умолчанию отдает один запрос хвоста
+LOG_COMPACT_CHUNK_BYTES = 1024 * 1024
+LOG_COMPRESSION_LEVEL = 6
+LOG_READ_LIMIT_BYTES = 256 * 1024
+# Итоговый вывод тестов (OutputBlob) хранится один раз по хэшу содержимого и сжимается zstd,
+# если установлен пакет zstandard, иначе zlib
+OUTPUT_BLOB_ZSTD_LEVEL = 10
+OUTPUT_BLOB_ZLIB_LEVEL = 6
+
+# Хранение истории запусков. В PostgreSQL TestEvent секционирована по месяцам, секции создаются
+# на PARTITION_MONTHS_AHEAD месяцев вперед (команда manage_partitions, задача maintain_run_storage).
+# Запуски и события старше срока хранения проекта (Project.retention_days, по умолчанию
+# RUN_RETENTION_DAYS; None - хранить всегда) выгружаются в .jsonl.gz в RUN_ARCHIVE_DIR и удаляются
+PARTITION_MONTHS_AHEAD = 3
+RUN_RETENTION_DAYS = int(os.environ['RUN_RETENTION_DAYS']) if os.environ.get('RUN_RETENTION_DAYS') else None
+RUN_ARCHIVE_DIR = os.environ.get('RUN_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+RETENTION_BATCH_SIZE = 1000
+# Число одновременных процессов тестов на воркер, 0 - по числу ядер и лимиту открытых файлов
+EXECUTION_MAX_CONCURRENCY = int(os.environ.get('EXECUTION_MAX_CONCURRENCY', 0))
+# Таймауты выполнения в секундах. Таймаут теста по умолчанию считается по p99 длительности
+# последних EXECUTION_TIMEOUT_HISTORY запусков с запасом EXECUTION_TIMEOUT_MULTIPLIER и лежит
+# в пределах [EXECUTION_TIMEOUT_MIN, EXECUTION_TEST_TIMEOUT]; без истории берется EXECUTION_TEST_TIMEOUT
+EXECUTION_TEST_TIMEOUT = 15 * 60
+EXECUTION_BATCH_TIMEOUT = 25 * 60
+EXECUTION_TIMEOUT_MIN = 60
+EXECUTION_TIMEOUT_MULTIPLIER = 3
+EXECUTION_TIMEOUT_HISTORY = 100
+EXECUTION_TIMEOUT_MIN_SAMPLES = 5
+# Как часто исполнители проверяют флаг отмены запуска, в секундах
+EXECUTION_CANCEL_POLL_INTERVAL = 1.0
+
+# Адаптивный лимит одновременных тестов: границы, пороги загрузки и период пересчета в секундах.
+# EXECUTION_BROWSER_PROCESS_LIMIT = 0 - шесть процессов браузера на ядро
+EXECUTION_CONCURRENCY_MIN = 1
+EXECUTION_CPU_HIGH_PERCENT = 85
+EXECUTION_MEMORY_HIGH_PERCENT = 85
+EXECUTION_BROWSER_PROCESS_LIMIT = 0
+EXECUTION_CONCURRENCY_INTERVAL = 2.0
+
+# Распределенный запуск: прогоны больше порога делятся на шарды по воркерам Celery
+DISTRIBUTED_SHARD_COUNT = int(os.environ.get('DISTRIBUTED_SHARD_COUNT', 8))
+DISTRIBUTED_BATCH_THRESHOLD = int(os.environ.get('DISTRIBUTED_BATCH_THRESHOLD', 50))
+
+# Справедливое распределение воркеров между проектами: в брокер одновременно отправляется
+# не больше FAIR_SHARE_SLOTS задач запусков по расписанию и шардов. Политика weighted
+# учитывает Project.scheduling_weight, round_robin выдает слоты проектам по очереди.
+# FAIR_SHARE_DEFAULT_QUOTA - лимит проекта без Project.max_concurrent_runs (0 - без лимита)
+FAIR_SHARE_SLOTS = int(os.environ.get('FAIR_SHARE_SLOTS', EXECUTION_QUEUE_CONCURRENCY['scheduled']))
+FAIR_SHARE_POLICY = os.environ.get('FAIR_SHARE_POLICY', 'weighted')
+FAIR_SHARE_DEFAULT_QUOTA = int(os.environ.get('FAIR_SHARE_DEFAULT_QUOTA', 0))
+FAIR_SHARE_SLOT_TIMEOUT = 2 * 60 * 60
+
+# Кэш результатов (включается для проекта автоматизации): запись живет RESULT_CACHE_TTL_HOURS
+# с продлением при попадании, но исходный запуск не старше RESULT_CACHE_MAX_AGE_HOURS
+RESULT_CACHE_TTL_HOURS = 24
+RESULT_CACHE_MAX_AGE_HOURS = 7 * 24
+
+# Граф импортов тестов для выбора затронутых изменениями тестов, хранится по коммиту
+IMPACT_GRAPH_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Очередность тестов в наборе: недавними считаются падения и изменения за ORDERING_RECENT_DAYS дней
+ORDERING_RECENT_DAYS = 7
 
 # Celery Beat Schedule
 CELERY_BEAT_SCHEDULE = {
@@ -255,6 +375,14 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'FlowTestApp.tasks.check_scheduled_tests',
         'schedule': 60.0,  
     },
+    'dispatch-fair-share-queue': {
+        'task': 'FlowTestApp.tasks.dispatch_fair_share_queue',
+        'schedule': 15.0,
+    },
+    'maintain-run-storage': {
+        'task': 'FlowTestApp.tasks.maintain_run_storage',
+        'schedule': 24 * 60 * 60.0,
+    },
 }
 
 # Logging Configuration
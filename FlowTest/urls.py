@@ -13,11 +13,11 @@ from FlowTestApp.views import (
     ProjectViewSet, FolderViewSet, TestCaseViewSet,
     RoleViewSet, CustomUserViewSet, AutomationProjectViewSet,
     TestRunViewSet, SchedulerEventViewSet, ReportTemplateViewSet,
-    PermissionViewSet,
+    PermissionViewSet, ExecutionProfileViewSet, SuiteRunViewSet,
     test_cases_creation_stats, test_execution_stats, tests_over_time,
     results_distribution, priority_distribution, test_flakiness,
     TestExecutionView, TestStatusView, CheckTestExistenceView, AnalyticsView, ReportExportView, ReportDetailView,
-    top_contributors
+    top_contributors, execution_concurrency, execution_fair_share
 )
 
 # Direct user creation view to avoid URL conflicts
@@ -56,6 +56,8 @@ router.register(r'users', CustomUserViewSet, basename='users')
 router.register(r'automation-projects', AutomationProjectViewSet)
 router.register(r'test-runs', TestRunViewSet)
 router.register(r'scheduler-events', SchedulerEventViewSet)
+router.register(r'execution-profiles', ExecutionProfileViewSet)
+router.register(r'suite-runs', SuiteRunViewSet)
 router.register(r'report-templates', ReportTemplateViewSet)
 
 # Backend report router
@@ -82,6 +84,8 @@ api_patterns = [
     path('analytics/top-contributors/', top_contributors, name='top-contributors'),
     path('report-export/', ReportExportView.as_view(), name='report-export'),
     path('report-detail/', ReportDetailView.as_view(), name='report-detail'),
+    path('execution/concurrency/', execution_concurrency, name='execution-concurrency'),
+    path('execution/fair-share/', execution_fair_share, name='execution-fair-share'),
     
     # User profile endpoint
     path('users/get_current_user/', CustomUserViewSet.as_view({'get': 'get_current_user'}), name='get_current_user'),
@@ -0,0 +1,29 @@
+"""
+Модули, которые зигота (FlowTestApp.services.zygote) импортирует один раз при запуске.
+Процессы тестов порождаются от зиготы через fork() и получают их уже загруженными.
+"""
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'FlowTest.settings')
+django.setup()
+
+from FlowTestApp import models, tasks  # noqa: E402,F401
+
+# Библиотеки кода тестов необязательны: без них зигота запускается, а тест получит ImportError сам
+try:
+    import requests  # noqa: F401
+except ImportError:
+    pass
+
+try:
+    from playwright import sync_api  # noqa: F401
+except ImportError:
+    pass
+
+try:
+    from selenium import webdriver  # noqa: F401
+    from FlowTestApp.services import test_execution_service  # noqa: F401
+except ImportError:
+    pass
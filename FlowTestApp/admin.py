@@ -10,7 +10,7 @@ from django.forms.widgets import SelectMultiple
 
 from .models import (
     CustomUser, Role, Permission, Project, TestCase, 
-    TestRun, Folder, AutomationProject, ReportTemplate
+    TestRun, Folder, AutomationProject, ReportTemplate, ExecutionProfile
 )
 
 # Unregister Django's built-in models to avoid confusion
@@ -224,12 +224,17 @@ class TestCaseAdmin(BaseModelAdmin):
 
 # Admin for TestRun
 class TestRunAdmin(BaseModelAdmin):
-    list_display = ('test_case', 'status', 'started_at', 'finished_at', 'execution_time')
-    list_filter = ('status', 'started_at')
-    search_fields = ('test_case__title', 'output')
+    list_display = ('test_case', 'status', 'execution_profile', 'started_at', 'finished_at', 'execution_time')
+    list_filter = ('status', 'execution_profile', 'started_at')
+    search_fields = ('test_case__title',)
     
     def get_queryset(self, request):
-        return super().get_queryset(request).distinct()
+        return super().get_queryset(request).defer('output').distinct()
+
+# Admin for ExecutionProfile
+class ExecutionProfileAdmin(BaseModelAdmin):
+    list_display = ('name', 'headless', 'slow_mo', 'highlight_actions', 'video')
+    search_fields = ('name', 'description')
 
 # Admin for Folder
 class FolderAdmin(BaseModelAdmin):
@@ -248,6 +253,7 @@ admin.site.register(Project, ProjectAdmin)
 admin.site.register(Folder, FolderAdmin)
 admin.site.register(TestCase, TestCaseAdmin)
 admin.site.register(TestRun, TestRunAdmin)
+admin.site.register(ExecutionProfile, ExecutionProfileAdmin)
 
 # Register other models with the base admin class for consistency
 class BaseAdmin(BaseModelAdmin):
@@ -2,6 +2,7 @@ import json
 from channels.generic.websocket import WebsocketConsumer
 from channels.db import database_sync_to_async
 from .models import TestRun, TestReport, TestEvent
+from .services.run_log import log_tail
 import logging
 from asgiref.sync import async_to_sync
 from rest_framework_simplejwt.tokens import AccessToken
@@ -97,10 +98,10 @@ class TestExecutionConsumer(WebsocketConsumer):
             test_run = TestRun.objects.get(id=self.test_run_id)
             return {
                 'status': test_run.status,
-                'started_at': test_run.created_at.isoformat() if test_run.created_at else None,
+                'started_at': test_run.started_at.isoformat() if test_run.started_at else None,
                 'finished_at': test_run.finished_at.isoformat() if test_run.finished_at else None,
-                'duration': test_run.duration,
-                'output': test_run.log_output,
+                'duration': test_run.execution_time,
+                'output': log_tail(test_run),
                 'error': test_run.error_message
             }
         except TestRun.DoesNotExist:
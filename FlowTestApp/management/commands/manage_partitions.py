@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from FlowTestApp.services.partitioning import (
+    ensure_partitions, is_partitioned, is_supported, list_partitions, partitioned_tables
+)
+from FlowTestApp.services.retention import RetentionPolicy
+
+
+class Command(BaseCommand):
+    help = 'Pre-create monthly partitions of partitioned tables and optionally apply project retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, help='Months to create ahead (default: PARTITION_MONTHS_AHEAD)')
+        parser.add_argument('--list', action='store_true', help='List existing partitions')
+        parser.add_argument(
+            '--apply-retention', action='store_true',
+            help='Archive and delete runs, events and reports older than project retention'
+        )
+        parser.add_argument('--archive-dir', help='Archive directory (default: RUN_ARCHIVE_DIR)')
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            self.stdout.write(self.style.WARNING('Partitioning requires PostgreSQL, skipping partitions'))
+        else:
+            for table in partitioned_tables():
+                if not is_partitioned(table):
+                    self.stdout.write(self.style.WARNING(f'{table} is not partitioned, run migrations first'))
+                    continue
+                for name in ensure_partitions(table, options.get('months_ahead')):
+                    self.stdout.write(f'Created partition {name}')
+                if options['list']:
+                    for name, month in list_partitions(table):
+                        self.stdout.write(f'{name}: {month:%Y-%m}' if month else f'{name}: default')
+
+        if options['apply_retention']:
+            stats = RetentionPolicy(archive_dir=options.get('archive_dir')).apply()
+            self.stdout.write(self.style.SUCCESS(
+                f"Archived {stats['test_runs']} test runs, {stats['test_events']} events and {stats['test_reports']} reports, "
+                f"dropped {stats['partitions']} partitions and {stats['output_blobs']} unused outputs"
+            ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from FlowTestApp.models import TestRun
+from FlowTestApp.services.output_store import blob_size, output_hash, store_outputs
+
+
+class Command(BaseCommand):
+    help = 'Move output stored inline in TestRun.output to deduplicated OutputBlob rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Test runs per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        moved = 0
+        last_id = 0
+        while True:
+            test_runs = list(
+                TestRun.objects.filter(id__gt=last_id, output_blob__isnull=True, output__isnull=False)
+                .exclude(output='')
+                .order_by('id')
+                .only('id', 'output')[:batch_size]
+            )
+            if not test_runs:
+                break
+            with transaction.atomic():
+                blobs = store_outputs(test_run.output for test_run in test_runs)
+                for test_run in test_runs:
+                    test_run.output_blob = blobs[output_hash(test_run.output)]
+                    test_run.output_size = blob_size(test_run.output_blob)
+                    test_run.output = None
+                TestRun.objects.bulk_update(test_runs, ['output_blob', 'output_size', 'output'])
+            moved += len(test_runs)
+            last_id = test_runs[-1].id
+            self.stdout.write(f'Moved {moved} test runs')
+
+        self.stdout.write(self.style.SUCCESS(f'Moved output of {moved} test runs'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from FlowTestApp.services.event_buffer import replay_spool
+
+
+class Command(BaseCommand):
+    help = 'Replay test events left in the local spool by crashed worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spool-dir', help='Spool directory (default: EVENT_SPOOL_DIR)')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Also replay spool files written on other hosts'
+        )
+
+    def handle(self, *args, **options):
+        replayed = replay_spool(options.get('spool_dir'), force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f'Replayed {replayed} events'))
@@ -0,0 +1,76 @@
+# Generated by Django 5.1 on 2026-10-18 18:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_default_profiles(apps, schema_editor):
+    """
+    Создаем профили debug (текущее визуальное поведение) и ci-fast
+    """
+    ExecutionProfile = apps.get_model('FlowTestApp', 'ExecutionProfile')
+    ExecutionProfile.objects.get_or_create(
+        name='debug',
+        defaults={
+            'description': 'Visible browser, slowed down actions, element highlight, video always',
+            'headless': False,
+            'slow_mo': 1000,
+            'highlight_actions': True,
+            'video': 'on',
+        }
+    )
+    ExecutionProfile.objects.get_or_create(
+        name='ci-fast',
+        defaults={
+            'description': 'Headless browser without slow_mo, video only on failure',
+            'headless': True,
+            'slow_mo': 0,
+            'highlight_actions': False,
+            'video': 'retain-on-failure',
+        }
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0036_update_permissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecutionProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.SlugField(unique=True)),
+                ('description', models.TextField(blank=True, default='')),
+                ('headless', models.BooleanField(default=True)),
+                ('slow_mo', models.PositiveIntegerField(default=0, help_text='Замедление действий браузера в миллисекундах')),
+                ('highlight_actions', models.BooleanField(default=False, help_text='Подсвечивать элементы перед кликом')),
+                ('video', models.CharField(choices=[('on', 'Always'), ('retain-on-failure', 'Only on failure'), ('off', 'Off')], default='retain-on-failure', max_length=20)),
+                ('viewport_width', models.PositiveIntegerField(default=1280)),
+                ('viewport_height', models.PositiveIntegerField(default=720)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='schedulerevent',
+            name='execution_profile',
+            field=models.ForeignKey(blank=True, help_text='Профиль выполнения; по умолчанию ci-fast', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scheduler_events', to='FlowTestApp.executionprofile'),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='execution_profile',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='test_runs', to='FlowTestApp.executionprofile'),
+        ),
+        migrations.AddField(
+            model_name='testschedule',
+            name='execution_profile',
+            field=models.ForeignKey(blank=True, help_text='Профиль выполнения; по умолчанию ci-fast', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='schedules', to='FlowTestApp.executionprofile'),
+        ),
+        migrations.RunPython(create_default_profiles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-18 18:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0037_executionprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestRunLogChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveIntegerField()),
+                ('stream', models.CharField(choices=[('stdout', 'stdout'), ('stderr', 'stderr')], default='stdout', max_length=10)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('test_run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_chunks', to='FlowTestApp.testrun')),
+            ],
+            options={
+                'ordering': ['test_run', 'seq'],
+                'unique_together': {('test_run', 'seq')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 18:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0038_testrunlogchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='automationproject',
+            name='shard_count',
+            field=models.PositiveIntegerField(blank=True, help_text='Количество параллельных процессов pytest; по умолчанию число ядер', null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1 on 2026-10-18 18:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0039_automationproject_shard_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SuiteRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('passed', 'Passed'), ('failed', 'Failed'), ('error', 'Error')], default='pending', max_length=20)),
+                ('task_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('total_shards', models.PositiveIntegerField(default=0)),
+                ('completed_shards', models.PositiveIntegerField(default=0)),
+                ('shards', models.JSONField(blank=True, default=list)),
+                ('output', models.TextField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('automation_project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='suite_runs', to='FlowTestApp.automationproject')),
+                ('execution_profile', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='suite_runs', to='FlowTestApp.executionprofile')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='suite_runs', to='FlowTestApp.project')),
+                ('schedule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='suite_runs', to='FlowTestApp.testschedule')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
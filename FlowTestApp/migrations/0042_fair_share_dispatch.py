@@ -0,0 +1,44 @@
+# Generated by Django 5.1 on 2026-10-18 18:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0041_testrun_cancellation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='max_concurrent_runs',
+            field=models.PositiveIntegerField(blank=True, help_text='Максимум одновременно выполняемых задач проекта; по умолчанию FAIR_SHARE_DEFAULT_QUOTA', null=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='scheduling_weight',
+            field=models.PositiveIntegerField(default=1, help_text='Вес проекта при распределении слотов воркеров'),
+        ),
+        migrations.CreateModel(
+            name='DispatchQueueItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_name', models.CharField(max_length=255)),
+                ('args', models.JSONField(blank=True, default=list)),
+                ('kwargs', models.JSONField(blank=True, default=dict)),
+                ('task_id', models.CharField(max_length=255, unique=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('dispatched', 'Dispatched'), ('finished', 'Finished'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], default='queued', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('automation_project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dispatch_items', to='FlowTestApp.automationproject')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dispatch_items', to='FlowTestApp.project')),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'project'], name='dispatch_status_project_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0042_fair_share_dispatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='automationproject',
+            name='last_commit_sha',
+            field=models.CharField(blank=True, help_text='Коммит рабочей копии после последней синхронизации', max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1 on 2026-10-18 18:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0043_automationproject_last_commit_sha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='automationproject',
+            name='result_cache_enabled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='automationproject',
+            name='result_cache_max_age',
+            field=models.PositiveIntegerField(blank=True, help_text='Максимальный возраст исходного запуска в часах; по умолчанию RESULT_CACHE_MAX_AGE_HOURS', null=True),
+        ),
+        migrations.AddField(
+            model_name='automationproject',
+            name='result_cache_ttl',
+            field=models.PositiveIntegerField(blank=True, help_text='Время жизни записи кэша в часах, продлевается при попадании; по умолчанию RESULT_CACHE_TTL_HOURS', null=True),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='cached_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cache_hits', to='FlowTestApp.testrun'),
+        ),
+        migrations.CreateModel(
+            name='ResultCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('commit_sha', models.CharField(blank=True, max_length=40, null=True)),
+                ('recorded_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+                ('automation_project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='result_cache_entries', to='FlowTestApp.automationproject')),
+                ('automation_test', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='result_cache_entries', to='FlowTestApp.automationtest')),
+                ('execution_profile', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='FlowTestApp.executionprofile')),
+                ('test_case', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='result_cache_entries', to='FlowTestApp.testcase')),
+                ('test_run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='result_cache_entries', to='FlowTestApp.testrun')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='result_cache_expires_idx')],
+            },
+        ),
+    ]
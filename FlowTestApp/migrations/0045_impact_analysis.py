@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0044_result_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='automationproject',
+            name='changed_files',
+            field=models.JSONField(blank=True, help_text='Файлы, измененные между previous_commit_sha и last_commit_sha; null - неизвестно', null=True),
+        ),
+        migrations.AddField(
+            model_name='automationproject',
+            name='previous_commit_sha',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='testschedule',
+            name='only_affected',
+            field=models.BooleanField(default=False, help_text='Запускать только тесты, затронутые изменениями последней синхронизации'),
+        ),
+    ]
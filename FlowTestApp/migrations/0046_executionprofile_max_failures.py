@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0045_impact_analysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='executionprofile',
+            name='max_failures',
+            field=models.PositiveIntegerField(default=0, help_text='Fail-fast: после стольких падений оставшиеся тесты набора не выполняются; 0 - выключено'),
+        ),
+    ]
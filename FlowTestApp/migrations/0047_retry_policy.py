@@ -0,0 +1,44 @@
+# Generated by Django 5.1 on 2026-10-18 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0046_executionprofile_max_failures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='executionprofile',
+            name='max_retries',
+            field=models.PositiveIntegerField(default=0, help_text='Сколько раз перезапускать упавшие тесты набора; 0 - без перезапусков'),
+        ),
+        migrations.AddField(
+            model_name='executionprofile',
+            name='retry_budget_percent',
+            field=models.PositiveIntegerField(default=10, help_text='Бюджет перезапусков в процентах от времени выполнения набора'),
+        ),
+        migrations.AddField(
+            model_name='suiterun',
+            name='retry_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reruns', to='FlowTestApp.suiterun'),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='attempt',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='retry_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='retries', to='FlowTestApp.testrun'),
+        ),
+        migrations.AlterField(
+            model_name='testrun',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('passed', 'Passed'), ('failed', 'Failed'), ('error', 'Error'), ('skipped', 'Skipped'), ('cancelled', 'Cancelled'), ('flaky', 'Flaky')], max_length=20),
+        ),
+    ]
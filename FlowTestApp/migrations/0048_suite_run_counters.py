@@ -0,0 +1,49 @@
+# Generated by Django 5.1 on 2026-10-18 18:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0047_retry_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='suiterun',
+            name='completed_tests',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='suiterun',
+            name='failed_tests',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='suiterun',
+            name='flaky_tests',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='suiterun',
+            name='passed_tests',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='suiterun',
+            name='skipped_tests',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='suiterun',
+            name='total_tests',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='suite_run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='test_runs', to='FlowTestApp.suiterun'),
+        ),
+    ]
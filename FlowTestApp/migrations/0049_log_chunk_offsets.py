@@ -0,0 +1,48 @@
+# Generated by Django 5.1 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+def fill_offsets(apps, schema_editor):
+    """Смещения уже записанных порций: сумма размеров предыдущих порций прогона"""
+    TestRunLogChunk = apps.get_model('FlowTestApp', 'TestRunLogChunk')
+    batch = []
+    test_run_id = None
+    offset = 0
+    for chunk in TestRunLogChunk.objects.order_by('test_run_id', 'seq').only('id', 'test_run_id', 'size').iterator():
+        if chunk.test_run_id != test_run_id:
+            test_run_id = chunk.test_run_id
+            offset = 0
+        chunk.offset = offset
+        offset += chunk.size
+        batch.append(chunk)
+        if len(batch) >= 1000:
+            TestRunLogChunk.objects.bulk_update(batch, ['offset'])
+            batch = []
+    if batch:
+        TestRunLogChunk.objects.bulk_update(batch, ['offset'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0048_suite_run_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testrunlogchunk',
+            name='compressed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='testrunlogchunk',
+            name='offset',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='testrunlogchunk',
+            index=models.Index(fields=['test_run', 'offset'], name='FlowTestApp_test_ru_8aa00f_idx'),
+        ),
+        migrations.RunPython(fill_offsets, migrations.RunPython.noop),
+    ]
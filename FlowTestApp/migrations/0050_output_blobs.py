@@ -0,0 +1,45 @@
+# Generated by Django 5.1 on 2026-10-18 18:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0049_log_chunk_offsets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutputBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64, unique=True)),
+                ('codec', models.CharField(choices=[('zstd', 'zstd'), ('zlib', 'zlib')], max_length=10)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='testreport',
+            name='actual_result_size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='output_size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='testreport',
+            name='actual_result_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='FlowTestApp.outputblob'),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='output_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='FlowTestApp.outputblob'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1 on 2026-10-18 19:01
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+# Сколько запусков заполняется одной транзакцией
+BACKFILL_BATCH_SIZE = 10000
+
+
+def fill_project(apps, schema_editor):
+    """
+    Проект существующих запусков по тест-кейсу. Запуски обновляются диапазонами id
+    в отдельных транзакциях, чтобы не держать блокировку всей таблицы
+    """
+    TestRun = apps.get_model('FlowTestApp', 'TestRun')
+    TestCase = apps.get_model('FlowTestApp', 'TestCase')
+    project = Subquery(TestCase.objects.filter(id=OuterRef('test_case_id')).values('project_id')[:1])
+    last_id = TestRun.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    for start in range(0, last_id + 1, BACKFILL_BATCH_SIZE):
+        with transaction.atomic():
+            TestRun.objects.filter(
+                id__gte=start,
+                id__lt=start + BACKFILL_BATCH_SIZE,
+                project__isnull=True,
+                test_case__isnull=False
+            ).update(project_id=project)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('FlowTestApp', '0050_output_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testrun',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='test_runs', to='FlowTestApp.project'),
+        ),
+        migrations.RunPython(fill_project, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='testrun',
+            index=models.Index(fields=['project', 'started_at'], name='FlowTestApp_project_6bcade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testrun',
+            index=models.Index(fields=['project', 'status', 'started_at'], name='FlowTestApp_project_f15afb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testrun',
+            index=models.Index(fields=['test_case', 'started_at'], name='FlowTestApp_test_ca_4f42cc_idx'),
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 5.1 on 2026-10-18 19:03
+
+from datetime import datetime, time, timedelta, timezone
+
+from django.db import migrations, models
+
+# На сколько месяцев вперед создаются секции при переходе (дальше - команда manage_partitions)
+MONTHS_AHEAD = 3
+
+
+def _next_month(value):
+    return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _bound(month):
+    return datetime.combine(month, time.min, tzinfo=timezone.utc)
+
+
+def partition_test_events(apps, schema_editor):
+    """
+    Переводит таблицу TestEvent на помесячное секционирование по timestamp (только PostgreSQL).
+
+    Таблица переименовывается, создается секционированная таблица той же структуры
+    с первичным ключом (id, timestamp) - ключ секционирования должен входить в него,
+    секции создаются от месяца самого старого события, данные копируются, затем
+    на новой таблице восстанавливаются индексы и внешние ключи старой.
+    На TestEvent не ссылаются внешние ключи, поэтому составной ключ ничего не ломает.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    TestEvent = apps.get_model('FlowTestApp', 'TestEvent')
+    table = TestEvent._meta.db_table
+    legacy = f'{table}_legacy'
+    sequence = f'{table}_id_seq'
+    quote = schema_editor.quote_name
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [table]
+        )
+        if cursor.fetchone():
+            return
+
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}')
+        cursor.execute(
+            "SELECT is_identity FROM information_schema.columns WHERE table_name = %s AND column_name = 'id'",
+            [legacy]
+        )
+        # До PostgreSQL 17 секционированная таблица не может иметь identity-колонку: id берется из последовательности
+        if cursor.fetchone()[0] == 'YES':
+            cursor.execute(f'ALTER TABLE {quote(legacy)} ALTER COLUMN "id" DROP IDENTITY')
+        else:
+            cursor.execute(f'ALTER TABLE {quote(legacy)} ALTER COLUMN "id" DROP DEFAULT')
+            cursor.execute(f'DROP SEQUENCE IF EXISTS {quote(sequence)}')
+
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT LIKE %s",
+            [legacy, '%_pkey']
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [quote(legacy)]
+        )
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(legacy)} INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")'
+        )
+        cursor.execute(f'CREATE SEQUENCE {quote(sequence)} AS bigint OWNED BY {quote(table)}."id"')
+        cursor.execute(f'SELECT setval(%s, COALESCE((SELECT MAX("id") FROM {quote(legacy)}), 0) + 1, false)', [quote(sequence)])
+        cursor.execute(f'ALTER TABLE {quote(table)} ALTER COLUMN "id" SET DEFAULT nextval(%s)', [quote(sequence)])
+
+        cursor.execute(f'SELECT MIN("timestamp") FROM {quote(legacy)}')
+        oldest = cursor.fetchone()[0]
+        today = datetime.now(timezone.utc).date()
+        month = (oldest.astimezone(timezone.utc).date() if oldest else today).replace(day=1)
+        last = today.replace(day=1)
+        for _ in range(MONTHS_AHEAD):
+            last = _next_month(last)
+        while month <= last:
+            cursor.execute(
+                f'CREATE TABLE {quote(f"{table}_p{month:%Y%m}")} PARTITION OF {quote(table)} FOR VALUES FROM (%s) TO (%s)',
+                [_bound(month), _bound(_next_month(month))]
+            )
+            month = _next_month(month)
+        cursor.execute(f'CREATE TABLE {quote(f"{table}_default")} PARTITION OF {quote(table)} DEFAULT')
+
+        cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(legacy)}')
+        cursor.execute(f'DROP TABLE {quote(legacy)}')
+
+        # Ключ и индексы создаются после удаления старой таблицы, у которой те же имена;
+        # на секционированной таблице они создаются во всех секциях
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY ("id", "timestamp")')
+        for name, definition in indexes:
+            cursor.execute(definition.replace(quote(legacy), quote(table)))
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0051_test_run_project'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='retention_days',
+            field=models.PositiveIntegerField(blank=True, help_text='Сколько дней хранить запуски и события проекта; по умолчанию RUN_RETENTION_DAYS', null=True),
+        ),
+        migrations.RunPython(partition_test_events, migrations.RunPython.noop),
+    ]
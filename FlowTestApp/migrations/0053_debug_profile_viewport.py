@@ -0,0 +1,26 @@
+# Generated by Django 5.1 on 2026-10-18 19:20
+
+from django.db import migrations
+
+
+def update_debug_profile(apps, schema_editor):
+    """
+    Профиль debug повторяет прежнее визуальное поведение: окно 1920x1080.
+    Профиль, размер окна которого уже меняли, не трогаем
+    """
+    ExecutionProfile = apps.get_model('FlowTestApp', 'ExecutionProfile')
+    ExecutionProfile.objects.filter(name='debug', viewport_width=1280, viewport_height=720).update(
+        viewport_width=1920,
+        viewport_height=1080
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0052_partition_test_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(update_debug_profile, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0053_debug_profile_viewport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='suiterun',
+            name='commit_sha',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-18 19:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0054_suiterun_commit_sha'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='testevent',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FlowTestApp', '0055_testevent_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='automationproject',
+            name='last_affected_commit_sha',
+            field=models.CharField(blank=True, help_text='Коммит, проверенный последним запуском затронутых тестов', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='testschedule',
+            name='last_affected_commit_sha',
+            field=models.CharField(blank=True, help_text='Коммит, проверенный последним прогоном затронутых тестов', max_length=40, null=True),
+        ),
+        migrations.AlterField(
+            model_name='testschedule',
+            name='only_affected',
+            field=models.BooleanField(default=False, help_text='Запускать только тесты, затронутые изменениями с последнего прогона расписания'),
+        ),
+    ]
@@ -12,8 +12,10 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 import threading
 from playwright.sync_api import sync_playwright
+import importlib.util
 import logging
 import os
+import zlib
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +27,22 @@ class Project(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=50, choices=[('active', 'Active'), ('archived', 'Archived')], blank=True, null=True, default='active')
     members = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='projects', blank=True)
+    # Доля общего пула воркеров при справедливом распределении запусков (см. FairShareDispatcher)
+    max_concurrent_runs = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Максимум одновременно выполняемых задач проекта; по умолчанию FAIR_SHARE_DEFAULT_QUOTA'
+    )
+    scheduling_weight = models.PositiveIntegerField(
+        default=1,
+        help_text='Вес проекта при распределении слотов воркеров'
+    )
+    # Срок хранения истории запусков (см. services.retention)
+    retention_days = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Сколько дней хранить запуски и события проекта; по умолчанию RUN_RETENTION_DAYS'
+    )
 
     def __str__(self):
         return self.name
@@ -97,31 +115,235 @@ class TestCase(models.Model):
     class Meta:
         ordering = ['title']
 
+class ExecutionProfile(models.Model):
+    """
+    Профиль выполнения автотестов: режим браузера, замедление, подсветка и запись видео
+    """
+    DEBUG = 'debug'
+    CI_FAST = 'ci-fast'
+
+    VIDEO_CHOICES = [
+        ('on', 'Always'),
+        ('retain-on-failure', 'Only on failure'),
+        ('off', 'Off'),
+    ]
+
+    name = models.SlugField(max_length=50, unique=True)
+    description = models.TextField(blank=True, default='')
+    headless = models.BooleanField(default=True)
+    slow_mo = models.PositiveIntegerField(default=0, help_text='Замедление действий браузера в миллисекундах')
+    highlight_actions = models.BooleanField(default=False, help_text='Подсвечивать элементы перед кликом')
+    video = models.CharField(max_length=20, choices=VIDEO_CHOICES, default='retain-on-failure')
+    viewport_width = models.PositiveIntegerField(default=1280)
+    viewport_height = models.PositiveIntegerField(default=720)
+    max_failures = models.PositiveIntegerField(
+        default=0,
+        help_text='Fail-fast: после стольких падений оставшиеся тесты набора не выполняются; 0 - выключено'
+    )
+    max_retries = models.PositiveIntegerField(
+        default=0,
+        help_text='Сколько раз перезапускать упавшие тесты набора; 0 - без перезапусков'
+    )
+    retry_budget_percent = models.PositiveIntegerField(
+        default=10,
+        help_text='Бюджет перезапусков в процентах от времени выполнения набора'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+
+    @classmethod
+    def get_default(cls, scheduled=False):
+        """
+        Возвращает профиль по умолчанию: ci-fast для запусков по расписанию,
+        debug для интерактивных запусков
+        """
+        name = cls.CI_FAST if scheduled else cls.DEBUG
+        defaults = {
+            cls.DEBUG: {
+                'description': 'Visible browser, slowed down actions, element highlight, video always',
+                'headless': False,
+                'slow_mo': 1000,
+                'highlight_actions': True,
+                'video': 'on',
+                'viewport_width': 1920,
+                'viewport_height': 1080,
+            },
+            cls.CI_FAST: {
+                'description': 'Headless browser without slow_mo, video only on failure',
+                'headless': True,
+                'slow_mo': 0,
+                'highlight_actions': False,
+                'video': 'retain-on-failure',
+            },
+        }[name]
+        profile, _ = cls.objects.get_or_create(name=name, defaults=defaults)
+        return profile
+
+    def launch_options(self) -> dict:
+        """Параметры для chromium.launch()"""
+        options = {'headless': self.headless}
+        if not self.headless:
+            # Видимый браузер открывается на весь экран
+            options['args'] = ['--start-maximized']
+        if self.slow_mo:
+            options['slow_mo'] = self.slow_mo
+        return options
+
+    def context_options(self, video_dir=None) -> dict:
+        """Параметры для browser.new_context()"""
+        options = {'viewport': {'width': self.viewport_width, 'height': self.viewport_height}}
+        if video_dir and self.video != 'off':
+            options['record_video_dir'] = video_dir
+        return options
+
+    def pytest_args(self, check_plugin=False) -> list:
+        """
+        Аргументы командной строки для плагина pytest-playwright.
+        :param check_plugin: Вернуть пустой список, если плагин не установлен
+        """
+        if check_plugin and importlib.util.find_spec('pytest_playwright') is None:
+            return []
+        args = [] if self.headless else ['--headed']
+        if self.slow_mo:
+            args.extend(['--slowmo', str(self.slow_mo)])
+        args.append(f'--video={self.video}')
+        return args
+
+    def fail_fast_args(self) -> list:
+        """Аргументы pytest, прерывающие сессию после max_failures падений"""
+        return [f'--maxfail={self.max_failures}'] if self.max_failures else []
+
+    def environment(self) -> dict:
+        """Переменные окружения, по которым тесты из репозитория могут узнать профиль"""
+        return {
+            'FLOWTEST_EXECUTION_PROFILE': self.name,
+            'FLOWTEST_HEADLESS': '1' if self.headless else '0',
+            'FLOWTEST_SLOW_MO': str(self.slow_mo),
+            'FLOWTEST_VIDEO': self.video,
+        }
+
+class OutputBlob(models.Model):
+    """
+    Вывод теста, сохраненный один раз: одинаковый вывод разных запусков, отчетов
+    и событий хранится одной записью по sha256 содержимого (services.output_store)
+    """
+    hash = models.CharField(max_length=64, unique=True)
+    codec = models.CharField(max_length=10, choices=[
+        ('zstd', 'zstd'),
+        ('zlib', 'zlib')
+    ])
+    data = models.BinaryField()
+    size = models.PositiveBigIntegerField(default=0)  # в байтах, без сжатия
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.size} bytes)"
+
+    @property
+    def text(self) -> str:
+        from .services.output_store import decompress
+        return decompress(self.codec, bytes(self.data)).decode('utf-8', errors='replace')
+
 class TestRun(models.Model):
     test_case = models.ForeignKey(TestCase, on_delete=models.CASCADE, null=True)
+    # Проект тест-кейса, копируется при сохранении: аналитика фильтрует запуски без join с TestCase
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True, blank=True, related_name='test_runs')
     status = models.CharField(max_length=20, choices=[
         ('pending', 'Pending'),
         ('running', 'Running'),
         ('passed', 'Passed'),
         ('failed', 'Failed'),
         ('error', 'Error'),
-        ('skipped', 'Skipped')
+        ('skipped', 'Skipped'),
+        ('cancelled', 'Cancelled'),
+        ('flaky', 'Flaky')
     ])
     started_at = models.DateTimeField(null=True)
     finished_at = models.DateTimeField(null=True)
     execution_time = models.FloatField(null=True)  # в секундах
     error_message = models.TextField(null=True, blank=True)
+    # Вывод старых запусков; новые хранят его в output_blob
     output = models.TextField(null=True, blank=True)
+    output_blob = models.ForeignKey(OutputBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    output_size = models.PositiveBigIntegerField(default=0)  # в байтах
     executor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    execution_profile = models.ForeignKey(ExecutionProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='test_runs')
+    # Задача Celery, которая выполняет запуск; нужна для отмены еще не начатых запусков
+    celery_task_id = models.CharField(max_length=255, null=True, blank=True)
+    # Результат взят из кэша результатов: тест не выполнялся, статус скопирован с этого запуска
+    cached_from = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='cache_hits')
+    # Повторная попытка упавшего запуска: ссылка на первую попытку и номер попытки
+    retry_of = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='retries')
+    attempt = models.PositiveIntegerField(default=1)
+    # Пакетный прогон, в который входит запуск
+    suite_run = models.ForeignKey('SuiteRun', on_delete=models.SET_NULL, null=True, blank=True, related_name='test_runs')
 
     def __str__(self):
         return f"{self.test_case} - {self.status}"
 
+    @property
+    def output_text(self):
+        """Вывод запуска; blob загружается отдельным запросом только при обращении"""
+        return self.output_blob.text if self.output_blob_id else self.output
+
     def save(self, *args, **kwargs):
+        if self.project_id is None and self.test_case_id is not None:
+            self.project_id = self.test_case.project_id
         if self.started_at and self.finished_at and not self.execution_time:
             self.execution_time = (self.finished_at - self.started_at).total_seconds()
         super().save(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'started_at']),
+            models.Index(fields=['project', 'status', 'started_at']),
+            models.Index(fields=['test_case', 'started_at']),
+        ]
+
+class TestRunLogChunk(models.Model):
+    """
+    Порция вывода прогона. Записи только добавляются, порядок задается seq.
+    После завершения прогона порции объединяются и сжимаются (services.run_log.compact_log)
+    """
+    test_run = models.ForeignKey(TestRun, on_delete=models.CASCADE, related_name='log_chunks')
+    seq = models.PositiveIntegerField()
+    stream = models.CharField(max_length=10, choices=[
+        ('stdout', 'stdout'),
+        ('stderr', 'stderr')
+    ], default='stdout')
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(default=0)  # в байтах, без сжатия
+    # Смещение начала порции в выводе прогона (в байтах), по нему читается хвост лога
+    offset = models.PositiveBigIntegerField(default=0)
+    # data сжата zlib
+    compressed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.test_run_id} #{self.seq} ({self.stream})"
+
+    @property
+    def content(self) -> bytes:
+        data = bytes(self.data)
+        return zlib.decompress(data) if self.compressed else data
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    class Meta:
+        ordering = ['test_run', 'seq']
+        unique_together = [['test_run', 'seq']]
+        indexes = [
+            models.Index(fields=['test_run', 'offset']),
+        ]
+
 class Permission(models.Model):
     """
     Модель для хранения прав доступа
@@ -236,6 +458,14 @@ class SchedulerEvent(models.Model):
         blank=True,
         help_text='Configuration for test execution: {"run_all_project_tests": true} or {"folder_id": 123} or {"test_cases": [1, 2, 3]}'
     )
+    execution_profile = models.ForeignKey(
+        ExecutionProfile,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='scheduler_events',
+        help_text='Профиль выполнения; по умолчанию ci-fast'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     last_run = models.DateTimeField(null=True, blank=True)
@@ -276,6 +506,9 @@ class TestReport(models.Model):
     execution_date = models.DateTimeField(auto_now_add=True)
     execution_time = models.DurationField(null=True, blank=True)
     actual_result = models.TextField(blank=True, null=True)
+    # Вывод автоматического запуска в качестве фактического результата
+    actual_result_blob = models.ForeignKey(OutputBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    actual_result_size = models.PositiveBigIntegerField(default=0)  # в байтах
     comments = models.TextField(blank=True, null=True)
     attachments = models.FileField(upload_to='test_reports/', null=True, blank=True)
     environment = models.CharField(max_length=255, blank=True, null=True)
@@ -284,6 +517,10 @@ class TestReport(models.Model):
     def __str__(self):
         return f"Report for {self.test_case.title} - {self.status} ({self.execution_date})"
 
+    @property
+    def actual_result_text(self):
+        return self.actual_result_blob.text if self.actual_result_blob_id else self.actual_result
+
     class Meta:
         ordering = ['-execution_date']
 
@@ -301,7 +538,7 @@ class TestEvent(models.Model):
             ('finish', 'Test Finished')
         ]
     )
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     description = models.TextField()
     details = models.JSONField(null=True, blank=True)  # Для хранения дополнительной информации в формате JSON
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='created_events')
@@ -378,6 +615,29 @@ class AutomationProject(models.Model):
         ('not_synced', 'Not Synced'),
         ('error', 'Error')
     ])
+    shard_count = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Количество параллельных процессов pytest; по умолчанию число ядер'
+    )
+    last_commit_sha = models.CharField(max_length=40, null=True, blank=True, help_text='Коммит рабочей копии после последней синхронизации')
+    # Изменения последней синхронизации, которая сменила коммит: по ним выбираются затронутые тесты
+    previous_commit_sha = models.CharField(max_length=40, null=True, blank=True)
+    changed_files = models.JSONField(null=True, blank=True, help_text='Файлы, измененные между previous_commit_sha и last_commit_sha; null - неизвестно')
+    # Затронутые тесты, запущенные через API, выбираются по изменениям с этого коммита
+    last_affected_commit_sha = models.CharField(max_length=40, null=True, blank=True, help_text='Коммит, проверенный последним запуском затронутых тестов')
+    # Кэш результатов: запуски по расписанию пропускают тесты, не изменившиеся с последнего успешного прогона
+    result_cache_enabled = models.BooleanField(default=False)
+    result_cache_ttl = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Время жизни записи кэша в часах, продлевается при попадании; по умолчанию RESULT_CACHE_TTL_HOURS'
+    )
+    result_cache_max_age = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Максимальный возраст исходного запуска в часах; по умолчанию RESULT_CACHE_MAX_AGE_HOURS'
+    )
 
     def __str__(self):
         return f"{self.name} ({self.project.name})"
@@ -423,6 +683,8 @@ class TestSchedule(models.Model):
     tests = models.ManyToManyField(AutomationTest, blank=True)
     schedule_time = models.TimeField()
     is_active = models.BooleanField(default=True)
+    only_affected = models.BooleanField(default=False, help_text='Запускать только тесты, затронутые изменениями с последнего прогона расписания')
+    last_affected_commit_sha = models.CharField(max_length=40, null=True, blank=True, help_text='Коммит, проверенный последним прогоном затронутых тестов')
     last_run = models.DateTimeField(null=True, blank=True)
     last_status = models.CharField(max_length=20, choices=[
         ('success', 'Success'),
@@ -430,12 +692,138 @@ class TestSchedule(models.Model):
         ('pending', 'Pending')
     ], default='pending')
     last_result = models.TextField(blank=True)
+    execution_profile = models.ForeignKey(
+        ExecutionProfile,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='schedules',
+        help_text='Профиль выполнения; по умолчанию ci-fast'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Schedule for {self.project.name} at {self.schedule_time}"
 
+class SuiteRun(models.Model):
+    """
+    Родительская запись пакетного прогона. Распределенный прогон разбит на шарды,
+    которые выполняются отдельными задачами Celery на разных воркерах; прогон
+    BatchTestRunner связан со своими TestRun через TestRun.suite_run.
+    Счетчики результатов обновляются по мере выполнения тестов.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('passed', 'Passed'),
+        ('failed', 'Failed'),
+        ('error', 'Error'),
+        ('cancelled', 'Cancelled')
+    ]
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='suite_runs', null=True, blank=True)
+    automation_project = models.ForeignKey(AutomationProject, on_delete=models.CASCADE, related_name='suite_runs', null=True, blank=True)
+    schedule = models.ForeignKey(TestSchedule, on_delete=models.SET_NULL, related_name='suite_runs', null=True, blank=True)
+    execution_profile = models.ForeignKey(ExecutionProfile, on_delete=models.SET_NULL, related_name='suite_runs', null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    task_id = models.CharField(max_length=255, null=True, blank=True)
+    total_shards = models.PositiveIntegerField(default=0)
+    completed_shards = models.PositiveIntegerField(default=0)
+    # [{"index": 0, "test_ids": [...], "status": "pending", "worker": null, "attempts": 0, ...}]
+    shards = models.JSONField(default=list, blank=True)
+    # Прогон, упавшие тесты которого перезапущены этим прогоном
+    retry_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='reruns')
+    # Коммит репозитория, на котором выполняются шарды распределенного прогона
+    commit_sha = models.CharField(max_length=40, null=True, blank=True)
+    total_tests = models.PositiveIntegerField(default=0)
+    completed_tests = models.PositiveIntegerField(default=0)
+    passed_tests = models.PositiveIntegerField(default=0)
+    # Упавшие и завершившиеся ошибкой
+    failed_tests = models.PositiveIntegerField(default=0)
+    # Пропущенные и отмененные
+    skipped_tests = models.PositiveIntegerField(default=0)
+    # Прошедшие только при перезапуске
+    flaky_tests = models.PositiveIntegerField(default=0)
+    output = models.TextField(null=True, blank=True)
+    error_message = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Suite run #{self.id} - {self.status}"
+
+    @property
+    def progress(self):
+        if self.total_shards:
+            return round(self.completed_shards / self.total_shards * 100, 1)
+        if self.total_tests:
+            return round(self.completed_tests / self.total_tests * 100, 1)
+        return 0.0
+
+    class Meta:
+        ordering = ['-created_at']
+
+class ResultCacheEntry(models.Model):
+    """
+    Успешный результат теста для неизменного содержимого: ключ - хэш кода теста,
+    коммита репозитория и профиля выполнения (см. ResultCache)
+    """
+    key = models.CharField(max_length=64, unique=True)
+    automation_project = models.ForeignKey(AutomationProject, on_delete=models.CASCADE, related_name='result_cache_entries')
+    test_case = models.ForeignKey(TestCase, on_delete=models.CASCADE, related_name='result_cache_entries', null=True, blank=True)
+    automation_test = models.ForeignKey(AutomationTest, on_delete=models.CASCADE, related_name='result_cache_entries', null=True, blank=True)
+    # Запуск, результат которого переиспользуется
+    test_run = models.ForeignKey(TestRun, on_delete=models.SET_NULL, related_name='result_cache_entries', null=True, blank=True)
+    commit_sha = models.CharField(max_length=40, null=True, blank=True)
+    execution_profile = models.ForeignKey(ExecutionProfile, on_delete=models.SET_NULL, null=True, blank=True)
+    recorded_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    hits = models.PositiveIntegerField(default=0)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} ({self.automation_project_id})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='result_cache_expires_idx'),
+        ]
+
+class DispatchQueueItem(models.Model):
+    """
+    Задача Celery, ожидающая слот воркера в очереди справедливого распределения.
+    Пока задача в статусе dispatched, она занимает слот своего проекта.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('dispatched', 'Dispatched'),
+        ('finished', 'Finished'),
+        ('cancelled', 'Cancelled'),
+        ('expired', 'Expired')
+    ]
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='dispatch_items', null=True, blank=True)
+    automation_project = models.ForeignKey(AutomationProject, on_delete=models.CASCADE, related_name='dispatch_items', null=True, blank=True)
+    task_name = models.CharField(max_length=255)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    task_id = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.task_name} [{self.task_id}] - {self.status}"
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'project'], name='dispatch_status_project_idx'),
+        ]
+
 class CustomChart(models.Model):
     CHART_TYPES = [
         ('line', 'Line Chart'),
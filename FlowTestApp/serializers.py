@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Project, Folder, TestCase, TestRun, SchedulerEvent, CustomUser, Role, Permission, AutomationProject, AutomationTest, TestSchedule, ReportTemplate, CustomChart
+from .services.code_cache import compile_test_code, describe_syntax_error
+from .services.output_store import blob_size, store_output
+from .models import Project, Folder, TestCase, TestRun, SchedulerEvent, CustomUser, Role, Permission, AutomationProject, AutomationTest, TestSchedule, ReportTemplate, CustomChart, ExecutionProfile, SuiteRun
 
 
 class ProjectSerializer(serializers.ModelSerializer):
@@ -23,6 +25,15 @@ class TestCaseSerializer(serializers.ModelSerializer):
             'steps': {'required': False}
         }
 
+    def validate_test_code(self, value):
+        # Код компилируется при сохранении и попадает в кэш кода тестов
+        if value:
+            try:
+                compile_test_code(value)
+            except (SyntaxError, ValueError) as e:
+                raise serializers.ValidationError(f'Syntax error: {describe_syntax_error(e)}')
+        return value
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         if representation['tags'] is None:
@@ -33,9 +44,52 @@ class TestCaseSerializer(serializers.ModelSerializer):
 
 
 class TestRunSerializer(serializers.ModelSerializer):
+    # Вывод загружается из OutputBlob только для одного запуска, в списках его нет
+    output = serializers.CharField(source='output_text', required=False, allow_blank=True, allow_null=True)
+
     class Meta:
         model = TestRun
         fields = '__all__'
+        read_only_fields = ['output_blob', 'output_size']
+
+    def _store_output(self, validated_data):
+        """Переданный вывод сохраняется в OutputBlob, как у запусков из раннеров"""
+        if 'output_text' in validated_data:
+            blob = store_output(validated_data.pop('output_text'))
+            validated_data.update(output=None, output_blob=blob, output_size=blob_size(blob))
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self._store_output(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self._store_output(validated_data))
+
+
+class TestRunListSerializer(serializers.ModelSerializer):
+    """Запуск в списке: вместо вывода - ссылка на него и размер"""
+
+    class Meta:
+        model = TestRun
+        exclude = ['output']
+
+
+class ExecutionProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExecutionProfile
+        fields = '__all__'
+        read_only_fields = ['created_at', 'updated_at']
+
+
+class SuiteRunSerializer(serializers.ModelSerializer):
+    progress = serializers.ReadOnlyField()
+
+    class Meta:
+        model = SuiteRun
+        fields = '__all__'
+        read_only_fields = ['status', 'task_id', 'total_shards', 'completed_shards', 'shards', 'output',
+                            'error_message', 'created_at', 'started_at', 'finished_at', 'total_tests',
+                            'completed_tests', 'passed_tests', 'failed_tests', 'skipped_tests', 'flaky_tests']
 
 
 class SchedulerEventSerializer(serializers.ModelSerializer):
@@ -148,8 +202,11 @@ class AutomationProjectSerializer(serializers.ModelSerializer):
         model = AutomationProject
         fields = ['id', 'project', 'name', 'repository_url', 'repository_type',
                  'branch', 'framework', 'tests_directory', 'access_token', 
-                 'username', 'last_sync', 'sync_status']
-        read_only_fields = ['last_sync', 'sync_status']
+                 'username', 'last_sync', 'sync_status', 'shard_count', 'last_commit_sha',
+                 'result_cache_enabled', 'result_cache_ttl', 'result_cache_max_age',
+                 'previous_commit_sha', 'changed_files', 'last_affected_commit_sha']
+        read_only_fields = ['last_sync', 'sync_status', 'last_commit_sha', 'previous_commit_sha', 'changed_files',
+                            'last_affected_commit_sha']
         extra_kwargs = {
             'access_token': {'write_only': True},  # Токен не будет возвращаться в ответах API
             'username': {'write_only': True},  # Имя пользователя тоже скрываем
@@ -168,7 +225,7 @@ class TestScheduleSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = TestSchedule
-        fields = ['id', 'project', 'schedule_time', 'tests', 'created_at']
+        fields = ['id', 'project', 'schedule_time', 'tests', 'execution_profile', 'only_affected', 'created_at']
 
 
 class ReportTemplateSerializer(serializers.ModelSerializer):
@@ -0,0 +1,291 @@
+import asyncio
+import codecs
+import logging
+import os
+import time
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from ..models import TestRun
+from .cancellation import cancelled_test_run_ids, get_poll_interval
+from .process_runner import OutputSink
+from .process_tree import kill_process_tree, session_kwargs
+
+logger = logging.getLogger(__name__)
+
+# Размер буфера StreamReader: более длинные строки читаются частями
+READ_LIMIT = 1024 * 1024
+
+
+def get_default_concurrency() -> int:
+    """
+    Число одновременных процессов тестов на воркер.
+    Процессы тестов в основном ждут сеть, поэтому лимит кратен числу ядер
+    и ограничен лимитом открытых файлов: каждому процессу нужны два канала.
+    """
+    configured = getattr(settings, 'EXECUTION_MAX_CONCURRENCY', 0)
+    if configured:
+        return configured
+
+    concurrency = (os.cpu_count() or 1) * 8
+    try:
+        import resource
+        soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft_limit != resource.RLIM_INFINITY:
+            concurrency = min(concurrency, max(1, soft_limit // 8))
+    except ImportError:
+        # На Windows модуля resource нет
+        pass
+    return concurrency
+
+
+class ProcessJob:
+    """Команда для запуска в AsyncExecutionEngine"""
+
+    def __init__(self, key: Hashable, cmd: List[str], cwd: Optional[str] = None, env: Optional[Dict] = None,
+                 test_run: Optional[TestRun] = None, timeout: Optional[float] = None):
+        """
+        :param key: Ключ, по которому возвращается результат и отменяется задание
+        :param test_run: Запуск, в который пишется потоковый вывод
+        :param timeout: Время на выполнение в секундах, по умолчанию EXECUTION_TEST_TIMEOUT
+        """
+        self.key = key
+        self.cmd = cmd
+        self.cwd = cwd
+        self.env = env
+        self.test_run = test_run
+        self.timeout = timeout
+
+
+class _Slots:
+    """Семафор, лимит которого можно менять во время работы"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    async def set_limit(self, limit: int):
+        async with self._condition:
+            self.limit = limit
+            self._condition.notify_all()
+
+
+class AsyncExecutionEngine:
+    """
+    Запуск процессов тестов на asyncio в одном потоке.
+
+    Вместо потока на каждый тест процессы запускаются через
+    asyncio.create_subprocess_exec, а число одновременных процессов ограничено
+    лимитом слотов: фиксированным или подбираемым AdaptiveConcurrencyController.
+    Вывод читается построчно и сохраняется через OutputSink, у каждого
+    задания есть таймаут, задания можно отменить из другого потока или флагом
+    отмены запуска в кэше (см. cancel_test_runs).
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                 flush_interval: Optional[float] = None, controller=None):
+        """
+        :param concurrency: Фиксированный лимит одновременных процессов
+        :param controller: AdaptiveConcurrencyController; если задан, лимит меняется по загрузке машины
+        """
+        self.controller = controller
+        self.concurrency = controller.limit if controller else concurrency or get_default_concurrency()
+        self.timeout = timeout or getattr(settings, 'EXECUTION_TEST_TIMEOUT', 15 * 60)
+        self.flush_interval = flush_interval or getattr(settings, 'EXECUTION_STREAM_FLUSH_INTERVAL', 0.5)
+        self._loop = None
+        self._tasks = {}
+        self._cancel_requested = set()
+        self._cancel_all = False
+        self._on_result = None
+
+    def run(self, jobs: Iterable[ProcessJob],
+            on_result: Optional[Callable[[Hashable, Dict], bool]] = None) -> Dict[Hashable, Dict]:
+        """
+        Выполняет задания и возвращает результаты по ключам заданий.
+        Результат дополняет формат run_streaming полями timed_out, cancelled и duration.
+        :param on_result: Вызывается в цикле событий по завершении каждого задания и не должен
+            блокировать; если он вернул True, остальные задания отменяются (fail-fast)
+        """
+        self._on_result = on_result
+        return asyncio.run(self._run_all(list(jobs)))
+
+    def cancel(self, key: Optional[Hashable] = None):
+        """Отменяет задание по ключу или все задания; безопасно вызывать из другого потока"""
+        loop = self._loop
+        if loop is None:
+            if key is None:
+                self._cancel_all = True
+            else:
+                self._cancel_requested.add(key)
+            return
+        loop.call_soon_threadsafe(self._cancel, key)
+
+    def _cancel(self, key: Optional[Hashable]):
+        tasks = self._tasks.values() if key is None else [self._tasks[key]] if key in self._tasks else []
+        for task in tasks:
+            task.cancel()
+
+    async def _run_all(self, jobs: List[ProcessJob]) -> Dict[Hashable, Dict]:
+        self._loop = asyncio.get_running_loop()
+        slots = _Slots(self.concurrency)
+        control = asyncio.create_task(self._control(slots)) if self.controller else None
+        watcher = asyncio.create_task(self._watch_cancellation(jobs))
+        try:
+            self._tasks = {job.key: asyncio.create_task(self._run_job(job, slots)) for job in jobs}
+            if self._cancel_all:
+                self._cancel(None)
+            for key in self._cancel_requested:
+                self._cancel(key)
+
+            outcomes = await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        finally:
+            if control:
+                control.cancel()
+            watcher.cancel()
+            self._loop = None
+
+        results = {}
+        for job, outcome in zip(jobs, outcomes):
+            if isinstance(outcome, BaseException):
+                cancelled = isinstance(outcome, asyncio.CancelledError)
+                results[job.key] = {
+                    'returncode': None,
+                    'stdout': '',
+                    'stderr': 'Cancelled' if cancelled else str(outcome),
+                    'truncated': False,
+                    'timed_out': False,
+                    'cancelled': cancelled,
+                    'duration': 0.0
+                }
+            else:
+                results[job.key] = outcome
+        return results
+
+    async def _control(self, slots: _Slots):
+        """Периодически пересчитывает лимит слотов по загрузке машины"""
+        adjust = sync_to_async(self.controller.adjust, thread_sensitive=False)
+        while True:
+            await asyncio.sleep(self.controller.interval)
+            try:
+                limit = await adjust(slots.in_flight)
+            except Exception as e:
+                logger.warning(f"Concurrency controller failed: {e}")
+                continue
+            self.concurrency = limit
+            await slots.set_limit(limit)
+
+    async def _watch_cancellation(self, jobs: List[ProcessJob]):
+        """Отменяет задания, для запусков которых через API запрошена отмена"""
+        jobs = {job.test_run.id: job.key for job in jobs if job.test_run is not None}
+        if not jobs:
+            return
+        check = sync_to_async(cancelled_test_run_ids, thread_sensitive=False)
+        while True:
+            await asyncio.sleep(get_poll_interval())
+            pending = [run_id for run_id, key in jobs.items() if not self._tasks[key].done()]
+            for run_id in await check(pending):
+                self._cancel(jobs[run_id])
+
+    async def _run_job(self, job: ProcessJob, slots: _Slots) -> Dict:
+        sink = OutputSink(job.test_run)
+        async with slots:
+            started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(
+                *job.cmd,
+                cwd=job.cwd,
+                env=job.env,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=READ_LIMIT,
+                **session_kwargs()
+            )
+
+            stop = asyncio.Event()
+            flusher = asyncio.create_task(self._flush_periodically(sink, stop))
+            timed_out = cancelled = False
+            try:
+                await asyncio.wait_for(self._communicate(process, sink), timeout=job.timeout or self.timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                logger.warning(f"Test process {job.key} timed out after {job.timeout or self.timeout}s")
+                await self._kill(process)
+            except asyncio.CancelledError:
+                cancelled = True
+                await self._kill(process)
+            finally:
+                # Последний сброс вывода выполняет сам flusher после остановки
+                stop.set()
+                await flusher
+
+            result = sink.result(process.returncode)
+            result.update(
+                timed_out=timed_out,
+                cancelled=cancelled,
+                duration=time.monotonic() - started
+            )
+            if self._on_result and not cancelled:
+                try:
+                    stop = self._on_result(job.key, result)
+                except Exception as e:
+                    logger.warning(f"Result callback failed for job {job.key}: {e}")
+                    stop = False
+                if stop:
+                    for key, task in self._tasks.items():
+                        if key != job.key and not task.done():
+                            task.cancel()
+            return result
+
+    async def _communicate(self, process, sink: OutputSink) -> int:
+        await asyncio.gather(
+            self._read('stdout', process.stdout, sink),
+            self._read('stderr', process.stderr, sink)
+        )
+        return await process.wait()
+
+    async def _read(self, stream: str, reader: asyncio.StreamReader, sink: OutputSink):
+        # Части длинной строки могут разрезать многобайтовый символ
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            try:
+                data = await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                # Конец потока: остаток без перевода строки
+                data = e.partial
+            except asyncio.LimitOverrunError as e:
+                # Строка длиннее READ_LIMIT остается в буфере: забираем ее прочитанную часть
+                data = await reader.readexactly(e.consumed)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if text:
+                sink.append(stream, text)
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            sink.append(stream, tail)
+
+    async def _flush_periodically(self, sink: OutputSink, stop: asyncio.Event):
+        """Сбрасывает вывод в БД и WebSocket не чаще раза в flush_interval"""
+        flush = sync_to_async(sink.flush, thread_sensitive=False)
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await flush()
+
+    async def _kill(self, process):
+        """Убивает процесс теста вместе с группой: браузерами, node и т.п."""
+        if process.returncode is None:
+            await sync_to_async(kill_process_tree, thread_sensitive=False)(process.pid)
+        await process.wait()
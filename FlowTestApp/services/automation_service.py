@@ -1,16 +1,36 @@
+import concurrent.futures
+import importlib.util
+import logging
 import os
+import tempfile
+import threading
+import time
 import shutil
-import subprocess
+import xml.etree.ElementTree as ET
 import git
-from ..models import AutomationProject, AutomationTest
+from ..models import AutomationProject, AutomationTest, ExecutionProfile
+from .batch_orchestrator import BatchOrchestrator
+from .process_runner import run_streaming
+from .sharding import get_shard_count, estimate_durations, plan_shards, merge_shard_results
+from .cancellation import CANCEL_REASON
+from .timeouts import get_batch_timeout, get_path_timeouts, timeout_reason
+from .impact_analysis import ImpactAnalyzer, get_changed_files
+from .ordering import fail_fast_reason, order_automation_tests
+from .retry import RetryPolicy, failed_automation_tests
 from datetime import datetime
 from django.conf import settings
 import ast
 import re
 
+logger = logging.getLogger(__name__)
+
 class AutomationService:
-    def __init__(self):
+    def __init__(self, cancel_check=None):
+        """
+        :param cancel_check: Функция без аргументов; если она вернула True, запущенные команды останавливаются
+        """
         self.base_path = settings.AUTOMATION_PROJECTS_DIR
+        self.cancel_check = cancel_check
 
     def sync_repository(self, project: AutomationProject):
         """Синхронизация репозитория и обновление тестов"""
@@ -21,11 +41,13 @@ class AutomationService:
             repo_url = project.get_repository_url_with_auth()
             
             # Клонируем или обновляем репозиторий
+            previous_commit = None
             if not os.path.exists(repo_path):
                 os.makedirs(repo_path)
-                git.Repo.clone_from(repo_url, repo_path)
+                repo = git.Repo.clone_from(repo_url, repo_path)
             else:
                 repo = git.Repo(repo_path)
+                previous_commit = repo.head.commit.hexsha
                 # Обновляем URL удаленного репозитория с учетом аутентификации
                 with repo.config_writer() as config:
                     config.set_value('remote "origin"', 'url', repo_url)
@@ -40,8 +62,21 @@ class AutomationService:
             project.last_sync = datetime.now()
             project.sync_status = 'synced'
             project.local_path = repo_path
+            current_commit = repo.head.commit.hexsha
+            # Список изменений обновляется, только если сменился коммит, чтобы повторная
+            # синхронизация без изменений не скрыла изменения для выбора затронутых тестов
+            if current_commit != project.last_commit_sha or previous_commit is None:
+                project.previous_commit_sha = previous_commit
+                project.changed_files = get_changed_files(repo, previous_commit, current_commit)
+            project.last_commit_sha = current_commit
             project.save()
 
+            # Граф импортов строится сразу, пока известен коммит рабочей копии
+            try:
+                ImpactAnalyzer(project).get_graph()
+            except Exception as e:
+                logger.warning(f"Failed to build import graph: {str(e)}")
+
             return {'status': 'success', 'tests': tests}
         except git.exc.GitCommandError as e:
             project.sync_status = 'error'
@@ -54,6 +89,53 @@ class AutomationService:
             project.save()
             raise Exception(f"Failed to sync repository: {str(e)}")
 
+    def checkout_commit(self, project: AutomationProject, commit_sha: str) -> str:
+        """
+        Возвращает путь к рабочей копии проекта на коммите commit_sha на этом узле.
+        Для каждого коммита создается свой каталог AUTOMATION_PROJECTS_DIR/commits/<проект>/<коммит>:
+        его совместно используют шарды одного прогона, а рабочая копия, которую обновляет
+        sync_repository, не переключается. Хранятся COMMIT_CHECKOUTS_KEEP последних коммитов проекта.
+        """
+        checkouts_dir = os.path.join(self.base_path, 'commits', str(project.id))
+        path = os.path.join(checkouts_dir, commit_sha)
+        if os.path.isdir(path):
+            # Время изменения каталога - время последнего использования при очистке
+            os.utime(path)
+            return path
+
+        os.makedirs(checkouts_dir, exist_ok=True)
+        # Клонируем во временный каталог, чтобы шард на том же узле не увидел неполную копию
+        temp_path = tempfile.mkdtemp(prefix=f'.{commit_sha}-', dir=checkouts_dir)
+        try:
+            repo = git.Repo.clone_from(project.get_repository_url_with_auth(), temp_path, no_checkout=True)
+            try:
+                repo.git.checkout(commit_sha)
+            except git.exc.GitCommandError:
+                # Коммит недоступен из веток (например, после force push) - запрашиваем его явно
+                repo.remotes.origin.fetch(commit_sha)
+                repo.git.checkout(commit_sha)
+            os.rename(temp_path, path)
+        except Exception:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            # Ту же копию одновременно создал другой шард
+            if not os.path.isdir(path):
+                raise
+
+        logger.info(f"Checked out commit {commit_sha} of automation project {project.id} to {path}")
+        self._prune_checkouts(checkouts_dir, keep=path)
+        return path
+
+    def _prune_checkouts(self, checkouts_dir: str, keep: str):
+        """Удаляет рабочие копии давно не использованных коммитов"""
+        checkouts = sorted(
+            (os.path.join(checkouts_dir, name) for name in os.listdir(checkouts_dir) if not name.startswith('.')),
+            key=os.path.getmtime,
+            reverse=True
+        )
+        for path in checkouts[settings.COMMIT_CHECKOUTS_KEEP:]:
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
+
     def scan_tests(self, project: AutomationProject, repo_path: str):
         """Сканирование тестов в репозитории"""
         tests_path = os.path.join(repo_path, project.tests_directory)
@@ -157,87 +239,248 @@ class AutomationService:
             tests.extend(match.group(1) for match in test_matches)
         return tests
 
-    def run_tests(self, project: AutomationProject, test_ids: list = None):
+    def run_tests(self, project: AutomationProject, test_ids: list = None, profile: ExecutionProfile = None,
+                  distributed: bool = False):
         """Запуск выбранных тестов"""
         if not test_ids:
-            return self.run_all_tests(project)
+            return self.run_all_tests(project, profile=profile, distributed=distributed)
 
         tests = AutomationTest.objects.filter(id__in=test_ids, project=project, is_available=True)
         if not tests:
             raise Exception("No available tests found")
 
-        return self._execute_tests(project, tests)
+        if distributed:
+            return self._dispatch_tests(project, tests, profile)
+        return self._execute_tests(project, tests, profile)
 
-    def run_all_tests(self, project: AutomationProject):
+    def run_all_tests(self, project: AutomationProject, profile: ExecutionProfile = None,
+                      distributed: bool = False):
         """Запуск всех доступных тестов"""
         tests = project.tests.filter(is_available=True)
         if not tests:
             raise Exception("No available tests found")
 
-        return self._execute_tests(project, tests)
+        if distributed:
+            return self._dispatch_tests(project, tests, profile)
+        return self._execute_tests(project, tests, profile)
+
+    def _dispatch_tests(self, project: AutomationProject, tests, profile: ExecutionProfile = None):
+        """Распределяет тесты по воркерам Celery, результат собирается в SuiteRun"""
+        suite_run = BatchOrchestrator().dispatch(project, tests, profile=profile)
+        return {
+            'success': True,
+            'suite_run_id': suite_run.id,
+            'total_shards': suite_run.total_shards
+        }
 
-    def _execute_tests(self, project: AutomationProject, tests):
+    def _execute_tests(self, project: AutomationProject, tests, profile: ExecutionProfile = None):
         """Выполнение тестов"""
         if not project.local_path or not os.path.exists(project.local_path):
             raise Exception("Repository not synced")
 
+        # Важные, недавно падавшие и измененные тесты идут первыми
+        tests = order_automation_tests(project, tests)
         if project.framework == 'pytest':
-            return self._run_pytest(project, tests)
+            started = time.monotonic()
+            result = self._run_pytest(project, tests, profile)
+            policy = RetryPolicy(profile)
+            if policy.enabled and not result.get('success') and not result.get('cancelled') \
+                    and not result.get('timed_out'):
+                result = self._retry_failed_pytest(project, tests, profile, policy, result,
+                                                   time.monotonic() - started)
+            return result
         elif project.framework == 'unittest':
-            return self._run_unittest(project, tests)
+            return self._run_unittest(project, tests, profile)
         elif project.framework == 'robot':
-            return self._run_robot(project, tests)
+            return self._run_robot(project, tests, profile)
         elif project.framework == 'playwright':
-            return self._run_playwright(project, tests)
+            return self._run_playwright(project, tests, profile)
         else:
             raise Exception(f"Unsupported framework: {project.framework}")
 
-    def _run_pytest(self, project: AutomationProject, tests):
+    def _run_pytest(self, project: AutomationProject, tests, profile: ExecutionProfile = None):
         """Запуск тестов с помощью pytest"""
-        cmd = ['pytest', '-v']
+        tests = list(tests)
+        shard_count = get_shard_count(project, len(tests))
+        if shard_count <= 1:
+            return self._run_command(
+                self._pytest_command(project, tests, profile), project.local_path, profile,
+                timeout=self._batch_timeout(project, tests)
+            )
+
+        # Делим тесты на шарды по истории длительности и запускаем их параллельно,
+        # внутри шарда сохраняется очередность тестов
+        durations = estimate_durations(project, tests)
+        shards = plan_shards(tests, durations, shard_count)
+        position = {test.id: index for index, test in enumerate(tests)}
+        for shard in shards:
+            shard['tests'].sort(key=lambda test: position[test.id])
+
+        # Fail-fast: шард, остановленный pytest по --maxfail, прерывает остальные шарды
+        max_failures = profile.max_failures if profile else 0
+        aborted = threading.Event()
+        cancel_check = self.cancel_check
+
+        def run_shard(index, shard):
+            runner = AutomationService(
+                cancel_check=lambda: aborted.is_set() or bool(cancel_check and cancel_check())
+            )
+            with tempfile.TemporaryDirectory(prefix=f'pytest-shard-{index}-') as work_dir:
+                cmd = self._pytest_command(project, shard['tests'], profile) + self._pytest_shard_args(index, work_dir)
+                result = runner._run_command(
+                    cmd, project.local_path, profile, timeout=self._batch_timeout(project, shard['tests'])
+                )
+                # Шард остановлен по --maxfail: pytest завершился с ошибкой, набрав max_failures падений
+                stopped = (
+                    max_failures and result.get('returncode') not in (None, 0)
+                    and self._junit_failures(os.path.join(work_dir, 'junit.xml')) >= max_failures
+                )
+            if stopped:
+                aborted.set()
+            elif result.get('cancelled') and aborted.is_set() and not (cancel_check and cancel_check()):
+                result['error'] = fail_fast_reason(max_failures)
+            return result
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            results = list(executor.map(run_shard, range(1, len(shards) + 1), shards))
+        return merge_shard_results(shards, results)
+
+    def _pytest_shard_args(self, index: int, work_dir: str) -> list:
+        """
+        Аргументы pytest, разводящие параллельные шарды одной рабочей копии по своим каталогам:
+        временные файлы - в work_dir (pytest очищает --basetemp при старте), отчет JUnit -
+        в work_dir/junit.xml, трейсы и видео pytest-playwright - в test-results/shard-<index>
+        вместо общего test-results
+        """
+        args = [f"--basetemp={os.path.join(work_dir, 'tmp')}", f"--junitxml={os.path.join(work_dir, 'junit.xml')}"]
+        if importlib.util.find_spec('pytest_playwright') is not None:
+            args.append(f"--output={os.path.join('test-results', f'shard-{index}')}")
+        return args
+
+    def _junit_failures(self, report_path: str) -> int:
+        """Количество упавших и завершившихся ошибкой тестов по отчету JUnit; 0, если отчета нет"""
+        try:
+            root = ET.parse(report_path).getroot()
+        except (OSError, ET.ParseError):
+            return 0
+        suites = [root] if root.tag == 'testsuite' else root.iter('testsuite')
+        return sum(int(suite.get('failures') or 0) + int(suite.get('errors') or 0) for suite in suites)
+
+    def _retry_failed_pytest(self, project: AutomationProject, tests, profile: ExecutionProfile,
+                             policy: RetryPolicy, result: dict, elapsed: float) -> dict:
+        """
+        Перезапускает упавшие тесты набора одной сессией pytest на попытку в пределах
+        бюджета политики. Упавшие тесты определяются по выводу pytest -v; если их
+        не удалось определить, набор не перезапускается. Тесты, прошедшие при
+        перезапуске, отмечаются как flaky; если прошли все, набор считается успешным.
+        """
+        failed = failed_automation_tests(tests, result.get('output'))
+        if not failed:
+            return result
+
+        durations = estimate_durations(project, failed)
+        remaining = policy.budget(elapsed)
+        flaky = []
+        output = [result.get('output') or '']
+        for attempt in range(2, policy.max_retries + 2):
+            selected = policy.select(failed, durations, remaining, key=lambda test: test.id)
+            if not selected:
+                break
+            remaining -= sum(durations.get(test.id, 0.0) for test in selected)
+            logger.info(f"Retrying {len(selected)} of {len(failed)} failed tests of project {project.id}, attempt {attempt}")
+
+            retry = self._run_command(
+                self._pytest_command(project, selected, profile), project.local_path, profile,
+                timeout=self._batch_timeout(project, selected)
+            )
+            output.append(f"\n===== retry attempt {attempt} =====\n{retry.get('output') or ''}")
+            if retry.get('cancelled') or retry.get('timed_out'):
+                break
+            still_failed = [] if retry['success'] else failed_automation_tests(selected, retry.get('output'))
+            if not retry['success'] and not still_failed:
+                # Сессия упала, но упавшие тесты не определены: считаем, что не прошел ни один
+                still_failed = selected
+            passed = [test for test in selected if test not in still_failed]
+            flaky.extend(passed)
+            failed = [test for test in failed if test not in passed]
+            if not failed:
+                break
+
+        if flaky:
+            AutomationTest.objects.filter(id__in=[test.id for test in flaky]).update(last_status='flaky')
+        result = {**result, 'output': ''.join(output), 'flaky_tests': [test.id for test in flaky]}
+        if not failed:
+            result.update(success=True, flaky=True)
+        return result
+
+    def _pytest_command(self, project: AutomationProject, tests, profile: ExecutionProfile = None) -> list:
+        """Команда pytest для набора тестов"""
+        cmd = ['pytest', '-v', *self._pytest_profile_args(profile), *(profile.fail_fast_args() if profile else [])]
         for test in tests:
             cmd.append(f"{project.local_path}/{test.file_path}::{test.name}")
-        
-        return self._run_command(cmd, project.local_path)
+        return cmd
 
-    def _run_unittest(self, project: AutomationProject, tests):
+    def _run_unittest(self, project: AutomationProject, tests, profile: ExecutionProfile = None):
         """Запуск тестов с помощью unittest"""
         cmd = ['python', '-m', 'unittest']
         for test in tests:
             cmd.append(f"{test.file_path}")
         
-        return self._run_command(cmd, project.local_path)
+        return self._run_command(cmd, project.local_path, profile, timeout=self._batch_timeout(project, tests))
 
-    def _run_robot(self, project: AutomationProject, tests):
+    def _run_robot(self, project: AutomationProject, tests, profile: ExecutionProfile = None):
         """Запуск тестов с помощью Robot Framework"""
         cmd = ['robot']
         for test in tests:
             cmd.extend(['--test', test.name])
         cmd.append(project.local_path)
         
-        return self._run_command(cmd, project.local_path)
+        return self._run_command(cmd, project.local_path, profile, timeout=self._batch_timeout(project, tests))
 
-    def _run_playwright(self, project: AutomationProject, tests):
+    def _run_playwright(self, project: AutomationProject, tests, profile: ExecutionProfile = None):
         """Запуск тестов с помощью Playwright"""
         cmd = ['npx', 'playwright', 'test']
+        if profile and not profile.headless:
+            cmd.append('--headed')
         for test in tests:
             cmd.append(test.file_path)
         
-        return self._run_command(cmd, project.local_path)
+        return self._run_command(cmd, project.local_path, profile, timeout=self._batch_timeout(project, tests))
 
-    def _run_command(self, cmd, cwd):
-        """Выполнение команды"""
+    def _pytest_profile_args(self, profile: ExecutionProfile = None) -> list:
+        """Аргументы профиля для pytest, если в окружении есть плагин pytest-playwright"""
+        return profile.pytest_args(check_plugin=True) if profile else []
+
+    def _batch_timeout(self, project: AutomationProject, tests) -> float:
+        """Таймаут запуска набора тестов по истории длительности их файлов"""
+        return get_batch_timeout(get_path_timeouts(project, {test.file_path for test in tests}).values())
+
+    def _run_command(self, cmd, cwd, profile: ExecutionProfile = None, timeout: float = None):
+        """Выполнение команды; по истечении timeout процесс убивается вместе с потомками"""
+        env = os.environ.copy()
+        if profile:
+            env.update(profile.environment())
         try:
-            result = subprocess.run(
-                cmd,
-                cwd=cwd,
-                capture_output=True,
-                text=True
-            )
+            result = run_streaming(cmd, cwd=cwd, env=env, timeout=timeout, cancel_check=self.cancel_check)
+            if result['cancelled']:
+                return {
+                    'success': False,
+                    'cancelled': True,
+                    'output': result['stdout'],
+                    'error': CANCEL_REASON
+                }
+            if result['timed_out']:
+                return {
+                    'success': False,
+                    'timed_out': True,
+                    'output': result['stdout'],
+                    'error': f"{timeout_reason(timeout)}\n{result['stderr']}"
+                }
             return {
-                'success': result.returncode == 0,
-                'output': result.stdout,
-                'error': result.stderr
+                'success': result['returncode'] == 0,
+                'returncode': result['returncode'],
+                'output': result['stdout'],
+                'error': result['stderr']
             }
         except Exception as e:
             return {
@@ -245,7 +488,7 @@ class AutomationService:
                 'error': str(e)
             }
 
-    def run_test(self, test: AutomationTest):
+    def run_test(self, test: AutomationTest, profile: ExecutionProfile = None):
         """Запуск одного теста"""
         if not test.is_available:
             raise Exception("Test is not available")
@@ -254,17 +497,19 @@ class AutomationService:
             raise Exception("Repository not synced")
 
         if test.project.framework == 'pytest':
-            cmd = ['pytest', '-v', f"{test.project.local_path}/{test.file_path}::{test.name}"]
+            cmd = ['pytest', '-v', *self._pytest_profile_args(profile), f"{test.project.local_path}/{test.file_path}::{test.name}"]
         elif test.project.framework == 'unittest':
             cmd = ['python', '-m', 'unittest', f"{test.file_path}"]
         elif test.project.framework == 'robot':
             cmd = ['robot', '--test', test.name, test.project.local_path]
         elif test.project.framework == 'playwright':
             cmd = ['npx', 'playwright', 'test', test.file_path]
+            if profile and not profile.headless:
+                cmd.append('--headed')
         else:
             raise Exception(f"Unsupported framework: {test.project.framework}")
 
-        result = self._run_command(cmd, test.project.local_path)
+        result = self._run_command(cmd, test.project.local_path, profile, timeout=self._batch_timeout(test.project, [test]))
         
         # Обновляем статус теста
         test.last_run = datetime.now()
@@ -0,0 +1,213 @@
+import logging
+import uuid
+from typing import Dict, Optional
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from ..models import AutomationProject, AutomationTest, ExecutionProfile, SuiteRun, TestSchedule
+from .fair_share import FairShareDispatcher
+from .retry import failed_automation_tests
+from .sharding import estimate_durations, plan_shards, merge_shard_results
+
+logger = logging.getLogger(__name__)
+
+# Статусы завершенного шарда: результат записан и учтен в счетчиках SuiteRun
+SHARD_DONE_STATUSES = ('passed', 'failed', 'cancelled')
+
+
+class BatchOrchestrator:
+    """
+    Распределяет большой прогон по воркерам Celery.
+
+    Тесты делятся на шарды по истории длительности, каждый шард выполняется
+    задачей run_test_shard, а после последнего шарда aggregate_suite_run
+    собирает результаты в SuiteRun. Шарды получают слоты воркеров через
+    FairShareDispatcher наравне с задачами других проектов, поэтому вместо
+    chord завершение шардов считается счетчиками SuiteRun под select_for_update:
+    complete_shard учитывает каждый шард один раз в любом порядке завершения,
+    и aggregate запускается ровно после последнего из них.
+    Задачи шардов подтверждаются после выполнения (acks_late), поэтому шард
+    упавшего воркера возвращается в очередь и выполняется на другом воркере.
+    """
+
+    def __init__(self, shard_count: Optional[int] = None):
+        self.shard_count = shard_count or getattr(settings, 'DISTRIBUTED_SHARD_COUNT', 8)
+
+    def dispatch(self, project: AutomationProject, tests, profile: Optional[ExecutionProfile] = None,
+                 schedule: Optional[TestSchedule] = None, retry_of: Optional[SuiteRun] = None) -> SuiteRun:
+        """
+        Создает SuiteRun и ставит шарды в очередь справедливого распределения.
+        Шарды выполняются на последнем синхронизированном коммите проекта,
+        перезапуск упавших тестов - на коммите исходного прогона.
+        :param retry_of: Прогон, упавшие тесты которого перезапускаются
+        """
+        from ..tasks import run_test_shard
+
+        tests = list(tests)
+        if not tests:
+            raise Exception("No available tests found")
+
+        durations = estimate_durations(project, tests)
+        shards = plan_shards(tests, durations, min(self.shard_count, len(tests)))
+
+        suite_run = SuiteRun.objects.create(
+            project=project.project,
+            automation_project=project,
+            schedule=schedule,
+            execution_profile=profile,
+            retry_of=retry_of,
+            commit_sha=retry_of.commit_sha if retry_of and retry_of.commit_sha else project.last_commit_sha,
+            status='pending',
+            total_shards=len(shards),
+            total_tests=len(tests),
+            shards=[
+                {
+                    'index': index,
+                    'task_id': str(uuid.uuid4()),
+                    'test_ids': [test.id for test in shard['tests']],
+                    'estimated_duration': round(shard['estimated_duration'], 2),
+                    'status': 'pending',
+                    'worker': None,
+                    'attempts': 0,
+                    'success': None
+                }
+                for index, shard in enumerate(shards)
+            ]
+        )
+
+        # Идентификаторы задач шардов известны заранее, чтобы их можно было отозвать при отмене
+        dispatcher = FairShareDispatcher()
+        for shard in suite_run.shards:
+            dispatcher.submit(project, run_test_shard, args=[suite_run.id, shard['index']], task_id=shard['task_id'])
+
+        logger.info(f"Suite run {suite_run.id}: queued {len(shards)} shards for {len(tests)} tests")
+        return suite_run
+
+    @staticmethod
+    def update_shard(suite_run_id: int, index: int, **fields) -> SuiteRun:
+        """
+        Атомарно обновляет описание шарда в SuiteRun.shards.
+        Завершенный шард не меняется: повторная доставка задачи не должна
+        перезаписывать учтенный результат
+        """
+        with transaction.atomic():
+            suite_run = SuiteRun.objects.select_for_update().get(id=suite_run_id)
+            shard = suite_run.shards[index]
+            if shard['status'] in SHARD_DONE_STATUSES:
+                return suite_run
+            shard.update(fields)
+            update_fields = ['shards']
+            if suite_run.status == 'pending':
+                suite_run.status = 'running'
+                suite_run.started_at = timezone.now()
+                update_fields += ['status', 'started_at']
+            suite_run.save(update_fields=update_fields)
+        return suite_run
+
+    @staticmethod
+    def complete_shard(suite_run_id: int, index: int, result: Dict) -> bool:
+        """
+        Отмечает шард выполненным, сохраняет его результат и увеличивает счетчики прогресса
+        и результатов тестов. Упавшие тесты шарда определяются по выводу pytest; если их
+        определить не удалось, упавшими считаются все тесты шарда.
+        Повторное завершение шарда ничего не меняет: сохраняется первый результат.
+        Возвращает True, если это был последний незавершенный шард прогона.
+        """
+        with transaction.atomic():
+            suite_run = SuiteRun.objects.select_for_update().get(id=suite_run_id)
+            shard = suite_run.shards[index]
+            # Повторно доставленный шард не должен увеличивать счетчики дважды
+            if shard['status'] in SHARD_DONE_STATUSES:
+                logger.warning(f"Suite run {suite_run_id}: shard {index} already completed, result ignored")
+                return False
+            total = len(shard['test_ids'])
+            if result.get('cancelled'):
+                shard_status = 'cancelled'
+                counts = {'skipped_tests': total}
+            elif result.get('success'):
+                shard_status = 'passed'
+                counts = {'passed_tests': total, 'flaky_tests': len(result.get('flaky_tests') or ())}
+                counts['passed_tests'] -= counts['flaky_tests']
+            else:
+                shard_status = 'failed'
+                tests = AutomationTest.objects.filter(id__in=shard['test_ids'])
+                failed = len(failed_automation_tests(tests, result.get('output'))) or total
+                counts = {'failed_tests': failed, 'passed_tests': total - failed}
+            shard.update(
+                status=shard_status,
+                success=bool(result.get('success')),
+                output=result.get('output', ''),
+                error=result.get('error', ''),
+                finished_at=timezone.now().isoformat()
+            )
+            suite_run.completed_shards += 1
+            suite_run.completed_tests += total
+            for field, count in counts.items():
+                setattr(suite_run, field, getattr(suite_run, field) + count)
+            suite_run.save(update_fields=['shards', 'completed_shards', 'completed_tests', *counts])
+        return suite_run.completed_shards >= suite_run.total_shards
+
+    @staticmethod
+    def shard_results(suite_run: SuiteRun):
+        """Результаты шардов в формате run_test_shard для aggregate"""
+        return [
+            {
+                'shard_index': shard['index'],
+                'cancelled': shard['status'] == 'cancelled',
+                'success': bool(shard.get('success')),
+                'output': shard.get('output', ''),
+                'error': shard.get('error', '')
+            }
+            for shard in suite_run.shards
+        ]
+
+    @staticmethod
+    def failed_tests(suite_run: SuiteRun):
+        """
+        Упавшие тесты прогона по выводу упавших шардов. Если упавшие тесты шарда
+        не удалось определить по выводу, в результат попадают все тесты шарда.
+        """
+        failed = []
+        for shard in suite_run.shards:
+            if shard['status'] != 'failed':
+                continue
+            tests = list(AutomationTest.objects.filter(
+                id__in=shard['test_ids'], project=suite_run.automation_project, is_available=True
+            ))
+            failed.extend(failed_automation_tests(tests, shard.get('output')) or tests)
+        return failed
+
+    @staticmethod
+    def aggregate(suite_run_id: int, results) -> SuiteRun:
+        """
+        Собирает результаты всех шардов в родительскую запись.
+        Результаты упорядочиваются по shard_index; уже собранный прогон не меняется
+        """
+        suite_run = SuiteRun.objects.get(id=suite_run_id)
+        if suite_run.status in ('passed', 'failed') and suite_run.finished_at:
+            return suite_run
+        results = sorted(results, key=lambda r: r.get('shard_index', 0))
+        shards = [
+            {'tests': shard['test_ids'], 'estimated_duration': shard['estimated_duration']}
+            for shard in suite_run.shards
+        ]
+        merged = merge_shard_results(shards, results)
+
+        if suite_run.status == 'cancelled':
+            # Статус и время завершения уже выставлены при отмене
+            suite_run.output = merged['output']
+            suite_run.save(update_fields=['output'])
+            return suite_run
+
+        suite_run.status = 'passed' if merged['success'] else 'failed'
+        suite_run.output = merged['output']
+        suite_run.error_message = merged['error'] or None
+        suite_run.finished_at = timezone.now()
+        suite_run.save()
+
+        if suite_run.schedule:
+            schedule = suite_run.schedule
+            schedule.last_status = 'success' if merged['success'] else 'error'
+            schedule.last_result = merged['output']
+            schedule.save()
+        return suite_run
@@ -1,53 +1,300 @@
-import concurrent.futures
+import logging
+import time
+from collections import defaultdict
 from typing import List, Dict, Optional
 from django.db.models import Q
-from ..models import TestCase, Project, SchedulerEvent
+from ..models import TestCase, TestRun, Project, SchedulerEvent, ExecutionProfile, SuiteRun
 from .test_runner import TestRunner
+from .pytest_session import PytestSession
+from .async_engine import AsyncExecutionEngine, ProcessJob
+from .concurrency import AdaptiveConcurrencyController
+from .result_cache import ResultCache
+from .ordering import fail_fast_reason, order_test_cases
+from .cancellation import cancelled_test_run_ids
+from .retry import RetryPolicy
+from .sharding import DEFAULT_TEST_DURATION
+from .suite_recorder import SuiteRecorder
+
+logger = logging.getLogger(__name__)
 
 class BatchTestRunner:
-    def __init__(self, max_workers: int = 3):
+    def __init__(self, max_workers: Optional[int] = None, batched: bool = False, use_cache: bool = False):
         """
         Инициализация сервиса для массового запуска тестов
-        :param max_workers: Максимальное количество параллельных запусков
+        :param max_workers: Фиксированное количество параллельных запусков; по умолчанию подбирается по загрузке машины
+        :param batched: Запускать pytest-тесты одного проекта автоматизации одной сессией
+        :param use_cache: Пропускать неизменившиеся тесты проектов с включенным кэшем результатов
         """
         self.max_workers = max_workers
+        self.batched = batched
+        self.use_cache = use_cache
+        self.engine = None
+        self.recorder = SuiteRecorder()
 
-    def run_tests(self, test_cases: List[TestCase]) -> List[Dict]:
+    def run_tests(self, test_cases: List[TestCase], profile: Optional[ExecutionProfile] = None,
+                  suite_run: Optional[SuiteRun] = None) -> List[Dict]:
         """
-        Запускает список тестов параллельно
+        Запускает список тестов параллельно. Набор записывается одним SuiteRun,
+        записи тестов создаются и обновляются группами (см. SuiteRecorder)
+        :param profile: Профиль выполнения, по умолчанию debug
+        :param suite_run: Созданный заранее SuiteRun набора (например, перезапуск упавших тестов)
         """
+        test_cases = list(test_cases)
+        profile = profile or ExecutionProfile.get_default()
+        if suite_run is not None:
+            self.recorder = SuiteRecorder(suite_run)
+        else:
+            self.recorder = SuiteRecorder.start(test_cases, profile) if test_cases else SuiteRecorder()
+        try:
+            results = self._run_cached(test_cases, profile) if self.use_cache else self._run(test_cases, profile)
+        except Exception as e:
+            self.recorder.complete('error', str(e))
+            raise
+        self.recorder.complete()
+        return results
+
+    def _run_cached(self, test_cases: List[TestCase], profile: ExecutionProfile) -> List[Dict]:
+        """Пропускает тесты с записью в кэше результатов, остальные выполняет и запоминает"""
+        caches = {}
+        keys = {}
         results = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_test = {
-                executor.submit(self._run_single_test, test_case): test_case 
-                for test_case in test_cases
+        pending = []
+        for test_case in test_cases:
+            cache = self._get_cache(caches, test_case, profile)
+            if cache is None:
+                pending.append(test_case)
+                continue
+            keys[test_case.id] = cache.test_case_key(test_case)
+            entry = cache.lookup(keys[test_case.id])
+            if entry is None:
+                pending.append(test_case)
+                continue
+            test_run = cache.record_hit(test_case, entry, suite_run=self.recorder.suite_run)
+            results.append({
+                'test_case': test_case,
+                'test_run': test_run,
+                'result': {'success': True, 'cached': True, 'cached_from': entry.test_run_id}
+            })
+        self.recorder.count(item['test_run'].status for item in results)
+
+        for item in self._run(pending, profile):
+            results.append(item)
+            test_case, result = item['test_case'], item.get('result')
+            if test_case.id not in keys or result is None or result.get('cancelled') or result.get('skipped'):
+                continue
+            cache = caches[test_case.automation_project_id]
+            # Нестабильный тест, прошедший только при перезапуске, в кэш не попадает
+            if result.get('success') and not result.get('flaky'):
+                cache.store(keys[test_case.id], test_case=test_case, test_run=item.get('test_run'))
+            else:
+                cache.invalidate(keys[test_case.id])
+        return results
+
+    def _run(self, test_cases: List[TestCase], profile: Optional[ExecutionProfile] = None) -> List[Dict]:
+        # Важные, недавно падавшие и измененные тесты идут первыми, среди равных - самые долгие
+        test_cases = order_test_cases(test_cases)
+        profile = profile or ExecutionProfile.get_default()
+        started = time.monotonic()
+        results = self._run_once(test_cases, profile)
+        policy = RetryPolicy(profile)
+        if policy.enabled:
+            self._retry_failed(results, profile, policy, time.monotonic() - started)
+        return results
+
+    def _run_once(self, test_cases: List[TestCase], profile: ExecutionProfile,
+                  retry_of: Optional[Dict[int, TestRun]] = None, attempt: int = 1) -> List[Dict]:
+        if self.batched:
+            return self._run_batched(test_cases, profile, retry_of, attempt)
+        return self._run_parallel(test_cases, profile, retry_of, attempt)
+
+    def _retry_failed(self, results: List[Dict], profile: ExecutionProfile, policy: RetryPolicy, elapsed: float):
+        """
+        Перезапускает упавшие тесты в пределах бюджета политики. Каждая попытка -
+        одна сессия из всех еще не прошедших тестов. Тест, прошедший при перезапуске,
+        считается нестабильным: его первый запуск получает статус flaky, а результат
+        в списке - success с признаком flaky. Отмененные и пропущенные тесты не перезапускаются.
+        """
+        failed = {
+            item['test_case'].id: item for item in results
+            if item.get('test_run') and item.get('result') is not None
+            and not item['result'].get('success')
+            and not item['result'].get('cancelled') and not item['result'].get('skipped')
+        }
+        remaining = policy.budget(elapsed)
+        for attempt in range(2, policy.max_retries + 2):
+            durations = {
+                test_case_id: item['test_run'].execution_time or DEFAULT_TEST_DURATION
+                for test_case_id, item in failed.items()
             }
-            
-            for future in concurrent.futures.as_completed(future_to_test):
-                test_case = future_to_test[future]
-                try:
-                    result = future.result()
-                    results.append({
-                        'test_case': test_case,
-                        'result': result
-                    })
-                except Exception as e:
-                    results.append({
-                        'test_case': test_case,
-                        'result': {
-                            'success': False,
-                            'error': str(e)
-                        }
-                    })
-        
+            selected = policy.select(failed, durations, remaining)
+            if not selected:
+                break
+            remaining -= sum(durations[test_case_id] for test_case_id in selected)
+            logger.info(f"Retrying {len(selected)} of {len(failed)} failed tests, attempt {attempt}")
+
+            retry_of = {test_case_id: failed[test_case_id]['test_run'] for test_case_id in selected}
+            flaky = []
+            for retry in self._run_once([failed[test_case_id]['test_case'] for test_case_id in selected],
+                                        profile, retry_of, attempt):
+                item = failed[retry['test_case'].id]
+                result = retry.get('result')
+                if result and result.get('success'):
+                    flaky.append(item['test_run'])
+                    item['result'] = {**result, 'flaky': True, 'attempts': attempt}
+                    del failed[retry['test_case'].id]
+                elif result and (result.get('cancelled') or result.get('skipped')):
+                    del failed[retry['test_case'].id]
+                elif retry.get('test_run'):
+                    # Следующая попытка оценивается по длительности последней
+                    item['test_run'].execution_time = retry['test_run'].execution_time
+            self.recorder.mark_flaky(flaky)
+            if not failed:
+                break
+
+    @staticmethod
+    def _get_cache(caches: Dict, test_case: TestCase, profile: ExecutionProfile) -> Optional[ResultCache]:
+        """Кэш результатов проекта автоматизации теста; None, если проект не включил кэш"""
+        automation_project = test_case.automation_project
+        if automation_project is None:
+            return None
+        if automation_project.id not in caches:
+            caches[automation_project.id] = ResultCache(automation_project, profile)
+        cache = caches[automation_project.id]
+        return cache if cache.enabled else None
+
+    def _run_batched(self, test_cases: List[TestCase], profile: Optional[ExecutionProfile] = None,
+                     retry_of: Optional[Dict[int, TestRun]] = None, attempt: int = 1) -> List[Dict]:
+        """
+        Группирует pytest-тесты по проекту автоматизации и запускает каждую группу
+        одной сессией pytest; остальные тесты запускаются по одному
+        """
+        groups = defaultdict(list)
+        single = []
+        for test_case in test_cases:
+            automation_project = test_case.automation_project
+            if automation_project and automation_project.framework == 'pytest' and test_case.script_path:
+                groups[automation_project].append(test_case)
+            else:
+                single.append(test_case)
+
+        results = []
+        for automation_project, group in groups.items():
+            try:
+                session = PytestSession(automation_project, group, profile, retry_of, attempt, recorder=self.recorder)
+                results.extend(session.run())
+            except Exception as e:
+                if attempt == 1:
+                    self.recorder.count(['error'] * len(group))
+                results.extend({
+                    'test_case': test_case,
+                    'result': {
+                        'success': False,
+                        'error': str(e)
+                    }
+                } for test_case in group)
+
+        if single:
+            results.extend(self._run_parallel(single, profile, retry_of, attempt))
         return results
 
-    def _run_single_test(self, test_case: TestCase) -> Optional[Dict]:
+    def _run_parallel(self, test_cases: List[TestCase], profile: Optional[ExecutionProfile] = None,
+                      retry_of: Optional[Dict[int, TestRun]] = None, attempt: int = 1) -> List[Dict]:
         """
-        Запускает отдельный тест
+        Запускает тесты по одному процессу на тест в асинхронном движке.
+        Записи в БД создаются до и после запуска, в цикле asyncio только процессы.
         """
-        runner = TestRunner(test_case)
-        return runner.run()
+        results = []
+        runners = {}
+        for test_case in test_cases:
+            try:
+                runners[test_case.id] = TestRunner(test_case, profile, (retry_of or {}).get(test_case.id), attempt)
+            except Exception as e:
+                results.append({
+                    'test_case': test_case,
+                    'result': {
+                        'success': False,
+                        'error': str(e)
+                    }
+                })
+        if attempt == 1:
+            self.recorder.count(['error'] * len(results))
+        if not runners:
+            return results
+
+        # Записи всех тестов группы создаются одной транзакцией
+        try:
+            records = self.recorder.create_runs(
+                [runner.test_case for runner in runners.values()], profile, 'in_progress', retry_of, attempt
+            )
+        except Exception as e:
+            print(f"Error preparing environment: {str(e)}")
+            if attempt == 1:
+                self.recorder.count(['error'] * len(runners))
+            return results + [{'test_case': runner.test_case, 'result': None} for runner in runners.values()]
+
+        finished = []
+        jobs = []
+        for key, runner in list(runners.items()):
+            runner.attach(*records[key])
+            try:
+                command = runner.build_command()
+                if not command:
+                    result = {
+                        'success': False,
+                        'error': f'Unsupported test framework: {runner.automation_test.framework}'
+                    }
+            except Exception as e:
+                command, result = None, {'success': False, 'error': str(e)}
+            if not command:
+                finished.append((runner, result))
+                del runners[key]
+                continue
+            jobs.append(ProcessJob(key, test_run=runner.test_run, **command))
+
+        # Fail-fast: после max_failures падений оставшиеся тесты отменяются
+        max_failures = profile.max_failures if profile else 0
+        failures = 0
+
+        def on_result(key, process_result) -> bool:
+            nonlocal failures
+            if process_result['returncode'] != 0:
+                failures += 1
+            return bool(max_failures) and failures >= max_failures
+
+        controller = None if self.max_workers else AdaptiveConcurrencyController()
+        self.engine = AsyncExecutionEngine(concurrency=self.max_workers, controller=controller)
+        process_results = self.engine.run(jobs, on_result=on_result) if jobs else {}
+        user_cancelled = cancelled_test_run_ids(runner.test_run.id for runner in runners.values())
+        for key, process_result in process_results.items():
+            runner = runners[key]
+            if process_result['cancelled'] and max_failures and failures >= max_failures \
+                    and runner.test_run.id not in user_cancelled:
+                result = {'success': False, 'skipped': True, 'error': fail_fast_reason(max_failures)}
+            else:
+                result = runner.parse_result(process_result)
+            finished.append((runner, result))
+
+        return results + self._save_finished(finished)
+
+    def _save_finished(self, finished: List) -> List[Dict]:
+        """Записывает результаты группы тестов одной транзакцией и оповещает клиентов"""
+        events = [runner.apply_result(result) for runner, result in finished]
+        self.recorder.save_results(
+            [runner.test_run for runner, _ in finished],
+            [runner.test_report for runner, _ in finished],
+            events
+        )
+        for (runner, _), event in zip(finished, events):
+            runner.notify_event(event)
+        return [
+            {'test_case': runner.test_case, 'test_run': runner.test_run, 'result': result}
+            for runner, result in finished
+        ]
+
+    def cancel(self):
+        """Отменяет тесты, выполняющиеся в асинхронном движке"""
+        if self.engine:
+            self.engine.cancel()
 
     def run_project_tests(self, project: Project) -> List[Dict]:
         """
@@ -103,4 +350,6 @@ class BatchTestRunner:
         else:
             return []
 
-        return self.run_tests(test_cases)
+        # Запуски по расписанию по умолчанию идут в быстром профиле
+        profile = event.execution_profile or ExecutionProfile.get_default(scheduled=True)
+        return self.run_tests(test_cases, profile)
@@ -0,0 +1,323 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Optional
+from django.conf import settings
+from .process_tree import child_pids, kill_process_tree
+from .cancellation import ExecutionCancelled, get_poll_interval
+from .timeouts import ExecutionTimeout
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledBrowser:
+    """Запущенный браузер из пула и счетчик его использований"""
+
+    def __init__(self, browser, launch_time):
+        self.browser = browser
+        self.launch_time = launch_time
+        self.uses = 0
+
+
+class _Job:
+    """Задание на выполнение функции в теплом браузере"""
+
+    def __init__(self, func, context_options):
+        self.func = func
+        self.context_options = context_options
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        # Процесс драйвера Playwright потока, который выполняет задание
+        self.driver_pid = None
+        # Задание прервано по таймауту или отмене, вызывающий его больше не ждет
+        self.aborted = False
+        self.killed = False
+
+
+class BrowserPool:
+    """
+    Пул теплых браузеров Chromium для одного процесса воркера.
+
+    Playwright (sync API) привязан к потоку, в котором он запущен, поэтому
+    каждый браузер живет в собственном потоке пула. Задания передаются
+    потокам через очередь, каждое задание получает новый BrowserContext.
+    """
+
+    def __init__(self, size: int = None, max_uses: int = None, launch_options: dict = None):
+        """
+        :param size: Количество теплых браузеров
+        :param max_uses: Количество тестов, после которого браузер перезапускается
+        :param launch_options: Параметры для chromium.launch()
+        """
+        self.size = size or getattr(settings, 'BROWSER_POOL_SIZE', 2)
+        self.max_uses = max_uses or getattr(settings, 'BROWSER_POOL_MAX_USES', 50)
+        self.launch_options = launch_options or {}
+        self.pid = os.getpid()
+        self._jobs = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'launches': 0,
+            'recycled': 0,
+            'crashed': 0,
+            'timeouts': 0,
+            'launch_time_total': 0.0,
+            'launch_time_last': None,
+        }
+
+    def run(self, func, context_options: dict = None, timeout: float = None, cancel_check=None):
+        """
+        Выполняет func(browser, context) в браузере из пула и возвращает ее результат.
+        Контекст закрывается после выполнения, исключения пробрасываются вызывающему.
+
+        Если задание не завершилось за timeout секунд (без timeout - за
+        EXECUTION_TEST_TIMEOUT) или cancel_check() сообщил об отмене, драйвер
+        Playwright потока вместе с браузером убивается, поток пула перезапускается,
+        а вызывающему выбрасывается ExecutionTimeout или ExecutionCancelled.
+        """
+        timeout = timeout or settings.EXECUTION_TEST_TIMEOUT
+        self._ensure_workers()
+        job = _Job(func, context_options or {})
+        self._jobs.put(job)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = min(get_poll_interval(), max(0.0, deadline - time.monotonic()))
+            if job.done.wait(wait):
+                break
+            if time.monotonic() >= deadline:
+                self._record(timeouts=1)
+                self._abort(job, f"timed out after {timeout}s")
+                raise ExecutionTimeout(timeout)
+            if cancel_check and cancel_check():
+                self._abort(job, "cancelled")
+                raise ExecutionCancelled()
+            # Потоки завершились, не взяв задание (например, не запустился драйвер):
+            # новый поток либо выполнит его, либо завершит с ошибкой запуска
+            self._ensure_workers()
+
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _abort(self, job, reason: str):
+        """Прерывает задание: поток пула завершится, драйвер и браузер убиваются"""
+        job.aborted = True
+        if job.driver_pid:
+            logger.warning(f"Browser pool: job {reason}, killing browser")
+            job.killed = True
+            kill_process_tree(job.driver_pid)
+            job.done.wait(10)
+        else:
+            logger.warning(f"Browser pool: job {reason}, driver pid is unknown, browser is left to finish the job")
+
+    def stats(self) -> dict:
+        """Возвращает статистику попаданий в пул и времени запуска браузеров"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['launch_time_avg'] = (
+            stats['launch_time_total'] / stats['launches'] if stats['launches'] else None
+        )
+        stats['size'] = self.size
+        stats['max_uses'] = self.max_uses
+        return stats
+
+    def shutdown(self):
+        """Останавливает потоки пула и закрывает браузеры"""
+        with self._lock:
+            workers = list(self._workers)
+            self._workers = []
+        for _ in workers:
+            self._jobs.put(None)
+        for worker in workers:
+            worker.join(timeout=10)
+
+    def _ensure_workers(self):
+        with self._lock:
+            self._workers = [w for w in self._workers if w.is_alive()]
+            while len(self._workers) < self.size:
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    name=f'browser-pool-{len(self._workers)}',
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _fail_pending(self, error: Exception):
+        """Завершает с ошибкой задания из очереди, которые некому выполнить"""
+        stops = 0
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                stops += 1
+                continue
+            job.error = error
+            job.done.set()
+        # Сигналы остановки адресованы другим потокам пула
+        for _ in range(stops):
+            self._jobs.put(None)
+
+    def _record(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _launch(self, playwright):
+        started = time.monotonic()
+        browser = playwright.chromium.launch(**self.launch_options)
+        launch_time = time.monotonic() - started
+        self._record(launches=1, launch_time_total=launch_time)
+        with self._lock:
+            self._stats['launch_time_last'] = launch_time
+        logger.info(f"Browser pool: launched chromium in {launch_time:.2f}s")
+        return _PooledBrowser(browser, launch_time)
+
+    def _close(self, pooled):
+        try:
+            pooled.browser.close()
+        except Exception as e:
+            logger.warning(f"Browser pool: failed to close browser: {e}")
+
+    def _checkout(self, playwright, pooled):
+        """Возвращает пригодный браузер: теплый, либо перезапущенный"""
+        if pooled is not None and not pooled.browser.is_connected():
+            logger.warning("Browser pool: browser crashed, relaunching")
+            self._record(crashed=1)
+            pooled = None
+        elif pooled is not None and pooled.uses >= self.max_uses:
+            logger.info(f"Browser pool: recycling browser after {pooled.uses} uses")
+            self._record(recycled=1)
+            self._close(pooled)
+            pooled = None
+
+        if pooled is None:
+            self._record(misses=1)
+            return self._launch(playwright)
+
+        self._record(hits=1)
+        return pooled
+
+    def _worker_loop(self):
+        try:
+            # Процесс драйвера этого потока убивается при таймауте задания
+            playwright, driver_pid = _start_playwright()
+        except Exception as e:
+            logger.error(f"Browser pool: failed to start playwright: {e}")
+            self._fail_pending(e)
+            return
+        pooled = None
+        try:
+            # Прогреваем браузер заранее, чтобы первый тест не ждал запуска
+            try:
+                pooled = self._launch(playwright)
+            except Exception as e:
+                logger.error(f"Browser pool: warm-up failed: {e}")
+
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                if job.aborted:
+                    # Вызывающий уже не ждет это задание
+                    job.done.set()
+                    continue
+
+                job.driver_pid = driver_pid
+                context = None
+                try:
+                    pooled = self._checkout(playwright, pooled)
+                    pooled.uses += 1
+                    context = pooled.browser.new_context(**job.context_options)
+                    job.result = job.func(pooled.browser, context)
+                except Exception as e:
+                    job.error = e
+                finally:
+                    if context is not None:
+                        try:
+                            context.close()
+                        except Exception as e:
+                            logger.warning(f"Browser pool: failed to close context: {e}")
+                    job.done.set()
+
+                if job.killed:
+                    # Драйвер убит, поток завершается, _ensure_workers запустит новый
+                    pooled = None
+                    break
+        finally:
+            if pooled is not None:
+                self._close(pooled)
+            try:
+                playwright.stop()
+            except Exception as e:
+                logger.warning(f"Browser pool: failed to stop playwright: {e}")
+
+
+_driver_start_lock = threading.Lock()
+
+
+def _start_playwright():
+    """Запускает Playwright; возвращает его и PID процесса драйвера (None, если не определен)"""
+    from playwright.sync_api import sync_playwright
+
+    # Запуски сериализуются, чтобы новый дочерний процесс однозначно принадлежал этому драйверу
+    with _driver_start_lock:
+        before = set(child_pids(os.getpid(), recursive=False))
+        playwright = sync_playwright().start()
+        started = set(child_pids(os.getpid(), recursive=False)) - before
+    return playwright, _driver_pid(playwright, started)
+
+
+def _driver_pid(playwright, started=()) -> Optional[int]:
+    """
+    PID процесса драйвера Playwright (node), запущенного для этого экземпляра.
+    Берется из транспорта соединения: sync API не дает публичного доступа к процессу.
+    Если внутреннее устройство Playwright изменилось, драйвером считается единственный
+    дочерний процесс, появившийся при запуске (started)
+    """
+    try:
+        pid = playwright._impl_obj._connection._transport._proc.pid
+    except Exception:
+        pid = None
+    if isinstance(pid, int):
+        return pid
+    if len(started) == 1:
+        return next(iter(started))
+    logger.warning("Browser pool: failed to get playwright driver pid, hung jobs will not be killed")
+    return None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_browser_pool(**launch_options) -> BrowserPool:
+    """
+    Возвращает пул браузеров текущего процесса для заданных параметров запуска.
+    После fork (prefork-воркеры Celery) пул создается заново.
+    """
+    key = json.dumps(launch_options, sort_keys=True, default=str)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool = BrowserPool(launch_options=launch_options)
+            _pools[key] = pool
+        return pool
+
+
+def shutdown_browser_pools():
+    """Останавливает пулы браузеров текущего процесса (при завершении процесса-хоста)"""
+    with _pools_lock:
+        pools = [pool for pool in _pools.values() if pool.pid == os.getpid()]
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
@@ -0,0 +1,146 @@
+import logging
+from typing import Iterable, Set
+from django.conf import settings
+from django.utils import timezone
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from FlowTest.celery import app
+from ..models import SuiteRun, TestRun
+from .fair_share import FairShareDispatcher
+from .execution_cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Статусы запусков, которые еще можно отменить (in_progress выставляет TestRunner)
+ACTIVE_STATUSES = ['pending', 'running', 'in_progress']
+
+# Статусы запусков, ожидающих начала выполнения
+STARTABLE_STATUSES = ('pending',)
+
+# Флаги отмены в общем кэше, их опрашивают исполнители на воркерах
+TEST_RUN_CANCEL_KEY = 'execution:cancel:test_run:{id}'
+SUITE_RUN_CANCEL_KEY = 'execution:cancel:suite_run:{id}'
+CANCEL_FLAG_TTL = 24 * 60 * 60
+
+CANCEL_REASON = 'Cancelled by user'
+
+
+class ExecutionCancelled(Exception):
+    """Выполнение теста отменено пользователем"""
+
+    def __init__(self):
+        super().__init__(CANCEL_REASON)
+
+
+def cancel_test_runs(test_run_ids: Iterable[int], reason: str = CANCEL_REASON) -> int:
+    """
+    Отменяет запуски: выставляет флаги отмены для исполнителей, отзывает
+    задачи Celery из очереди и одним запросом переводит строки в cancelled.
+    Возвращает количество отмененных запусков.
+    """
+    runs = list(
+        TestRun.objects.filter(id__in=list(test_run_ids), status__in=ACTIVE_STATUSES)
+        .values_list('id', 'celery_task_id')
+    )
+    if not runs:
+        return 0
+
+    ids = [run_id for run_id, _ in runs]
+    cache.set_many({TEST_RUN_CANCEL_KEY.format(id=run_id): True for run_id in ids}, CANCEL_FLAG_TTL)
+
+    # Задачи, которые еще в очереди, воркер пропустит; выполняющиеся
+    # завершаются сами, увидев флаг, вместе с деревом процессов теста
+    task_ids = [task_id for _, task_id in runs if task_id]
+    if task_ids:
+        app.control.revoke(task_ids)
+
+    cancelled = TestRun.objects.filter(id__in=ids, status__in=ACTIVE_STATUSES).update(
+        status='cancelled',
+        finished_at=timezone.now(),
+        error_message=reason
+    )
+
+    channel_layer = get_channel_layer()
+    if channel_layer:
+        for run_id in ids:
+            async_to_sync(channel_layer.group_send)(
+                f'test_execution_{run_id}',
+                {
+                    'type': 'test_update',
+                    'data': {'status': 'cancelled', 'message': reason}
+                }
+            )
+    logger.info(f"Cancelled {cancelled} test runs, revoked {len(task_ids)} tasks")
+    return cancelled
+
+
+def cancel_suite_run(suite_run: SuiteRun) -> bool:
+    """
+    Отменяет пакетный прогон: шарды, ждущие слота, убираются из очереди справедливого
+    распределения, шарды в брокере отзываются, выполняющиеся останавливаются
+    """
+    cache.set(SUITE_RUN_CANCEL_KEY.format(id=suite_run.id), True, CANCEL_FLAG_TTL)
+
+    task_ids = [shard['task_id'] for shard in suite_run.shards if shard.get('task_id')]
+    FairShareDispatcher.cancel(task_ids)
+    if suite_run.task_id:
+        task_ids.append(suite_run.task_id)
+    if task_ids:
+        app.control.revoke(task_ids)
+
+    return bool(SuiteRun.objects.filter(
+        id=suite_run.id, status__in=['pending', 'running']
+    ).update(status='cancelled', finished_at=timezone.now(), error_message=CANCEL_REASON))
+
+
+def is_cancel_requested(test_run_id: int) -> bool:
+    try:
+        return bool(cache.get(TEST_RUN_CANCEL_KEY.format(id=test_run_id)))
+    except Exception as e:
+        logger.warning(f"Failed to check cancellation of test run {test_run_id}: {e}")
+        return False
+
+
+def cancelled_test_run_ids(test_run_ids: Iterable[int]) -> Set[int]:
+    """Запуски из списка, для которых запрошена отмена; один запрос к кэшу"""
+    keys = {TEST_RUN_CANCEL_KEY.format(id=run_id): run_id for run_id in test_run_ids}
+    if not keys:
+        return set()
+    try:
+        return {keys[key] for key, value in cache.get_many(list(keys)).items() if value}
+    except Exception as e:
+        logger.warning(f"Failed to check cancellation of test runs: {e}")
+        return set()
+
+
+def is_suite_cancel_requested(suite_run_id: int) -> bool:
+    try:
+        return bool(cache.get(SUITE_RUN_CANCEL_KEY.format(id=suite_run_id)))
+    except Exception as e:
+        logger.warning(f"Failed to check cancellation of suite run {suite_run_id}: {e}")
+        return False
+
+
+def mark_running(test_run_id: int) -> bool:
+    """
+    Переводит ожидающий запуск в running. False - запуск отменен или уже взят
+    другой доставкой задачи (повтор после гибели воркера), выполнять его не нужно
+    """
+    return bool(
+        TestRun.objects.filter(id=test_run_id, status__in=STARTABLE_STATUSES).update(
+            status='running',
+            started_at=timezone.now()
+        )
+    )
+
+
+def mark_finished(test_run_id: int, status: str, **fields) -> bool:
+    """
+    Записывает итог выполнявшегося запуска. False - запуск отменили после завершения
+    процесса теста, статус cancelled не перезаписывается
+    """
+    return bool(TestRun.objects.filter(id=test_run_id, status='running').update(status=status, **fields))
+
+
+def get_poll_interval() -> float:
+    return getattr(settings, 'EXECUTION_CANCEL_POLL_INTERVAL', 1.0)
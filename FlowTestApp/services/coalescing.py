@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Callable, Iterable, NamedTuple, Optional, Tuple
+from django.conf import settings
+from django.utils import timezone
+from ..models import AutomationProject, ExecutionProfile, TestCase, TestRun
+from .cancellation import ACTIVE_STATUSES, get_poll_interval
+from .execution_cache import cache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+# Реестр выполняющихся запусков в общем кэше: отпечаток работы -> запуск
+INFLIGHT_KEY = 'execution:inflight:{fingerprint}'
+IDEMPOTENCY_KEY = 'execution:idempotency:{user}:{scope}'
+IDEMPOTENCY_TTL = 24 * 60 * 60
+
+# Сколько хранится результат синхронного запуска для присоединившихся запросов
+COALESCED_RESULT_TTL = 60
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def test_run_fingerprint(test_case: TestCase, profile: Optional[ExecutionProfile] = None) -> str:
+    """Отпечаток запуска теста: тест, хэш его кода, коммит репозитория и профиль"""
+    code_hash = hashlib.sha256((test_case.test_code or '').encode('utf-8')).hexdigest()
+    commit = test_case.automation_project.last_commit_sha if test_case.automation_project_id else None
+    return _digest('test_case', test_case.id, code_hash, commit, profile.id if profile else None)
+
+
+def batch_fingerprint(project: AutomationProject, test_ids: Iterable[int],
+                      profile: Optional[ExecutionProfile] = None, distributed: bool = False) -> str:
+    """Отпечаток запуска набора тестов проекта автоматизации на текущем коммите"""
+    return _digest(
+        'batch', project.id, sorted(int(test_id) for test_id in test_ids),
+        project.last_commit_sha, profile.id if profile else None, distributed
+    )
+
+
+class IdempotencyKeyReused(Exception):
+    """Ключ идемпотентности повторно использован с другим запросом"""
+
+    def __init__(self):
+        super().__init__(f"{IDEMPOTENCY_HEADER} was already used with a different request")
+
+
+class IdempotencyKey(NamedTuple):
+    """Ключ идемпотентности в кэше и отпечаток запроса, с которым он использован"""
+    key: str
+    fingerprint: str
+
+
+def get_idempotency_key(request) -> Optional[IdempotencyKey]:
+    """
+    Ключ идемпотентности из заголовка Idempotency-Key. Ключ отдельный для каждого
+    пользователя и endpoint (путь содержит тест или проект), отпечаток - метод,
+    путь и тело запроса: повтор ключа с другим запросом отклоняется.
+    """
+    value = request.headers.get(IDEMPOTENCY_HEADER)
+    if not value:
+        return None
+    user = request.user.id if getattr(request, 'user', None) and request.user.is_authenticated else 'anonymous'
+    endpoint = f'{request.method} {request.path}'
+    return IdempotencyKey(
+        key=IDEMPOTENCY_KEY.format(user=user, scope=_digest(endpoint, value.strip())),
+        fingerprint=_digest(endpoint, request.data)
+    )
+
+
+def _get_idempotent(idempotency_key: IdempotencyKey):
+    """Сохраненный ответ на запрос с этим ключом; None - ключ еще не использовался"""
+    stored = cache.get(idempotency_key.key)
+    if stored is None:
+        return None
+    if stored['fingerprint'] != idempotency_key.fingerprint:
+        raise IdempotencyKeyReused()
+    return stored['value']
+
+
+def _set_idempotent(idempotency_key: IdempotencyKey, value):
+    cache.set(
+        idempotency_key.key,
+        {'fingerprint': idempotency_key.fingerprint, 'value': value},
+        IDEMPOTENCY_TTL
+    )
+
+
+def channel_group(test_run_id: int) -> str:
+    """Группа channels, в которую исполнитель отправляет обновления запуска"""
+    return f'test_execution_{test_run_id}'
+
+
+def _active_run(test_run_id) -> Optional[TestRun]:
+    if not test_run_id:
+        return None
+    return TestRun.objects.filter(id=test_run_id, status__in=ACTIVE_STATUSES).first()
+
+
+def _claim(key: str, test_run: TestRun) -> TestRun:
+    """
+    Регистрирует запуск как выполняющийся. Если другой запрос успел раньше
+    и его запуск еще не завершен, возвращается его запуск.
+    """
+    ttl = settings.EXECUTION_TEST_TIMEOUT * 2
+    if cache.add(key, test_run.id, ttl):
+        return test_run
+    winner = _active_run(cache.get(key))
+    if winner is not None:
+        return winner
+    # В реестре остался завершенный запуск
+    cache.set(key, test_run.id, ttl)
+    return test_run
+
+
+def start_test_run(test_case: TestCase, profile: Optional[ExecutionProfile] = None,
+                   idempotency_key: Optional[IdempotencyKey] = None) -> Tuple[TestRun, bool]:
+    """
+    Ставит запуск теста в очередь interactive или присоединяет запрос к уже
+    выполняющемуся запуску той же работы. Повтор запроса с тем же ключом
+    идемпотентности возвращает тот же запуск, даже если он уже завершен; повтор
+    ключа с другим запросом - IdempotencyKeyReused.
+    Возвращает запуск и признак присоединения к существующему.
+    """
+    from ..tasks import execute_test
+
+    if idempotency_key:
+        test_run = TestRun.objects.filter(id=_get_idempotent(idempotency_key) or 0).first()
+        if test_run is not None:
+            return test_run, True
+
+    key = INFLIGHT_KEY.format(fingerprint=test_run_fingerprint(test_case, profile))
+    test_run = _active_run(cache.get(key))
+    coalesced = test_run is not None
+    if not coalesced:
+        # Идентификатор задачи сохраняется вместе с запуском, чтобы отмена могла отозвать ее из очереди
+        task_id = str(uuid.uuid4())
+        created = TestRun.objects.create(
+            test_case=test_case,
+            status='pending',
+            started_at=timezone.now(),
+            execution_profile=profile,
+            celery_task_id=task_id
+        )
+        test_run = _claim(key, created)
+        if test_run is created:
+            execute_test.apply_async(args=[created.id], task_id=task_id)
+        else:
+            created.delete()
+            coalesced = True
+
+    if coalesced:
+        logger.info(f"Request for test case {test_case.id} attached to test run {test_run.id}")
+    if idempotency_key:
+        _set_idempotent(idempotency_key, test_run.id)
+    return test_run, coalesced
+
+
+def run_coalesced(fingerprint: str, func: Callable,
+                  idempotency_key: Optional[IdempotencyKey] = None) -> Tuple[object, bool]:
+    """
+    Выполняет синхронный запуск func один раз на все одинаковые одновременные запросы:
+    первый запрос выполняет, остальные ждут и получают его результат.
+    Результат должен сериализоваться в кэш. Возвращает результат и признак присоединения.
+    """
+    if idempotency_key:
+        stored = _get_idempotent(idempotency_key)
+        if stored is not None:
+            return stored, True
+
+    result, coalesced = _coalesce_call(INFLIGHT_KEY.format(fingerprint=fingerprint), func)
+    if idempotency_key:
+        _set_idempotent(idempotency_key, result)
+    return result, coalesced
+
+
+def _coalesce_call(key: str, func: Callable) -> Tuple[object, bool]:
+    token = str(uuid.uuid4())
+    if cache.add(key, token, settings.EXECUTION_BATCH_TIMEOUT):
+        try:
+            result = func()
+            cache.set(f'{key}:result:{token}', result, COALESCED_RESULT_TTL)
+            return result, False
+        finally:
+            cache.delete(key)
+
+    # Результат ищется по токену владельца, чтобы не получить результат прошлого запуска
+    owner = cache.get(key)
+    deadline = time.monotonic() + settings.EXECUTION_BATCH_TIMEOUT
+    while owner and time.monotonic() < deadline:
+        time.sleep(get_poll_interval())
+        result = cache.get(f'{key}:result:{owner}')
+        if result is not None:
+            return result, True
+        if cache.get(key) != owner:
+            break
+
+    # Владелец завершился без результата (ошибка) - выполняем сами
+    result = cache.get(f'{key}:result:{owner}') if owner else None
+    if result is not None:
+        return result, True
+    return func(), False
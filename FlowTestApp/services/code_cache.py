@@ -0,0 +1,123 @@
+import hashlib
+import importlib.util
+import logging
+import marshal
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from types import CodeType
+from typing import Optional
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Имя файла в трассировках ошибок кода теста
+CODE_FILENAME = '<test_code>'
+
+
+def code_hash(source: str) -> str:
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def describe_syntax_error(error: Exception) -> str:
+    """
+    Сообщение об ошибке компиляции кода теста: для SyntaxError с позицией.
+    compile() выбрасывает ValueError, например, для нулевых байтов в исходном тексте
+    """
+    if isinstance(error, SyntaxError) and error.lineno is not None:
+        return f"{error.msg} (line {error.lineno}, column {error.offset})"
+    return getattr(error, 'msg', None) or str(error)
+
+
+class CodeCache:
+    """
+    Кэш скомпилированного кода тестов (TestCase.test_code).
+
+    Ключ - sha256 исходного текста. Объекты кода хранятся в памяти процесса
+    (LRU на size записей) и на диске в формате marshal, поэтому процессы
+    воркеров и зиготы получают код без повторного разбора. Файлы на диске
+    лежат в каталоге версии байткода интерпретатора: marshal не переносим
+    между версиями Python.
+    """
+
+    def __init__(self, directory: Optional[str] = None, size: Optional[int] = None):
+        self.size = size or settings.TEST_CODE_CACHE_SIZE
+        directory = directory or settings.TEST_CODE_CACHE_DIR
+        self.directory = os.path.join(directory, importlib.util.MAGIC_NUMBER.hex()) if directory else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Optional[str]:
+        return os.path.join(self.directory, key[:2], f'{key}.bin') if self.directory else None
+
+    def get(self, source: str) -> CodeType:
+        """Объект кода для исходного текста; SyntaxError или ValueError, если код не компилируется"""
+        key = code_hash(source)
+        with self._lock:
+            code = self._memory.get(key)
+            if code is not None:
+                self._memory.move_to_end(key)
+                return code
+
+        code = self._load(key)
+        if code is None:
+            code = compile(source, CODE_FILENAME, 'exec')
+            self._store(key, code)
+
+        with self._lock:
+            self._memory[key] = code
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.size:
+                self._memory.popitem(last=False)
+        return code
+
+    def _load(self, key: str) -> Optional[CodeType]:
+        path = self._path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            logger.warning(f"Test code cache: failed to load {path}: {e}")
+            return None
+
+    def _store(self, key: str, code: CodeType):
+        """Атомарно записывает объект кода на диск: читатели не видят недописанный файл"""
+        path = self._path(key)
+        if not path:
+            return
+        temp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(code, f)
+            os.replace(temp_path, path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Test code cache: failed to store {path}: {e}")
+            # Недописанный временный файл иначе остается в каталоге кэша
+            if temp_path and os.path.exists(temp_path):
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_code_cache() -> CodeCache:
+    """Кэш кода тестов текущего процесса"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CodeCache()
+    return _cache
+
+
+def compile_test_code(source: Optional[str]) -> CodeType:
+    """Скомпилированный код теста из кэша; SyntaxError или ValueError, если код не компилируется"""
+    return get_code_cache().get(source or '')
@@ -0,0 +1,213 @@
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from django.conf import settings
+from .async_engine import get_default_concurrency
+from .execution_cache import cache
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# Имена процессов браузеров, которые запускают тесты
+BROWSER_PROCESS_NAMES = ('chrome', 'chromium', 'headless_shell', 'firefox', 'webkit', 'msedge')
+
+# Ключи кэша с состоянием контроллеров воркеров
+CACHE_KEY_HOSTS = 'execution:concurrency:hosts'
+CACHE_KEY_HOSTS_LOCK = 'execution:concurrency:hosts:lock'
+CACHE_KEY_STATE = 'execution:concurrency:{host}'
+HOSTS_LOCK_TTL = 5
+
+
+def _update_hosts(update: Callable[[List[str]], List[str]]):
+    """
+    Изменяет список контроллеров в кэше под блокировкой: одновременная регистрация
+    нескольких воркеров и очистка устаревших записей не теряют изменения друг друга
+    """
+    deadline = time.monotonic() + HOSTS_LOCK_TTL
+    while not cache.add(CACHE_KEY_HOSTS_LOCK, True, HOSTS_LOCK_TTL):
+        if time.monotonic() >= deadline:
+            raise TimeoutError("Concurrency hosts lock is busy")
+        time.sleep(0.05)
+    try:
+        hosts = cache.get(CACHE_KEY_HOSTS) or []
+        updated = update(hosts)
+        if updated != hosts:
+            cache.set(CACHE_KEY_HOSTS, updated, None)
+    finally:
+        cache.delete(CACHE_KEY_HOSTS_LOCK)
+
+
+def _is_browser(name: str) -> bool:
+    name = name.lower()
+    return any(browser in name for browser in BROWSER_PROCESS_NAMES)
+
+
+def sample_host_load() -> Dict:
+    """
+    Снимает загрузку машины: CPU и память в процентах, число процессов браузеров.
+    Без psutil используются /proc и loadavg, недоступные значения возвращаются как None.
+    """
+    if psutil is not None:
+        browsers = 0
+        for process in psutil.process_iter(['name']):
+            if _is_browser(process.info.get('name') or ''):
+                browsers += 1
+        return {
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory_percent': psutil.virtual_memory().percent,
+            'browser_processes': browsers
+        }
+
+    cpu_percent = None
+    try:
+        cpu_percent = min(100.0, os.getloadavg()[0] / (os.cpu_count() or 1) * 100)
+    except (AttributeError, OSError):
+        pass
+
+    memory_percent = None
+    try:
+        meminfo = {}
+        with open('/proc/meminfo') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                meminfo[key] = int(value.split()[0])
+        memory_percent = (1 - meminfo['MemAvailable'] / meminfo['MemTotal']) * 100
+    except (OSError, KeyError, ValueError):
+        pass
+
+    browsers = None
+    if os.path.isdir('/proc'):
+        browsers = 0
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f'/proc/{pid}/comm') as f:
+                    if _is_browser(f.read().strip()):
+                        browsers += 1
+            except OSError:
+                continue
+
+    return {
+        'cpu_percent': cpu_percent,
+        'memory_percent': memory_percent,
+        'browser_processes': browsers
+    }
+
+
+class AdaptiveConcurrencyController:
+    """
+    Подбор числа одновременных тестов по загрузке машины (AIMD).
+
+    Пока CPU, память и число процессов браузеров ниже порогов и все слоты
+    заняты, лимит растет на increase_step. При превышении любого порога
+    лимит умножается на decrease_factor. Лимит остается в границах
+    [min_limit, max_limit], текущее значение и причины публикуются в кэш.
+    """
+
+    def __init__(self, min_limit: Optional[int] = None, max_limit: Optional[int] = None,
+                 initial: Optional[int] = None, increase_step: int = 1, decrease_factor: float = 0.5,
+                 cpu_high: Optional[float] = None, memory_high: Optional[float] = None,
+                 browser_limit: Optional[int] = None, interval: Optional[float] = None):
+        self.min_limit = min_limit or getattr(settings, 'EXECUTION_CONCURRENCY_MIN', 1)
+        self.max_limit = max(self.min_limit, max_limit or get_default_concurrency())
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.cpu_high = cpu_high or getattr(settings, 'EXECUTION_CPU_HIGH_PERCENT', 85)
+        self.memory_high = memory_high or getattr(settings, 'EXECUTION_MEMORY_HIGH_PERCENT', 85)
+        self.browser_limit = (
+            browser_limit or getattr(settings, 'EXECUTION_BROWSER_PROCESS_LIMIT', 0) or (os.cpu_count() or 1) * 6
+        )
+        self.interval = interval or getattr(settings, 'EXECUTION_CONCURRENCY_INTERVAL', 2.0)
+        self.limit = min(self.max_limit, max(self.min_limit, initial or os.cpu_count() or 1))
+        self.host = socket.gethostname()
+        self.reasons: List[str] = []
+        self.load: Dict = {}
+        self.updated_at = None
+        self._lock = threading.Lock()
+
+        if psutil is not None:
+            # Первый вызов cpu_percent(interval=None) всегда возвращает 0
+            psutil.cpu_percent(interval=None)
+
+    def adjust(self, in_flight: int) -> int:
+        """Снимает загрузку, пересчитывает лимит и возвращает его"""
+        load = sample_host_load()
+        reasons = []
+        if load['cpu_percent'] is not None and load['cpu_percent'] >= self.cpu_high:
+            reasons.append(f"cpu {load['cpu_percent']:.0f}% >= {self.cpu_high}%")
+        if load['memory_percent'] is not None and load['memory_percent'] >= self.memory_high:
+            reasons.append(f"memory {load['memory_percent']:.0f}% >= {self.memory_high}%")
+        if load['browser_processes'] is not None and load['browser_processes'] >= self.browser_limit:
+            reasons.append(f"browser processes {load['browser_processes']} >= {self.browser_limit}")
+
+        with self._lock:
+            previous = self.limit
+            if reasons:
+                self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+                reasons.insert(0, 'decrease')
+            elif in_flight >= self.limit and self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + self.increase_step)
+                reasons = ['increase', 'all slots busy, host load below thresholds']
+            else:
+                reasons = ['hold', 'at max limit' if self.limit >= self.max_limit else 'free slots available']
+
+            self.reasons = reasons
+            self.load = load
+            self.updated_at = time.time()
+            limit = self.limit
+
+        if limit != previous:
+            logger.info(f"Concurrency limit {previous} -> {limit}: {', '.join(reasons)}")
+        self.publish(in_flight)
+        return limit
+
+    def state(self, in_flight: Optional[int] = None) -> Dict:
+        with self._lock:
+            return {
+                'host': self.host,
+                'pid': os.getpid(),
+                'limit': self.limit,
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'in_flight': in_flight,
+                'reasons': list(self.reasons),
+                'load': dict(self.load),
+                'thresholds': {
+                    'cpu_percent': self.cpu_high,
+                    'memory_percent': self.memory_high,
+                    'browser_processes': self.browser_limit
+                },
+                'updated_at': self.updated_at
+            }
+
+    def publish(self, in_flight: Optional[int] = None):
+        """Сохраняет состояние в кэш, чтобы его видел API на любом узле"""
+        key = f'{self.host}:{os.getpid()}'
+        try:
+            cache.set(CACHE_KEY_STATE.format(host=key), self.state(in_flight), timeout=self.interval * 10)
+            if key not in (cache.get(CACHE_KEY_HOSTS) or []):
+                _update_hosts(lambda hosts: hosts if key in hosts else hosts + [key])
+        except Exception as e:
+            logger.warning(f"Failed to publish concurrency state: {e}")
+
+
+def get_concurrency_states() -> List[Dict]:
+    """Текущие состояния контроллеров всех воркеров; устаревшие записи отбрасываются"""
+    hosts = cache.get(CACHE_KEY_HOSTS) or []
+    states = cache.get_many([CACHE_KEY_STATE.format(host=host) for host in hosts])
+    expired = {host for host in hosts if CACHE_KEY_STATE.format(host=host) not in states}
+    if expired:
+        # Воркеры, зарегистрировавшиеся после чтения списка, остаются в нем
+        try:
+            _update_hosts(lambda current: [host for host in current if host not in expired])
+        except Exception as e:
+            logger.warning(f"Failed to prune concurrency hosts: {e}")
+    return list(states.values())
@@ -0,0 +1,235 @@
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+from typing import Dict, List, Optional
+from celery.signals import worker_ready
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from ..models import TestEvent
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = '.jsonl'
+
+
+def _spool_name(test_run_id: int) -> str:
+    # Имя файла содержит хост и процесс: по ним replay_spool отличает брошенные файлы от живых
+    return f'{socket.gethostname()}-{os.getpid()}-{test_run_id}{SPOOL_SUFFIX}'
+
+
+def _serialize(event: TestEvent) -> Dict:
+    return {
+        'test_case_id': event.test_case_id,
+        'test_report_id': event.test_report_id,
+        'event_type': event.event_type,
+        'description': event.description,
+        'severity': event.severity,
+        'details': event.details,
+        'timestamp': event.timestamp.isoformat(),
+    }
+
+
+def _deserialize(data: Dict) -> TestEvent:
+    return TestEvent(
+        test_case_id=data['test_case_id'],
+        test_report_id=data['test_report_id'],
+        event_type=data['event_type'],
+        description=data['description'],
+        severity=data['severity'],
+        details=data['details'],
+        timestamp=parse_datetime(data['timestamp'])
+    )
+
+
+def _insert(events: List[TestEvent]):
+    """Вставляет события одним запросом, время событий сохраняется исходным"""
+    TestEvent.objects.bulk_create(events)
+
+
+def event_update(event: TestEvent, status: Optional[str]) -> Dict:
+    """Обновление для группы test_execution_{id} о событии запуска"""
+    return {
+        'event': {
+            'type': event.event_type,
+            'description': event.description,
+            'severity': event.severity,
+            'timestamp': event.timestamp.isoformat()
+        },
+        'status': status
+    }
+
+
+class EventBuffer:
+    """
+    Отложенная запись событий одного запуска теста.
+
+    Событие сразу дописывается в файл спула и попадает в буфер; буфер сбрасывается
+    в TestEvent одним bulk_create, когда в нем накопилось max_events событий, через
+    flush_interval секунд после первого несброшенного события или при close().
+    Обновления для группы test_execution_{id} за это время объединяются в одно
+    сообщение. После успешной записи спул очищается, при close() удаляется;
+    спул процесса, который завершился не закрыв буфер, дописывает replay_spool.
+    """
+
+    def __init__(self, test_run_id: int, max_events: Optional[int] = None, flush_interval: Optional[float] = None,
+                 spool_dir: Optional[str] = None):
+        self.test_run_id = test_run_id
+        self.max_events = max_events or settings.EVENT_BUFFER_SIZE
+        self.flush_interval = flush_interval or settings.EVENT_BUFFER_FLUSH_INTERVAL
+        self.channel_layer = get_channel_layer()
+        self._events = []
+        self._updates = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self._closed = False
+
+        spool_dir = spool_dir or settings.EVENT_SPOOL_DIR
+        os.makedirs(spool_dir, exist_ok=True)
+        self.spool_path = os.path.join(spool_dir, _spool_name(test_run_id))
+        self._spool = open(self.spool_path, 'a', encoding='utf-8')
+
+    def add(self, event: Optional[TestEvent], update: Optional[Dict] = None):
+        """
+        Добавляет несохраненное событие и обновление для подписчиков.
+        Без события (event=None) в буфер попадает только обновление, например смена статуса
+        """
+        if event is not None and event.timestamp is None:
+            event.timestamp = timezone.now()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"Event buffer of test run {self.test_run_id} is closed")
+            if event is not None:
+                self._spool.write(json.dumps(_serialize(event), default=str) + '\n')
+                self._spool.flush()
+                self._events.append(event)
+            if update is not None:
+                self._updates.append(update)
+            full = len(self._events) >= self.max_events
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        finally:
+            # Соединение с БД потока таймера иначе останется открытым
+            connections.close_all()
+
+    def flush(self):
+        """Записывает накопленные события и отправляет объединенное обновление"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            events, updates = self._events, self._updates
+            if not events and not updates:
+                return
+            try:
+                if events:
+                    _insert(events)
+            except Exception as e:
+                # События остаются в буфере и спуле до следующей попытки
+                logger.error(f"Failed to flush {len(events)} events of test run {self.test_run_id}: {e}")
+                return
+            self._events, self._updates = [], []
+            self._spool.seek(0)
+            self._spool.truncate()
+
+        self._send(updates)
+
+    def _send(self, updates: List[Dict]):
+        if not updates or not self.channel_layer:
+            return
+        data = dict(updates[-1])
+        events = [update['event'] for update in updates if update.get('event')]
+        if len(events) > 1:
+            data['events'] = events
+        try:
+            async_to_sync(self.channel_layer.group_send)(
+                f'test_execution_{self.test_run_id}',
+                {'type': 'test_update', 'data': data}
+            )
+        except Exception as e:
+            logger.error(f"Failed to publish events of test run {self.test_run_id}: {e}")
+
+    def close(self):
+        """Сбрасывает буфер в конце теста и удаляет спул, если все события записаны"""
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._spool.close()
+            if not self._events:
+                os.unlink(self.spool_path)
+
+
+def _owner_alive(path: str) -> Optional[bool]:
+    """Работает ли процесс, создавший спул; None - спул другого хоста, процесс отсюда не проверить"""
+    host, pid, _ = os.path.basename(path)[:-len(SPOOL_SUFFIX)].rsplit('-', 2)
+    if host != socket.gethostname():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+def replay_spool(spool_dir: Optional[str] = None, force: bool = False) -> int:
+    """
+    Дописывает в TestEvent события из спулов завершившихся процессов.
+    force - дописать и спулы других хостов. Возвращает количество событий.
+    """
+    spool_dir = spool_dir or settings.EVENT_SPOOL_DIR
+    replayed = 0
+    for path in glob.glob(os.path.join(spool_dir, f'*{SPOOL_SUFFIX}')):
+        alive = _owner_alive(path)
+        if alive or (alive is None and not force):
+            continue
+        # Файл переименовывается перед чтением, чтобы его не дописали два процесса
+        claimed = f'{path}.replay-{os.getpid()}'
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            continue
+
+        events = []
+        with open(claimed, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    events.append(_deserialize(json.loads(line)))
+                except (ValueError, KeyError) as e:
+                    # Последняя строка могла быть дописана не полностью
+                    logger.warning(f"Skipping line {number} of event spool {path}: {e}")
+        try:
+            if events:
+                _insert(events)
+        except Exception as e:
+            logger.error(f"Failed to replay event spool {path}: {e}")
+            os.rename(claimed, path)
+            continue
+        os.unlink(claimed)
+        replayed += len(events)
+        logger.info(f"Replayed {len(events)} events from {path}")
+    return replayed
+
+
+@worker_ready.connect
+def _replay_on_start(**kwargs):
+    # Спулы процессов воркера, завершившихся аварийно, дописываются при старте воркера
+    try:
+        replay_spool()
+    except Exception as e:
+        logger.warning(f"Failed to replay event spool: {e}")
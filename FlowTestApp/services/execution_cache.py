@@ -0,0 +1,7 @@
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+# Кэш координации выполнения тестов, общий для воркеров и веб-серверов (CACHES['execution'])
+EXECUTION_CACHE_ALIAS = 'execution'
+
+cache = ConnectionProxy(caches, EXECUTION_CACHE_ALIAS)
@@ -0,0 +1,243 @@
+import logging
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional
+from celery.signals import task_postrun, task_revoked
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from FlowTest.celery import app
+from ..models import AutomationProject, DispatchQueueItem, Project
+from .execution_cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Блокировка раздачи слотов: раздает один процесс, остальные полагаются на него
+DISPATCH_LOCK_KEY = 'execution:fair_share:lock'
+DISPATCH_LOCK_TTL = 30
+
+# Сколько дней хранить завершенные задачи очереди: по ним определяется очередность round_robin
+HISTORY_DAYS = 1
+
+POLICY_WEIGHTED = 'weighted'
+POLICY_ROUND_ROBIN = 'round_robin'
+
+
+class FairShareDispatcher:
+    """
+    Справедливое распределение общего пула воркеров между проектами.
+
+    Задачи запусков по расписанию и шардов не отправляются в брокер сразу,
+    а ставятся в очередь DispatchQueueItem. Раздача отправляет в Celery не больше
+    FAIR_SHARE_SLOTS задач одновременно, поэтому большой ночной прогон одного
+    проекта не забивает очередь брокера. Свободный слот получает проект:
+    - weighted: с наименьшим числом занятых слотов на единицу веса;
+    - round_robin: дольше всех не получавший слот.
+    Число слотов проекта ограничено Project.max_concurrent_runs.
+    Слот освобождается по сигналу завершения или отзыва задачи.
+    """
+
+    def __init__(self, slots: Optional[int] = None, policy: Optional[str] = None):
+        self.slots = slots or settings.FAIR_SHARE_SLOTS
+        self.policy = policy or settings.FAIR_SHARE_POLICY
+
+    def submit(self, automation_project: AutomationProject, task, args: Optional[List] = None,
+               kwargs: Optional[Dict] = None, task_id: Optional[str] = None) -> DispatchQueueItem:
+        """Ставит задачу Celery в очередь проекта и сразу пытается раздать свободные слоты"""
+        item = DispatchQueueItem.objects.create(
+            project=automation_project.project,
+            automation_project=automation_project,
+            task_name=task.name,
+            args=list(args or []),
+            kwargs=kwargs or {},
+            task_id=task_id or str(uuid.uuid4())
+        )
+        self.dispatch()
+        return item
+
+    def dispatch(self) -> int:
+        """Отправляет задачи на свободные слоты; возвращает число отправленных задач"""
+        if not cache.add(DISPATCH_LOCK_KEY, True, DISPATCH_LOCK_TTL):
+            return 0
+        try:
+            self._expire_stale()
+            return self._dispatch()
+        finally:
+            cache.delete(DISPATCH_LOCK_KEY)
+
+    def _dispatch(self) -> int:
+        in_flight = defaultdict(int)
+        for project_id in DispatchQueueItem.objects.filter(status='dispatched').values_list('project_id', flat=True):
+            in_flight[project_id] += 1
+
+        free = self.slots - sum(in_flight.values())
+        if free <= 0:
+            return 0
+
+        backlog = defaultdict(list)
+        for item in DispatchQueueItem.objects.filter(status='queued').order_by('created_at', 'id'):
+            backlog[item.project_id].append(item)
+        if not backlog:
+            return 0
+
+        quotas = self._quotas(backlog.keys())
+        weights = self._weights(backlog.keys())
+        last_dispatched = self._last_dispatched(backlog.keys())
+
+        dispatched = 0
+        while free > 0:
+            eligible = [
+                project_id for project_id, items in backlog.items()
+                if items and in_flight[project_id] < quotas[project_id]
+            ]
+            if not eligible:
+                break
+
+            project_id = min(eligible, key=lambda pid: self._priority(pid, in_flight, weights, last_dispatched, backlog))
+            item = backlog[project_id].pop(0)
+            if not self._send(item):
+                continue
+
+            in_flight[project_id] += 1
+            last_dispatched[project_id] = item.dispatched_at
+            free -= 1
+            dispatched += 1
+
+        if dispatched:
+            logger.info(f"Fair share: dispatched {dispatched} tasks, {free} slots left")
+        return dispatched
+
+    def _priority(self, project_id, in_flight, weights, last_dispatched, backlog):
+        # Проекты, которые еще не получали слотов, обслуживаются первыми в порядке очереди
+        served = last_dispatched.get(project_id)
+        turn = (served is not None, served or backlog[project_id][0].created_at)
+        if self.policy == POLICY_ROUND_ROBIN:
+            return turn
+        return (in_flight[project_id] / weights[project_id], *turn)
+
+    def _send(self, item: DispatchQueueItem) -> bool:
+        now = timezone.now()
+        # Условное обновление: задачу могли отменить после чтения очереди
+        if not DispatchQueueItem.objects.filter(id=item.id, status='queued').update(status='dispatched', dispatched_at=now):
+            return False
+        item.status, item.dispatched_at = 'dispatched', now
+        try:
+            app.send_task(item.task_name, args=item.args, kwargs=item.kwargs, task_id=item.task_id)
+        except Exception as e:
+            logger.error(f"Fair share: failed to send task {item.task_id}: {e}")
+            DispatchQueueItem.objects.filter(id=item.id).update(status='queued', dispatched_at=None)
+            return False
+        return True
+
+    def _expire_stale(self):
+        """Освобождает слоты задач, о завершении которых воркер не сообщил"""
+        deadline = timezone.now() - timedelta(seconds=settings.FAIR_SHARE_SLOT_TIMEOUT)
+        expired = DispatchQueueItem.objects.filter(status='dispatched', dispatched_at__lt=deadline).update(
+            status='expired', finished_at=timezone.now()
+        )
+        if expired:
+            logger.warning(f"Fair share: released {expired} stale slots")
+
+        DispatchQueueItem.objects.filter(
+            status__in=['finished', 'cancelled', 'expired'],
+            finished_at__lt=timezone.now() - timedelta(days=HISTORY_DAYS)
+        ).delete()
+
+    @staticmethod
+    def _quotas(project_ids) -> Dict:
+        default = settings.FAIR_SHARE_DEFAULT_QUOTA or settings.FAIR_SHARE_SLOTS
+        quotas = defaultdict(lambda: default)
+        for project_id, quota in Project.objects.filter(id__in=[pid for pid in project_ids if pid]).values_list('id', 'max_concurrent_runs'):
+            quotas[project_id] = quota or default
+        return quotas
+
+    @staticmethod
+    def _weights(project_ids) -> Dict:
+        weights = defaultdict(lambda: 1)
+        for project_id, weight in Project.objects.filter(id__in=[pid for pid in project_ids if pid]).values_list('id', 'scheduling_weight'):
+            weights[project_id] = max(1, weight)
+        return weights
+
+    @staticmethod
+    def _last_dispatched(project_ids) -> Dict:
+        rows = DispatchQueueItem.objects.filter(
+            project_id__in=list(project_ids), dispatched_at__isnull=False
+        ).order_by().values('project_id').annotate(last=Max('dispatched_at')).values_list('project_id', 'last')
+        return dict(rows)
+
+    @staticmethod
+    def release(task_id: str, status: str = 'finished') -> bool:
+        """Освобождает слот задачи и раздает его следующей задаче из очереди"""
+        released = DispatchQueueItem.objects.filter(task_id=task_id, status='dispatched').update(
+            status=status, finished_at=timezone.now()
+        )
+        if released:
+            FairShareDispatcher().dispatch()
+        return bool(released)
+
+    @staticmethod
+    def cancel(task_ids: List[str]) -> int:
+        """Убирает из очереди задачи, которые еще не получили слот"""
+        return DispatchQueueItem.objects.filter(task_id__in=list(task_ids), status='queued').update(
+            status='cancelled', finished_at=timezone.now()
+        )
+
+    def snapshot(self) -> Dict:
+        """Текущая доля каждого проекта в пуле и его очередь"""
+        in_flight = defaultdict(int)
+        backlog = defaultdict(int)
+        for project_id, item_status in DispatchQueueItem.objects.filter(
+            status__in=['queued', 'dispatched']
+        ).values_list('project_id', 'status'):
+            if item_status == 'dispatched':
+                in_flight[project_id] += 1
+            else:
+                backlog[project_id] += 1
+
+        project_ids = set(in_flight) | set(backlog)
+        quotas = self._quotas(project_ids)
+        weights = self._weights(project_ids)
+        names = dict(Project.objects.filter(id__in=[pid for pid in project_ids if pid]).values_list('id', 'name'))
+        total_in_flight = sum(in_flight.values())
+        total_weight = sum(weights[pid] for pid in project_ids) or 1
+
+        projects = []
+        for project_id in sorted(project_ids, key=lambda pid: (pid is None, pid)):
+            projects.append({
+                'project_id': project_id,
+                'project_name': names.get(project_id),
+                'weight': weights[project_id],
+                'quota': quotas[project_id],
+                'in_flight': in_flight[project_id],
+                'backlog': backlog[project_id],
+                'share': round(in_flight[project_id] / total_in_flight, 3) if total_in_flight else 0.0,
+                'target_share': round(weights[project_id] / total_weight, 3)
+            })
+
+        return {
+            'policy': self.policy,
+            'slots': self.slots,
+            'in_flight': total_in_flight,
+            'backlog': sum(backlog.values()),
+            'projects': projects
+        }
+
+
+@task_postrun.connect
+def _release_on_finish(task_id=None, **kwargs):
+    try:
+        FairShareDispatcher.release(task_id)
+    except Exception as e:
+        logger.warning(f"Fair share: failed to release slot of task {task_id}: {e}")
+
+
+@task_revoked.connect
+def _release_on_revoke(request=None, **kwargs):
+    task_id = getattr(request, 'id', None)
+    if not task_id:
+        return
+    try:
+        FairShareDispatcher.release(task_id, status='cancelled')
+    except Exception as e:
+        logger.warning(f"Fair share: failed to release slot of task {task_id}: {e}")
@@ -0,0 +1,228 @@
+import ast
+import logging
+import os
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Set
+import git
+from django.conf import settings
+from ..models import AutomationProject, AutomationTest
+from .execution_cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Граф импортов в общем кэше: строится один раз на коммит проекта
+GRAPH_CACHE_KEY = 'impact:graph:{project_id}:{commit}'
+
+# Каталоги, которые не относятся к коду проекта
+SKIP_DIRS = {'.git', '.venv', 'venv', 'env', 'node_modules', '__pycache__', '.tox', '.pytest_cache', 'site-packages'}
+
+# Изменение этих файлов влияет на все тесты
+GLOBAL_FILES = {'pytest.ini', 'setup.cfg', 'tox.ini', 'pyproject.toml', 'setup.py'}
+
+PYTHON_FRAMEWORKS = ('pytest', 'unittest')
+
+
+def _normalize(path: str) -> str:
+    return os.path.normpath(path).replace('\\', '/')
+
+
+def _is_global_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return name in GLOBAL_FILES or (name.startswith('requirements') and name.endswith('.txt'))
+
+
+def _module_names(path: str) -> List[str]:
+    """
+    Имена, под которыми файл можно импортировать: полное имя от корня репозитория
+    и все его суффиксы, так как корнем импорта может быть любой каталог (src/, tests/ и т.п.)
+    """
+    parts = path[:-3].split('/')
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    return ['.'.join(parts[i:]) for i in range(len(parts)) if parts[i:]]
+
+
+def _imported_modules(tree: ast.AST, path: str) -> Set[str]:
+    """Модули, импортируемые файлом; для import a.b.c это a, a.b и a.b.c"""
+    package = path[:-3].split('/')[:-1]
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            targets = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package[:len(package) - node.level + 1] if node.level <= len(package) + 1 else []
+                module = '.'.join(base + ([node.module] if node.module else []))
+            else:
+                module = node.module or ''
+            # from pkg import name: name может быть модулем пакета
+            targets = [module] + [f'{module}.{alias.name}' if module else alias.name for alias in node.names]
+        else:
+            continue
+        for target in targets:
+            parts = [part for part in target.split('.') if part]
+            names.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+    return names
+
+
+def build_import_graph(repo_path: str) -> Dict[str, List[str]]:
+    """
+    Граф импортов Python-файлов репозитория: путь файла -> пути файлов, которые он импортирует.
+    Неоднозначные имена связываются со всеми подходящими файлами: лишний тест
+    в выборке безопаснее пропущенного.
+    """
+    files = []
+    for root, dirs, names in os.walk(repo_path):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in names:
+            if name.endswith('.py'):
+                files.append(_normalize(os.path.relpath(os.path.join(root, name), repo_path)))
+
+    index = defaultdict(set)
+    for path in files:
+        for name in _module_names(path):
+            index[name].add(path)
+
+    graph = {}
+    for path in files:
+        try:
+            with open(os.path.join(repo_path, path), 'rb') as f:
+                tree = ast.parse(f.read(), filename=path)
+        except (SyntaxError, ValueError, OSError) as e:
+            logger.warning(f"Impact analysis: failed to parse {path}: {e}")
+            graph[path] = []
+            continue
+        imported = set()
+        for module in _imported_modules(tree, path):
+            imported.update(index.get(module, ()))
+        imported.discard(path)
+        graph[path] = sorted(imported)
+    return graph
+
+
+def get_changed_files(repo: git.Repo, previous: Optional[str], current: str) -> Optional[List[str]]:
+    """Файлы, измененные между коммитами; None, если изменения определить нельзя"""
+    if not previous:
+        return None
+    if previous == current:
+        return []
+    try:
+        return [_normalize(path) for path in repo.git.diff('--name-only', previous, current).splitlines() if path]
+    except git.exc.GitCommandError as e:
+        logger.warning(f"Impact analysis: failed to diff {previous}..{current}: {e}")
+        return None
+
+
+class ImpactAnalyzer:
+    """
+    Выбор тестов, затронутых изменениями с коммита, проверенного предыдущим запуском.
+
+    Изменения берутся из git diff между этим коммитом и коммитом последней синхронизации,
+    поэтому несколько синхронизаций между запусками не теряют изменений.
+    Тест затронут, если его файл изменен или транзитивно импортирует
+    измененный модуль; изменение conftest.py затрагивает все тесты его каталога.
+    Если изменения неизвестны, граф импортов не соответствует рабочей копии,
+    изменены общие файлы конфигурации или проект не на Python, выбирается весь набор.
+    """
+
+    def __init__(self, project: AutomationProject):
+        self.project = project
+
+    def get_graph(self) -> Optional[Dict[str, List[str]]]:
+        """Граф импортов для текущего коммита; None, если рабочая копия ему не соответствует"""
+        commit = self.project.last_commit_sha
+        if not commit or not self.project.local_path or not os.path.isdir(self.project.local_path):
+            return None
+
+        key = GRAPH_CACHE_KEY.format(project_id=self.project.id, commit=commit)
+        graph = cache.get(key)
+        if graph is not None:
+            return graph
+
+        try:
+            head = git.Repo(self.project.local_path).head.commit.hexsha
+        except Exception as e:
+            logger.warning(f"Impact analysis: failed to read HEAD of project {self.project.id}: {e}")
+            return None
+        if head != commit:
+            # Рабочую копию изменили после синхронизации: граф устарел
+            return None
+
+        graph = build_import_graph(self.project.local_path)
+        cache.set(key, graph, settings.IMPACT_GRAPH_CACHE_TTL)
+        return graph
+
+    def changed_since(self, commit: Optional[str]) -> Optional[List[str]]:
+        """Файлы, измененные с commit до текущего коммита; None, если изменения определить нельзя"""
+        if not commit or not self.project.last_commit_sha:
+            return None
+        if commit == self.project.last_commit_sha:
+            return []
+        if not self.project.local_path or not os.path.isdir(self.project.local_path):
+            return None
+        try:
+            repo = git.Repo(self.project.local_path)
+        except Exception as e:
+            logger.warning(f"Impact analysis: failed to open repository of project {self.project.id}: {e}")
+            return None
+        return get_changed_files(repo, commit, self.project.last_commit_sha)
+
+    def select(self, tests: Iterable[AutomationTest], since_commit: Optional[str]) -> Dict:
+        """
+        Затронутые тесты из набора: {'tests', 'full', 'reason', 'changed_files', 'commit'}.
+        since_commit - коммит, проверенный предыдущим запуском; commit - проверяемый коммит,
+        его вызывающий сохраняет для следующего запуска. full=True означает, что выбран весь набор.
+        """
+        tests = list(tests)
+        commit = self.project.last_commit_sha
+        changed = self.changed_since(since_commit)
+
+        def full(reason: str) -> Dict:
+            logger.info(f"Impact analysis for project {self.project.id}: running full suite ({reason})")
+            return {'tests': tests, 'full': True, 'reason': reason, 'changed_files': changed, 'commit': commit}
+
+        if self.project.framework not in PYTHON_FRAMEWORKS:
+            return full(f'import analysis is not supported for {self.project.framework}')
+        if changed is None:
+            return full('changes since the last affected run are unknown')
+        if any(_is_global_file(path) for path in changed):
+            return full('test configuration changed')
+
+        graph = self.get_graph()
+        if graph is None:
+            return full('import graph is stale')
+        if any(path.endswith('.py') and path not in graph for path in changed):
+            # Удаленный или переименованный модуль: импортирующие его файлы в графе не видны
+            return full('python modules were removed or renamed')
+
+        affected = self._affected_files(graph, changed)
+        conftest_dirs = [os.path.dirname(path) for path in changed if os.path.basename(path) == 'conftest.py']
+        selected = [
+            test for test in tests
+            if _normalize(test.file_path) in affected
+            or any(not d or _normalize(test.file_path).startswith(d + '/') for d in conftest_dirs)
+        ]
+        return {
+            'tests': selected,
+            'full': False,
+            'reason': f'{len(selected)} of {len(tests)} tests affected by {len(changed)} changed files',
+            'changed_files': changed,
+            'commit': commit
+        }
+
+    @staticmethod
+    def _affected_files(graph: Dict[str, List[str]], changed: List[str]) -> Set[str]:
+        """Измененные файлы и все файлы, которые транзитивно их импортируют"""
+        importers = defaultdict(list)
+        for path, imported in graph.items():
+            for target in imported:
+                importers[target].append(path)
+
+        affected = set(changed)
+        queue = deque(changed)
+        while queue:
+            for importer in importers.get(queue.popleft(), ()):
+                if importer not in affected:
+                    affected.add(importer)
+                    queue.append(importer)
+        return affected
@@ -0,0 +1,108 @@
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db.models import Avg, QuerySet, prefetch_related_objects
+from django.utils import timezone
+from ..models import AutomationProject, AutomationTest, TestCase, TestRun
+from .sharding import DEFAULT_TEST_DURATION, estimate_durations
+
+# Вклад признаков в очередность теста: чем больше сумма, тем раньше тест запускается
+PRIORITY_SCORES = {'high': 2, 'medium': 1, 'low': 0}
+RECENT_FAILURE_SCORE = 3
+RECENT_CHANGE_SCORE = 2
+
+FAILED_STATUSES = ('failed', 'error')
+
+
+def fail_fast_reason(max_failures: int) -> str:
+    return f"Batch stopped after {max_failures} failures (fail-fast)"
+
+
+def _recent_window():
+    return timezone.now() - timedelta(days=settings.ORDERING_RECENT_DAYS)
+
+
+def _order(items, score, duration) -> List:
+    """
+    Сначала тесты с наибольшим признаком (приоритет, недавние падения и изменения),
+    среди равных - самые долгие: длинные тесты стартуют раньше и не растягивают конец прогона
+    """
+    return sorted(items, key=lambda item: (-score(item), -duration(item)))
+
+
+def order_test_cases(test_cases) -> List[TestCase]:
+    """Очередность запуска TestCase внутри набора"""
+    if isinstance(test_cases, QuerySet):
+        test_cases = test_cases.select_related('automation_project')
+    test_cases = list(test_cases)
+    if len(test_cases) < 2:
+        return test_cases
+    # Признак изменения читает проект автоматизации каждого теста: загружаем их одним запросом
+    prefetch_related_objects(test_cases, 'automation_project')
+
+    ids = [test_case.id for test_case in test_cases]
+    since = _recent_window()
+    failed = set(
+        TestRun.objects.filter(test_case_id__in=ids, status__in=FAILED_STATUSES, started_at__gte=since)
+        .values_list('test_case_id', flat=True).distinct()
+    )
+    durations = dict(
+        TestRun.objects.filter(test_case_id__in=ids, execution_time__isnull=False)
+        .values('test_case_id').annotate(avg=Avg('execution_time')).values_list('test_case_id', 'avg')
+    )
+
+    def changed(test_case: TestCase) -> bool:
+        if test_case.updated_at and test_case.updated_at >= since:
+            return True
+        project = test_case.automation_project
+        return bool(project and test_case.script_path and test_case.script_path in (project.changed_files or []))
+
+    def score(test_case: TestCase) -> int:
+        return (
+            PRIORITY_SCORES.get(test_case.priority, 0)
+            + (RECENT_FAILURE_SCORE if test_case.id in failed else 0)
+            + (RECENT_CHANGE_SCORE if changed(test_case) else 0)
+        )
+
+    return _order(test_cases, score, lambda test_case: durations.get(test_case.id) or DEFAULT_TEST_DURATION)
+
+
+def order_automation_tests(project: AutomationProject, tests, durations: Optional[Dict[int, float]] = None) -> List[AutomationTest]:
+    """
+    Очередность запуска AutomationTest проекта. Приоритет и история падений
+    берутся у TestCase того же файла (TestCase.script_path), изменения - из
+    последней синхронизации проекта.
+    """
+    tests = list(tests)
+    if len(tests) < 2:
+        return tests
+
+    durations = durations or estimate_durations(project, tests)
+    file_paths = {test.file_path for test in tests}
+
+    priorities = defaultdict(int)
+    for path, priority in TestCase.objects.filter(
+        automation_project=project, script_path__in=file_paths
+    ).values_list('script_path', 'priority'):
+        priorities[path] = max(priorities[path], PRIORITY_SCORES.get(priority, 0))
+
+    failed_files = set(
+        TestRun.objects.filter(
+            test_case__automation_project=project,
+            test_case__script_path__in=file_paths,
+            status__in=FAILED_STATUSES,
+            started_at__gte=_recent_window()
+        ).values_list('test_case__script_path', flat=True).distinct()
+    )
+    changed_files = set(project.changed_files or [])
+
+    def score(test: AutomationTest) -> int:
+        failed = test.file_path in failed_files or (test.last_status or '') in FAILED_STATUSES
+        return (
+            priorities[test.file_path]
+            + (RECENT_FAILURE_SCORE if failed else 0)
+            + (RECENT_CHANGE_SCORE if test.file_path in changed_files else 0)
+        )
+
+    return _order(tests, score, lambda test: durations.get(test.id, DEFAULT_TEST_DURATION))
@@ -0,0 +1,76 @@
+import hashlib
+import zlib
+from typing import Dict, Iterable, Optional, Tuple
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from ..models import OutputBlob
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_ZSTD = 'zstd'
+CODEC_ZLIB = 'zlib'
+
+
+def output_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def compress(data: bytes) -> Tuple[str, bytes]:
+    """Сжимает вывод zstd, без пакета zstandard - zlib. Возвращает кодек и данные"""
+    if zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=settings.OUTPUT_BLOB_ZSTD_LEVEL).compress(data)
+    return CODEC_ZLIB, zlib.compress(data, settings.OUTPUT_BLOB_ZLIB_LEVEL)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Output is compressed with zstd, install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown output codec: {codec}")
+
+
+def _build(key: str, text: str) -> OutputBlob:
+    data = text.encode('utf-8')
+    codec, compressed = compress(data)
+    return OutputBlob(hash=key, codec=codec, data=compressed, size=len(data))
+
+
+def store_output(text: Optional[str]) -> Optional[OutputBlob]:
+    """Сохраняет вывод, если такого еще нет, и возвращает его запись; для пустого вывода - None"""
+    if not text:
+        return None
+    key = output_hash(text)
+    blob = OutputBlob.objects.filter(hash=key).only('id', 'hash', 'size').first()
+    if blob is not None:
+        return blob
+    try:
+        with transaction.atomic():
+            blob = _build(key, text)
+            blob.save()
+            return blob
+    except IntegrityError:
+        # Тот же вывод одновременно сохранил другой процесс
+        return OutputBlob.objects.only('id', 'hash', 'size').get(hash=key)
+
+
+def store_outputs(texts: Iterable[Optional[str]]) -> Dict[str, OutputBlob]:
+    """Сохраняет вывод группы тестов двумя запросами; возвращает записи по хэшу"""
+    by_hash = {output_hash(text): text for text in texts if text}
+    if not by_hash:
+        return {}
+    existing = set(OutputBlob.objects.filter(hash__in=by_hash).values_list('hash', flat=True))
+    OutputBlob.objects.bulk_create(
+        [_build(key, text) for key, text in by_hash.items() if key not in existing],
+        ignore_conflicts=True
+    )
+    return {blob.hash: blob for blob in OutputBlob.objects.filter(hash__in=by_hash).only('id', 'hash', 'size')}
+
+
+def blob_size(blob: Optional[OutputBlob]) -> int:
+    return blob.size if blob else 0
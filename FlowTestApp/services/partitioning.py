@@ -0,0 +1,132 @@
+import logging
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from ..models import TestEvent
+
+logger = logging.getLogger(__name__)
+
+# Суффикс секции по умолчанию: в нее попадают строки вне созданных месячных секций
+DEFAULT_PARTITION_SUFFIX = 'default'
+
+
+def partitioned_tables() -> Dict[str, str]:
+    """
+    Таблицы с помесячным секционированием и их ключ секционирования.
+    TestRun не секционируется: на него ссылаются внешние ключи других таблиц,
+    а в PostgreSQL они требуют уникального ключа, включающего ключ секционирования
+    """
+    return {TestEvent._meta.db_table: TestEvent._meta.get_field('timestamp').column}
+
+
+def is_supported() -> bool:
+    """Декларативное секционирование есть только у PostgreSQL"""
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned(table: str) -> bool:
+    if not is_supported():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def next_month(value: date) -> date:
+    return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def month_bound(month: date) -> datetime:
+    """Граница секции: полночь первого дня месяца по UTC"""
+    return datetime.combine(month, time.min, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f'{table}_p{month:%Y%m}'
+
+
+def list_partitions(table: str) -> List[Tuple[str, Optional[date]]]:
+    """Секции таблицы и их месяцы, по возрастанию; у секции по умолчанию месяц None"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s ORDER BY c.relname",
+            [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    prefix = f'{table}_p'
+    for name in names:
+        month = None
+        if name.startswith(prefix):
+            try:
+                month = datetime.strptime(name[len(prefix):], '%Y%m').date()
+            except ValueError:
+                pass
+        partitions.append((name, month))
+    return partitions
+
+
+def ensure_partitions(table: str, months_ahead: Optional[int] = None, since: Optional[date] = None) -> List[str]:
+    """
+    Создает недостающие месячные секции с месяца since (по умолчанию текущего)
+    до месяца через months_ahead (PARTITION_MONTHS_AHEAD) от текущего.
+    Возвращает имена созданных секций
+    """
+    months_ahead = settings.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    today = timezone.now().date()
+    last = month_start(today)
+    for _ in range(months_ahead):
+        last = next_month(last)
+
+    existing = {name for name, _ in list_partitions(table)}
+    quote = connection.ops.quote_name
+    created = []
+    month = month_start(since or today)
+    while month <= last:
+        name = partition_name(table, month)
+        if name not in existing:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'CREATE TABLE {quote(name)} PARTITION OF {quote(table)} FOR VALUES FROM (%s) TO (%s)',
+                        [month_bound(month), month_bound(next_month(month))]
+                    )
+                created.append(name)
+            except DatabaseError as e:
+                # Например, строки этого месяца уже лежат в секции по умолчанию
+                logger.error(f"Failed to create partition {name}: {e}")
+        month = next_month(month)
+    return created
+
+
+def ensure_all_partitions(months_ahead: Optional[int] = None) -> List[str]:
+    """Создает секции всех секционированных таблиц; на других СУБД ничего не делает"""
+    created = []
+    for table in partitioned_tables():
+        if is_partitioned(table):
+            created.extend(ensure_partitions(table, months_ahead))
+    return created
+
+
+def detach_partition(table: str, name: str):
+    """Отсоединяет и удаляет секцию; данные нужно выгрузить заранее"""
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        # Таблицу с отложенными проверками внешних ключей (строки изменены в этой же
+        # транзакции) удалить нельзя: проверки выполняются сейчас, затем снова откладываются
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}')
+        cursor.execute(f'DROP TABLE {quote(name)}')
+        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
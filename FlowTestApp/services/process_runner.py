@@ -0,0 +1,226 @@
+import collections
+import logging
+import queue
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from django.conf import settings
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from ..models import TestRun
+from .cancellation import get_poll_interval, is_cancel_requested
+from .process_tree import kill_process_tree, session_kwargs
+from .run_log import RunLog, compact_log
+
+logger = logging.getLogger(__name__)
+
+
+class _OutputTail:
+    """Хвост вывода ограниченного размера, чтобы не держать весь лог в памяти"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.parts = collections.deque()
+        self.size = 0
+        self.truncated = False
+
+    def append(self, text: str):
+        self.parts.append(text)
+        self.size += len(text)
+        while self.size > self.limit and len(self.parts) > 1:
+            self.size -= len(self.parts.popleft())
+            self.truncated = True
+
+    def text(self) -> str:
+        return ''.join(self.parts)
+
+
+class OutputSink:
+    """
+    Приемник вывода процесса теста.
+
+    Строки накапливаются до вызова flush(), после чего дописываются в таблицу
+    TestRunLogChunk и отправляются в группу test_execution_{id}. В памяти
+    остается только хвост вывода ограниченного размера. close() после
+    завершения процесса сжимает записанные порции.
+    """
+
+    def __init__(self, test_run: Optional[TestRun] = None, tail_limit: int = None):
+        self.test_run = test_run
+        tail_limit = tail_limit or getattr(settings, 'EXECUTION_OUTPUT_TAIL_CHARS', 1000000)
+        self.tails = {'stdout': _OutputTail(tail_limit), 'stderr': _OutputTail(tail_limit)}
+        self.channel_layer = get_channel_layer() if test_run else None
+        self.log = RunLog(test_run.id) if test_run else None
+        self._pending = {'stdout': [], 'stderr': []}
+        self._lock = threading.Lock()
+
+    def append(self, stream: str, line: str):
+        with self._lock:
+            self.tails[stream].append(line)
+            self._pending[stream].append(line)
+
+    def result(self, returncode: Optional[int]) -> Dict:
+        """Результат в формате run_streaming"""
+        with self._lock:
+            return {
+                'returncode': returncode,
+                'stdout': self.tails['stdout'].text(),
+                'stderr': self.tails['stderr'].text(),
+                'truncated': self.tails['stdout'].truncated or self.tails['stderr'].truncated,
+            }
+
+    def flush(self):
+        """Сохраняет накопленные строки и отправляет их подписчикам"""
+        with self._lock:
+            pending, self._pending = self._pending, {'stdout': [], 'stderr': []}
+
+        for stream, lines in pending.items():
+            if not lines:
+                continue
+            text = ''.join(lines)
+
+            if not self.test_run:
+                continue
+
+            try:
+                chunk = self.log.append(stream, text)
+                if self.channel_layer:
+                    async_to_sync(self.channel_layer.group_send)(
+                        f'test_execution_{self.test_run.id}',
+                        {
+                            'type': 'test_update',
+                            'data': {
+                                'status': 'running',
+                                'stream': stream,
+                                'seq': chunk.seq,
+                                'offset': chunk.offset,
+                                'output': text
+                            }
+                        }
+                    )
+            except Exception as e:
+                logger.error(f"Failed to publish output chunk for test run {self.test_run.id}: {e}")
+
+    def close(self):
+        """Сохраняет остаток вывода и сжимает порции завершенного процесса"""
+        self.flush()
+        if not self.test_run:
+            return
+        try:
+            compact_log(self.test_run.id)
+        except Exception as e:
+            logger.error(f"Failed to compact output of test run {self.test_run.id}: {e}")
+
+
+class StreamingProcess:
+    """
+    Запуск процесса с построчным чтением stdout и stderr.
+
+    Вывод накапливается в OutputSink и не чаще, чем раз в flush_interval
+    секунд, сохраняется и отправляется подписчикам. Процесс запускается
+    в собственной группе и убивается вместе с потомками по истечении timeout
+    или когда cancel_check() сообщает об отмене (по умолчанию - флаг отмены test_run).
+    """
+
+    # Сколько ждать закрытия каналов после принудительного завершения, в секундах
+    KILL_GRACE_PERIOD = 5
+
+    def __init__(self, cmd: List[str], cwd: Optional[str] = None, env: Optional[Dict] = None,
+                 test_run: Optional[TestRun] = None, flush_interval: float = None, tail_limit: int = None,
+                 timeout: Optional[float] = None, cancel_check: Optional[Callable[[], bool]] = None):
+        self.cmd = cmd
+        self.cwd = cwd
+        self.env = env
+        self.timeout = timeout
+        self.timed_out = False
+        self.cancelled = False
+        if cancel_check is None and test_run is not None:
+            cancel_check = lambda: is_cancel_requested(test_run.id)
+        self.cancel_check = cancel_check
+        self.flush_interval = flush_interval or getattr(settings, 'EXECUTION_STREAM_FLUSH_INTERVAL', 0.5)
+        self.sink = OutputSink(test_run, tail_limit)
+        self.process = None
+        self._lines = queue.Queue()
+
+    def run(self) -> Dict:
+        """Запускает процесс и возвращает код возврата и хвосты stdout/stderr"""
+        self.process = subprocess.Popen(
+            self.cmd,
+            cwd=self.cwd,
+            env=self.env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1,
+            **session_kwargs()
+        )
+        started = time.monotonic()
+        deadline = started + self.timeout if self.timeout else None
+        killed_at = None
+        last_cancel_check = started
+
+        readers = [
+            threading.Thread(target=self._read, args=('stdout', self.process.stdout), daemon=True),
+            threading.Thread(target=self._read, args=('stderr', self.process.stderr), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+
+        finished_streams = 0
+        last_flush = time.monotonic()
+        while finished_streams < len(readers):
+            try:
+                stream, line = self._lines.get(timeout=self.flush_interval)
+                if line is None:
+                    finished_streams += 1
+                else:
+                    self.sink.append(stream, line)
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if now - last_flush >= self.flush_interval:
+                self.sink.flush()
+                last_flush = now
+
+            if deadline and killed_at is None and now >= deadline:
+                logger.warning(f"Process {self.process.pid} timed out after {self.timeout}s, killing process tree")
+                self.timed_out = True
+                kill_process_tree(self.process.pid)
+                killed_at = now
+            elif self.cancel_check and killed_at is None and now - last_cancel_check >= get_poll_interval():
+                last_cancel_check = now
+                if self.cancel_check():
+                    logger.info(f"Process {self.process.pid} cancelled, killing process tree")
+                    self.cancelled = True
+                    kill_process_tree(self.process.pid)
+                    killed_at = now
+            elif killed_at is not None and now - killed_at >= self.KILL_GRACE_PERIOD:
+                # Каналы держит потомок, вышедший из группы; дальше не ждем
+                break
+
+        returncode = self.process.wait()
+        self.sink.close()
+        result = self.sink.result(returncode)
+        result.update(timed_out=self.timed_out, cancelled=self.cancelled, duration=time.monotonic() - started)
+        return result
+
+    def _read(self, stream: str, pipe):
+        try:
+            for line in iter(pipe.readline, ''):
+                self._lines.put((stream, line))
+        finally:
+            pipe.close()
+            self._lines.put((stream, None))
+
+
+def run_streaming(cmd: List[str], cwd: Optional[str] = None, env: Optional[Dict] = None,
+                  test_run: Optional[TestRun] = None, timeout: Optional[float] = None,
+                  cancel_check: Optional[Callable[[], bool]] = None) -> Dict:
+    """Запускает команду с потоковой передачей вывода, см. StreamingProcess"""
+    return StreamingProcess(
+        cmd, cwd=cwd, env=env, test_run=test_run, timeout=timeout, cancel_check=cancel_check
+    ).run()
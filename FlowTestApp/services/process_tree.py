@@ -0,0 +1,78 @@
+import logging
+import os
+import signal
+import subprocess
+from typing import Dict, List
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+
+def session_kwargs() -> Dict:
+    """
+    Параметры Popen/create_subprocess_exec, с которыми процесс теста становится
+    лидером собственной группы: ее можно убить целиком вместе с браузерами и node
+    """
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+def child_pids(pid: int, recursive: bool = True) -> List[int]:
+    """Потомки процесса (все или только прямые); без psutil дерево строится по /proc"""
+    if psutil is not None:
+        try:
+            return [child.pid for child in psutil.Process(pid).children(recursive=recursive)]
+        except psutil.NoSuchProcess:
+            return []
+
+    if not os.path.isdir('/proc'):
+        return []
+
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Имя процесса в скобках может содержать пробелы, ppid идет вторым полем после него
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    if not recursive:
+        return children.get(pid, [])
+
+    result, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            result.append(child)
+            stack.append(child)
+    return result
+
+
+def kill_process_tree(pid: int):
+    """Убивает процесс, его группу (если он ее лидер) и всех потомков"""
+    if os.name == 'nt':
+        subprocess.run(['taskkill', '/F', '/T', '/PID', str(pid)], capture_output=True)
+        return
+
+    # Потомков собираем до сигнала: после смерти родителя они переходят к init
+    descendants = child_pids(pid)
+    try:
+        if os.getpgid(pid) == pid:
+            os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+    for target in [pid, *descendants]:
+        try:
+            os.kill(target, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            continue
+    logger.info(f"Killed process tree of {pid} ({len(descendants)} descendants)")
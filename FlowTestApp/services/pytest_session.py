@@ -0,0 +1,243 @@
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional
+from django.utils import timezone
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from ..models import AutomationProject, TestCase, TestRun, TestEvent, ExecutionProfile
+from .process_runner import run_streaming
+from .test_runner import TestRunner
+from .cancellation import CANCEL_REASON, cancelled_test_run_ids
+from .timeouts import get_batch_timeout, get_test_timeout, timeout_reason
+from .ordering import fail_fast_reason
+from .suite_recorder import SuiteRecorder
+from .output_store import blob_size, output_hash, store_outputs
+
+
+def _normalize_path(path: str) -> str:
+    return os.path.normpath(path).replace('\\', '/')
+
+
+class PytestSession:
+    """
+    Запуск нескольких тестов одного проекта автоматизации в одной сессии pytest.
+
+    Интерпретатор, плагины и conftest загружаются один раз на группу, результаты
+    читаются из отчета JUnit XML и раскладываются по отдельным TestRun/TestReport.
+    """
+
+    def __init__(self, automation_project: AutomationProject, test_cases: List[TestCase],
+                 profile: Optional[ExecutionProfile] = None, retry_of: Optional[Dict[int, TestRun]] = None,
+                 attempt: int = 1, recorder: Optional[SuiteRecorder] = None):
+        """
+        :param retry_of: Первые попытки по id TestCase, если сессия перезапускает упавшие тесты
+        :param attempt: Номер попытки
+        :param recorder: Записи пакетного прогона, в который входит сессия
+        """
+        self.automation_project = automation_project
+        self.recorder = recorder or SuiteRecorder()
+        self.retry_of = retry_of or {}
+        self.attempt = attempt
+        self.test_cases = list(test_cases)
+        self.profile = profile or ExecutionProfile.get_default()
+        self.repo_path = TestRunner.get_repo_path(automation_project)
+        self.channel_layer = get_channel_layer()
+        self.runs = {}
+        self.timeout = get_batch_timeout(get_test_timeout(test_case) for test_case in self.test_cases)
+
+    def run(self) -> List[Dict]:
+        """Запускает сессию и возвращает результаты в формате BatchTestRunner.run_tests"""
+        self._prepare_runs()
+
+        # Файлы передаются в порядке тестов группы (см. order_test_cases), pytest сохраняет этот порядок
+        files = list(dict.fromkeys(_normalize_path(tc.script_path) for tc in self.test_cases))
+        report_fd, report_path = tempfile.mkstemp(suffix='.xml', prefix='flowtest_junit_')
+        os.close(report_fd)
+
+        env = os.environ.copy()
+        env.update(self.profile.environment())
+        started = timezone.now()
+        try:
+            result = run_streaming(
+                [
+                    'pytest',
+                    *files,
+                    '-v',
+                    '--rootdir', str(self.repo_path),
+                    '--junitxml', report_path,
+                    '-o', 'junit_family=xunit1',
+                    *self.profile.pytest_args(check_plugin=True),
+                    *self.profile.fail_fast_args()
+                ],
+                cwd=str(self.repo_path),
+                env=env,
+                timeout=self.timeout,
+                cancel_check=self._all_cancelled
+            )
+            if result['timed_out']:
+                # Отчет JUnit пишется только в конце сессии, результатов по тестам нет
+                result['stderr'] = f"{timeout_reason(self.timeout)}\n{result['stderr']}"
+                by_file = {}
+            else:
+                by_file = self._parse_report(report_path)
+        except Exception as e:
+            result = {'returncode': None, 'stdout': '', 'stderr': str(e), 'timed_out': False}
+            by_file = {}
+        finally:
+            if os.path.exists(report_path):
+                os.unlink(report_path)
+
+        return self._fan_out(by_file, result, timezone.now() - started)
+
+    def _all_cancelled(self) -> bool:
+        """Сессию можно остановить, только если отменены все ее запуски"""
+        run_ids = [test_run.id for test_run, _ in self.runs.values()]
+        return len(cancelled_test_run_ids(run_ids)) == len(run_ids)
+
+    def _prepare_runs(self):
+        """Создает TestRun, TestReport и событие начала для каждого теста группы одной транзакцией"""
+        self.runs = self.recorder.create_runs(
+            self.test_cases, self.profile, 'running', self.retry_of, self.attempt, details={'batched': True}
+        )
+
+    def _parse_report(self, report_path: str) -> Dict[str, List[Dict]]:
+        """Группирует testcase-записи отчета JUnit по файлам тестов"""
+        by_file = defaultdict(list)
+        if not os.path.getsize(report_path):
+            return by_file
+
+        root = ET.parse(report_path).getroot()
+        for case in root.iter('testcase'):
+            file_path = case.get('file') or self._file_from_classname(case.get('classname', ''))
+            if not file_path:
+                continue
+
+            outcome, message = 'passed', None
+            for tag in ('failure', 'error', 'skipped'):
+                node = case.find(tag)
+                if node is not None:
+                    outcome = {'failure': 'failed', 'error': 'error', 'skipped': 'skipped'}[tag]
+                    message = node.get('message') or (node.text or '').strip()
+                    break
+
+            by_file[_normalize_path(file_path)].append({
+                'name': case.get('name'),
+                'classname': case.get('classname'),
+                'time': float(case.get('time') or 0),
+                'outcome': outcome,
+                'message': message,
+                'output': (case.findtext('system-out') or '') + (case.findtext('system-err') or ''),
+            })
+        return by_file
+
+    def _file_from_classname(self, classname: str) -> Optional[str]:
+        """Восстанавливает путь к файлу по classname вида tests.test_login.TestLogin"""
+        parts = classname.split('.')
+        while parts:
+            candidate = '/'.join(parts) + '.py'
+            if (self.repo_path / candidate).exists():
+                return candidate
+            parts.pop()
+        return None
+
+    def _fan_out(self, by_file: Dict[str, List[Dict]], result: Dict, elapsed: timedelta) -> List[Dict]:
+        """Записывает результаты сессии в TestRun/TestReport каждого теста"""
+        results = []
+        finished_runs, finished_reports, events, updates = [], [], [], []
+        outputs = []
+        finished = timezone.now()
+        cancelled = cancelled_test_run_ids(test_run.id for test_run, _ in self.runs.values())
+        # pytest остановил сессию по --maxfail: тесты без результатов не выполнялись
+        failures = sum(1 for cases in by_file.values() for case in cases if case['outcome'] in ('failed', 'error'))
+        stopped = bool(self.profile.max_failures) and failures >= self.profile.max_failures
+        for test_case in self.test_cases:
+            test_run, test_report = self.runs[test_case.id]
+            if test_run.id in cancelled:
+                # Строка уже переведена в cancelled через API, результат не записываем
+                results.append({
+                    'test_case': test_case,
+                    'result': {'success': False, 'cancelled': True, 'error': CANCEL_REASON}
+                })
+                if self.attempt == 1:
+                    self.recorder.count(['cancelled'])
+                continue
+            cases = by_file.get(_normalize_path(test_case.script_path), [])
+
+            aborted = not cases and stopped
+            if aborted:
+                status = 'skipped'
+                error = fail_fast_reason(self.profile.max_failures)
+            elif not cases:
+                status = 'error'
+                error = result['stderr'] or 'No results for this test in the pytest report'
+            elif any(c['outcome'] == 'failed' for c in cases):
+                status = 'failed'
+            elif any(c['outcome'] == 'error' for c in cases):
+                status = 'error'
+            elif all(c['outcome'] == 'skipped' for c in cases):
+                status = 'skipped'
+            else:
+                status = 'passed'
+
+            if cases:
+                error = '\n'.join(c['message'] for c in cases if c['message'] and c['outcome'] != 'skipped') or None
+            duration = sum(c['time'] for c in cases)
+            output = ''.join(c['output'] for c in cases)
+            success = status in ('passed', 'skipped') and not aborted
+
+            test_run.status = status
+            test_run.finished_at = finished
+            test_run.execution_time = duration
+            test_run.error_message = error
+            finished_runs.append(test_run)
+
+            test_report.status = 'failed' if status == 'error' else status
+            test_report.execution_time = timedelta(seconds=duration)
+            test_report.comments = error
+            finished_reports.append(test_report)
+            outputs.append((test_run, test_report, output))
+
+            details = {
+                'tests': [{key: value for key, value in c.items() if key != 'output'} for c in cases],
+                'session_time': elapsed.total_seconds()
+            }
+            events.append(TestEvent(
+                test_case=test_case,
+                test_report=test_report,
+                event_type='finish',
+                description='Test execution finished',
+                severity='info' if success else 'error',
+                details=details
+            ))
+            updates.append((test_run.id, {'status': status, 'duration': duration, 'error': error}))
+
+            results.append({
+                'test_case': test_case,
+                'test_run': test_run,
+                'result': {
+                    'success': success,
+                    'output': output,
+                    'error': error,
+                    'tests': cases
+                }
+            })
+
+        # Вывод теста хранится один раз, запуск и отчет ссылаются на одну запись OutputBlob
+        blobs = store_outputs(output for _, _, output in outputs)
+        for test_run, test_report, output in outputs:
+            blob = blobs.get(output_hash(output)) if output else None
+            test_run.output_blob = test_report.actual_result_blob = blob
+            test_run.output_size = test_report.actual_result_size = blob_size(blob)
+
+        # Все записи сессии сохраняются одной транзакцией, затем клиенты получают итоговые статусы
+        self.recorder.save_results(finished_runs, finished_reports, events)
+        if self.channel_layer:
+            for test_run_id, data in updates:
+                async_to_sync(self.channel_layer.group_send)(
+                    f'test_execution_{test_run_id}',
+                    {'type': 'test_update', 'data': data}
+                )
+        return results
@@ -0,0 +1,56 @@
+import logging
+import math
+from typing import Dict, Optional
+from django.conf import settings
+from django.db.models import Avg
+from FlowTest.celery import app
+from ..models import TestRun
+
+logger = logging.getLogger(__name__)
+
+# Очереди Celery: интерактивные запуски пользователей, запуски по расписанию и синхронизация репозиториев
+QUEUE_INTERACTIVE = 'interactive'
+QUEUE_SCHEDULED = 'scheduled'
+QUEUE_SYNC = 'sync'
+
+# Длительность запуска, если истории еще нет, в секундах
+DEFAULT_RUN_DURATION = 30.0
+
+
+def get_queue_length(queue: str) -> Optional[int]:
+    """Число сообщений, ожидающих в очереди брокера; None, если брокер недоступен"""
+    try:
+        with app.connection_for_read() as connection:
+            return connection.default_channel.queue_declare(queue=queue, passive=True).message_count
+    except Exception as e:
+        logger.warning(f"Failed to read length of queue {queue}: {e}")
+        return None
+
+
+def get_average_run_duration() -> float:
+    """Средняя длительность последних завершенных запусков"""
+    recent = TestRun.objects.filter(
+        status__in=['passed', 'failed', 'error'],
+        execution_time__isnull=False
+    ).order_by('-id').values_list('id', flat=True)[:settings.QUEUE_ETA_HISTORY]
+    average = TestRun.objects.filter(id__in=list(recent)).aggregate(avg=Avg('execution_time'))['avg']
+    return average or DEFAULT_RUN_DURATION
+
+
+def estimate_queue_position(queue: str) -> Dict:
+    """
+    Позиция только что отправленной задачи и оценка ожидания до ее старта.
+    Задачи очереди разбираются слотами воркеров (EXECUTION_QUEUE_CONCURRENCY)
+    волнами, каждая волна занимает среднюю длительность запуска.
+    """
+    length = get_queue_length(queue)
+    if length is None:
+        return {'queue': queue, 'position': None, 'eta_seconds': None}
+
+    slots = max(1, settings.EXECUTION_QUEUE_CONCURRENCY.get(queue, 1))
+    waves_ahead = math.floor(max(0, length - 1) / slots)
+    return {
+        'queue': queue,
+        'position': length,
+        'eta_seconds': round(waves_ahead * get_average_run_duration(), 1)
+    }
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from ..models import AutomationProject, AutomationTest, ExecutionProfile, ResultCacheEntry, SuiteRun, TestCase, TestRun
+from .output_store import blob_size, store_output
+
+logger = logging.getLogger(__name__)
+
+CACHED_STATUS = 'passed (cached)'
+
+
+def _file_hash(path: Optional[str]) -> Optional[str]:
+    """sha256 содержимого файла; None, если файла нет"""
+    if not path or not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Кэш успешных результатов тестов проекта автоматизации.
+
+    Ключ записи - хэш кода теста (TestCase.test_code и файл теста в репозитории),
+    коммита репозитория после синхронизации и окружения профиля выполнения.
+    Пока ключ не изменился, запуск по расписанию не выполняет тест, а записывает
+    TestRun со ссылкой на исходный запуск.
+
+    Свежесть ограничивают две политики проекта:
+    - TTL: запись живет result_cache_ttl часов и продлевается при каждом попадании;
+    - max-age: исходный запуск не старше result_cache_max_age часов, после этого
+      тест выполняется заново, даже если запись продлевалась.
+    Кэш включается для проекта флагом AutomationProject.result_cache_enabled.
+    """
+
+    def __init__(self, project: AutomationProject, profile: Optional[ExecutionProfile] = None):
+        self.project = project
+        self.profile = profile
+        self.ttl = timedelta(hours=project.result_cache_ttl or settings.RESULT_CACHE_TTL_HOURS)
+        self.max_age = timedelta(hours=project.result_cache_max_age or settings.RESULT_CACHE_MAX_AGE_HOURS)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.project.result_cache_enabled and self.project.last_commit_sha)
+
+    def _key(self, *parts) -> str:
+        environment = self.profile.environment() if self.profile else {}
+        payload = [
+            *parts,
+            self.project.last_commit_sha,
+            self.profile.name if self.profile else None,
+            sorted(environment.items())
+        ]
+        return hashlib.sha256(json.dumps(payload, default=str).encode('utf-8')).hexdigest()
+
+    def test_case_key(self, test_case: TestCase) -> str:
+        # Файл теста берется из рабочей копии синхронизации, как и для automation_test_key
+        script = (
+            os.path.join(self.project.local_path, test_case.script_path)
+            if self.project.local_path and test_case.script_path else None
+        )
+        code_hash = hashlib.sha256((test_case.test_code or '').encode('utf-8')).hexdigest()
+        return self._key('test_case', test_case.id, code_hash, _file_hash(script))
+
+    def automation_test_key(self, test: AutomationTest) -> str:
+        path = os.path.join(self.project.local_path, test.file_path) if self.project.local_path else None
+        return self._key('automation_test', test.id, test.name, _file_hash(path))
+
+    def lookup(self, key: str) -> Optional[ResultCacheEntry]:
+        """Свежая запись по ключу; попадание продлевает TTL, но не дальше max-age"""
+        now = timezone.now()
+        entry = ResultCacheEntry.objects.filter(
+            key=key,
+            expires_at__gt=now,
+            recorded_at__gt=now - self.max_age
+        ).select_related('test_run').first()
+        if entry is None:
+            return None
+
+        entry.expires_at = min(now + self.ttl, entry.recorded_at + self.max_age)
+        ResultCacheEntry.objects.filter(id=entry.id).update(
+            hits=F('hits') + 1,
+            last_hit_at=now,
+            expires_at=entry.expires_at
+        )
+        return entry
+
+    def store(self, key: str, test_case: Optional[TestCase] = None, automation_test: Optional[AutomationTest] = None,
+              test_run: Optional[TestRun] = None) -> ResultCacheEntry:
+        """Запоминает успешный результат выполненного теста"""
+        now = timezone.now()
+        entry, _ = ResultCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                'automation_project': self.project,
+                'test_case': test_case,
+                'automation_test': automation_test,
+                'test_run': test_run,
+                'commit_sha': self.project.last_commit_sha,
+                'execution_profile': self.profile,
+                'recorded_at': now,
+                'expires_at': now + self.ttl,
+                'hits': 0,
+                'last_hit_at': None
+            }
+        )
+        return entry
+
+    def invalidate(self, key: str):
+        ResultCacheEntry.objects.filter(key=key).delete()
+
+    def record_hit(self, test_case: TestCase, entry: ResultCacheEntry, suite_run: Optional[SuiteRun] = None) -> TestRun:
+        """Записывает TestRun без выполнения: статус passed со ссылкой на исходный запуск"""
+        now = timezone.now()
+        source = f"test run #{entry.test_run_id}" if entry.test_run_id else f"run at {entry.recorded_at.isoformat()}"
+        # Текст одинаков для всех попаданий в запись, blob сохраняется один раз
+        output_blob = store_output(
+            f"Result reused from {source}: test code, commit {self.project.last_commit_sha[:12]} and profile are unchanged"
+        )
+        return TestRun.objects.create(
+            test_case=test_case,
+            status='passed',
+            started_at=now,
+            finished_at=now,
+            execution_time=0,
+            execution_profile=self.profile,
+            cached_from=entry.test_run,
+            suite_run=suite_run,
+            output_blob=output_blob,
+            output_size=blob_size(output_blob)
+        )
+
+    def partition_automation_tests(self, tests: Iterable[AutomationTest]) -> Dict[str, List]:
+        """
+        Делит тесты проекта на попавшие в кэш и подлежащие выполнению.
+        Попавшие отмечаются в AutomationTest.last_status как passed (cached).
+        """
+        tests = list(tests)
+        if not self.enabled:
+            return {'cached': [], 'pending': tests}
+
+        cached, pending = [], []
+        for test in tests:
+            (cached if self.lookup(self.automation_test_key(test)) else pending).append(test)
+        if cached:
+            AutomationTest.objects.filter(id__in=[test.id for test in cached]).update(
+                last_run=timezone.now(),
+                last_status=CACHED_STATUS
+            )
+            logger.info(f"Result cache: {len(cached)} of {len(tests)} tests of project {self.project.id} are unchanged")
+        return {'cached': cached, 'pending': pending}
+
+    def store_automation_tests(self, tests: Iterable[AutomationTest], result: Dict):
+        """
+        Запоминает тесты успешно выполненного набора: успех набора означает успех каждого теста.
+        Нестабильные тесты, прошедшие только при перезапуске, не запоминаются.
+        """
+        if not self.enabled or not result.get('success') or result.get('cancelled'):
+            return
+        flaky = set(result.get('flaky_tests') or ())
+        for test in tests:
+            if test.id in flaky:
+                self.invalidate(self.automation_test_key(test))
+                continue
+            self.store(self.automation_test_key(test), automation_test=test)
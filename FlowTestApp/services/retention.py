@@ -0,0 +1,208 @@
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from ..models import OutputBlob, Project, TestEvent, TestReport, TestRun
+from .partitioning import detach_partition, is_partitioned, list_partitions, next_month, month_bound
+
+logger = logging.getLogger(__name__)
+
+
+def retention_days(project: Project) -> Optional[int]:
+    """Срок хранения запусков проекта в днях; None - хранить всегда"""
+    if project.retention_days is not None:
+        return project.retention_days
+    return settings.RUN_RETENTION_DAYS
+
+
+def write_archive(path: str, rows: Iterable[Dict]) -> int:
+    """
+    Записывает строки в сжатый файл JSON Lines. Файл появляется под именем path
+    только полностью записанным, поэтому удалять строки из базы можно после возврата
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.tmp'
+    count = 0
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, default=str, ensure_ascii=False) + '\n')
+            count += 1
+    os.replace(temp_path, path)
+    return count
+
+
+class RetentionPolicy:
+    """
+    Удаление истории запусков старше срока хранения проекта с выгрузкой в архив.
+
+    Запуски (TestRun), события (TestEvent) и отчеты (TestReport) проекта старше
+    retention_days выгружаются пачками в файлы .jsonl.gz в archive_dir и удаляются.
+    Месячные секции TestEvent, в которых не осталось событий для хранения, выгружаются
+    и отсоединяются целиком - без построчного удаления. Вывод удаленных запусков и
+    отчетов попадает в архив вместе с ними, записи OutputBlob без ссылок удаляются.
+    """
+
+    def __init__(self, archive_dir: Optional[str] = None, batch_size: Optional[int] = None,
+                 now: Optional[datetime] = None):
+        self.archive_dir = archive_dir or settings.RUN_ARCHIVE_DIR
+        self.batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+        self.now = now or timezone.now()
+        self.stamp = self.now.strftime('%Y%m%d%H%M%S')
+
+    def cutoffs(self) -> Dict[int, datetime]:
+        """Граница хранения по id проекта; проекты без срока хранения не входят"""
+        cutoffs = {}
+        for project in Project.objects.only('id', 'retention_days'):
+            days = retention_days(project)
+            if days is not None:
+                cutoffs[project.id] = self.now - timedelta(days=days)
+        return cutoffs
+
+    def apply(self) -> Dict[str, int]:
+        cutoffs = self.cutoffs()
+        stats = {'partitions': 0, 'test_runs': 0, 'test_events': 0, 'test_reports': 0, 'output_blobs': 0}
+        if not cutoffs:
+            return stats
+
+        stats['partitions'] = self.drop_partitions(cutoffs)
+
+        for project_id, cutoff in cutoffs.items():
+            stats['test_runs'] += self.archive_test_runs(project_id, cutoff)
+            stats['test_events'] += self.archive_test_events(project_id, cutoff)
+            # После событий: удаление отчета каскадно удалило бы его события без выгрузки
+            stats['test_reports'] += self.archive_test_reports(project_id, cutoff)
+
+        if stats['test_runs'] or stats['test_reports']:
+            stats['output_blobs'] = self.delete_orphan_blobs()
+        logger.info(f"Retention applied: {stats}")
+        return stats
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.archive_dir, *parts)
+
+    def drop_partitions(self, cutoffs: Dict[int, datetime]) -> int:
+        """
+        Выгружает и отсоединяет секции TestEvent, в которых нечего хранить: месяц секции
+        вышел за срок хранения части проектов, а событий остальных проектов (без срока
+        хранения или с более поздней границей) и событий без тест-кейса в секции нет.
+        Секции с такими событиями обрабатываются построчно в archive_test_events
+        """
+        table = TestEvent._meta.db_table
+        if not cutoffs or not is_partitioned(table):
+            return 0
+        quote = connection.ops.quote_name
+        latest = max(cutoffs.values())
+        dropped = 0
+        for name, month in list_partitions(table):
+            if month is None:
+                continue
+            end = month_bound(next_month(month))
+            if end > latest:
+                continue
+            expired = [project_id for project_id, cutoff in cutoffs.items() if cutoff >= end]
+            # Диапазон timestamp ограничивает проверку одной секцией
+            kept = TestEvent.objects.filter(
+                timestamp__gte=month_bound(month), timestamp__lt=end
+            ).exclude(test_case__project_id__in=expired)
+            if kept.exists():
+                continue
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT * FROM {quote(name)}')
+                    columns = [column[0] for column in cursor.description]
+                    path = self._path('test_events', 'partitions', f'{name}.jsonl.gz')
+                    count = write_archive(path, (dict(zip(columns, row)) for row in cursor))
+                detach_partition(table, name)
+            logger.info(f"Archived {count} events of partition {name} to {path}")
+            dropped += 1
+        return dropped
+
+    def archive_test_runs(self, project_id: int, cutoff: datetime) -> int:
+        """Выгружает и удаляет запуски проекта, начатые до cutoff"""
+        archived = 0
+        while True:
+            test_runs = list(
+                TestRun.objects.filter(project_id=project_id, started_at__lt=cutoff)
+                .order_by('started_at', 'id')
+                .values()[:self.batch_size]
+            )
+            if not test_runs:
+                return archived
+            blobs = OutputBlob.objects.in_bulk({run['output_blob_id'] for run in test_runs if run['output_blob_id']})
+            for run in test_runs:
+                blob = blobs.get(run['output_blob_id'])
+                if blob is not None:
+                    run['output'] = blob.text
+
+            ids = [run['id'] for run in test_runs]
+            path = self._path('test_runs', str(project_id), f'{self.stamp}-{ids[0]}-{ids[-1]}.jsonl.gz')
+            write_archive(path, test_runs)
+            with transaction.atomic():
+                TestRun.objects.filter(id__in=ids).delete()
+            archived += len(ids)
+
+    def archive_test_events(self, project_id: int, cutoff: datetime) -> int:
+        """Выгружает и удаляет события тест-кейсов проекта старше cutoff"""
+        archived = 0
+        while True:
+            events = list(
+                TestEvent.objects.filter(test_case__project_id=project_id, timestamp__lt=cutoff)
+                .order_by('timestamp', 'id')
+                .values()[:self.batch_size]
+            )
+            if not events:
+                return archived
+            ids = [event['id'] for event in events]
+            path = self._path('test_events', str(project_id), f'{self.stamp}-{ids[0]}-{ids[-1]}.jsonl.gz')
+            write_archive(path, events)
+            # timestamp ограничивает удаление секциями, которые могут содержать эти строки
+            TestEvent.objects.filter(id__in=ids, timestamp__lt=cutoff).delete()
+            archived += len(ids)
+
+    def archive_test_reports(self, project_id: int, cutoff: datetime) -> int:
+        """
+        Выгружает и удаляет отчеты тест-кейсов проекта, созданные до cutoff.
+        Отчеты с оставшимися событиями пропускаются: события выгружаются раньше отчетов
+        """
+        archived = 0
+        while True:
+            reports = list(
+                TestReport.objects.filter(test_case__project_id=project_id, execution_date__lt=cutoff)
+                .filter(~Exists(TestEvent.objects.filter(test_report=OuterRef('pk'))))
+                .order_by('execution_date', 'id')
+                .values()[:self.batch_size]
+            )
+            if not reports:
+                return archived
+            blobs = OutputBlob.objects.in_bulk(
+                {report['actual_result_blob_id'] for report in reports if report['actual_result_blob_id']}
+            )
+            for report in reports:
+                blob = blobs.get(report['actual_result_blob_id'])
+                if blob is not None:
+                    report['actual_result'] = blob.text
+
+            ids = [report['id'] for report in reports]
+            path = self._path('test_reports', str(project_id), f'{self.stamp}-{ids[0]}-{ids[-1]}.jsonl.gz')
+            write_archive(path, reports)
+            with transaction.atomic():
+                TestReport.objects.filter(id__in=ids).delete()
+            archived += len(ids)
+
+    def delete_orphan_blobs(self) -> int:
+        """Удаляет вывод, на который больше не ссылаются запуски и отчеты"""
+        # Свежий вывод мог быть сохранен, но еще не привязан к запуску
+        orphans = OutputBlob.objects.filter(
+            created_at__lt=self.now - timedelta(days=1)
+        ).filter(
+            ~Exists(TestRun.objects.filter(output_blob=OuterRef('pk'))),
+            ~Exists(TestReport.objects.filter(actual_result_blob=OuterRef('pk')))
+        )
+        deleted, _ = orphans.delete()
+        return deleted
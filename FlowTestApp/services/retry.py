@@ -0,0 +1,71 @@
+import re
+from typing import Dict, Hashable, Iterable, List, Optional, Set
+from ..models import AutomationTest, ExecutionProfile
+
+# Строки pytest -v и краткой сводки с упавшими тестами:
+#   tests/test_login.py::test_submit FAILED    [ 50%]
+#   FAILED tests/test_login.py::TestLogin::test_submit - AssertionError
+PYTEST_RESULT_LINE = re.compile(r'^(?P<nodeid>\S+::\S+)\s+(?P<outcome>FAILED|ERROR)\b')
+PYTEST_SUMMARY_LINE = re.compile(r'^(?P<outcome>FAILED|ERROR)\s+(?P<nodeid>\S+::\S+)')
+
+
+class RetryPolicy:
+    """
+    Политика перезапуска упавших тестов набора из профиля выполнения.
+
+    Упавшие тесты перезапускаются одной дополнительной сессией на попытку,
+    не больше max_retries попыток. Все попытки укладываются в бюджет
+    retry_budget_percent процентов от времени основного прогона: если упавшие
+    тесты в него не помещаются, перезапускаются самые быстрые.
+    """
+
+    def __init__(self, profile: Optional[ExecutionProfile]):
+        self.max_retries = profile.max_retries if profile else 0
+        self.budget_percent = profile.retry_budget_percent if profile else 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_retries and self.budget_percent)
+
+    def budget(self, batch_seconds: float) -> float:
+        """Время на все попытки перезапуска в секундах"""
+        return batch_seconds * self.budget_percent / 100
+
+    @staticmethod
+    def select(items: Iterable, durations: Dict[Hashable, float], remaining: float, key=lambda item: item) -> List:
+        """Тесты для перезапуска, которые помещаются в оставшийся бюджет; быстрые первыми"""
+        selected, total = [], 0.0
+        for item in sorted(items, key=lambda item: durations.get(key(item), 0.0)):
+            duration = durations.get(key(item), 0.0)
+            if total + duration > remaining:
+                break
+            selected.append(item)
+            total += duration
+        return selected
+
+
+def parse_pytest_failures(output: str) -> Set[str]:
+    """Идентификаторы упавших тестов из вывода pytest -v"""
+    failed = set()
+    for line in (output or '').splitlines():
+        match = PYTEST_RESULT_LINE.match(line.strip()) or PYTEST_SUMMARY_LINE.match(line.strip())
+        if match:
+            failed.add(match.group('nodeid'))
+    return failed
+
+
+def failed_automation_tests(tests: Iterable[AutomationTest], output: str) -> List[AutomationTest]:
+    """
+    Тесты набора, упавшие по выводу pytest. Тест сопоставляется по имени функции
+    (без параметров и класса) и пути файла относительно корня репозитория.
+    """
+    failed = set()
+    for nodeid in parse_pytest_failures(output):
+        parts = nodeid.split('::')
+        failed.add((parts[0].replace('\\', '/'), parts[-1].split('[')[0]))
+
+    return [
+        test for test in tests
+        if any(name == test.name and (path.endswith(test.file_path) or test.file_path.endswith(path))
+               for path, name in failed)
+    ]
@@ -0,0 +1,157 @@
+import zlib
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import transaction
+from ..models import TestRunLogChunk
+
+
+class RunLog:
+    """
+    Вывод прогона в таблице TestRunLogChunk.
+
+    Каждый вызов append() добавляет одну порцию без перезаписи предыдущих;
+    номер порции и смещение ее начала ведутся в памяти, поэтому пишущий процесс
+    обращается к таблице за ними только один раз. Писатель у прогона один.
+    """
+
+    def __init__(self, test_run_id: int):
+        self.test_run_id = test_run_id
+        self._seq = None
+        self._end = None
+
+    def _load_position(self):
+        last = TestRunLogChunk.objects.filter(test_run_id=self.test_run_id).order_by('-seq').values(
+            'seq', 'offset', 'size'
+        ).first()
+        self._seq = last['seq'] if last else -1
+        self._end = last['offset'] + last['size'] if last else 0
+
+    def append(self, stream: str, text: str) -> Optional[TestRunLogChunk]:
+        """Дописывает текст в конец вывода прогона"""
+        if not text:
+            return None
+        if self._seq is None:
+            self._load_position()
+        data = text.encode('utf-8')
+        chunk = TestRunLogChunk.objects.create(
+            test_run_id=self.test_run_id,
+            seq=self._seq + 1,
+            stream=stream,
+            data=data,
+            size=len(data),
+            offset=self._end
+        )
+        self._seq += 1
+        self._end += len(data)
+        return chunk
+
+
+def compact_log(test_run_id: int) -> int:
+    """
+    Объединяет несжатые порции завершенного прогона в сжатые порции до
+    LOG_COMPACT_CHUNK_BYTES байт. Соседние порции одного потока склеиваются,
+    смещения и порядок сохраняются. Возвращает количество удаленных порций.
+    """
+    limit = settings.LOG_COMPACT_CHUNK_BYTES
+    with transaction.atomic():
+        chunks = list(
+            TestRunLogChunk.objects.select_for_update()
+            .filter(test_run_id=test_run_id, compressed=False)
+            .order_by('seq')
+        )
+        if not chunks:
+            return 0
+
+        groups: List[List[TestRunLogChunk]] = []
+        for chunk in chunks:
+            group = groups[-1] if groups else None
+            if (group and group[-1].stream == chunk.stream and group[-1].seq + 1 == chunk.seq
+                    and sum(c.size for c in group) + chunk.size <= limit):
+                group.append(chunk)
+            else:
+                groups.append([chunk])
+
+        compacted = []
+        for group in groups:
+            data = b''.join(bytes(c.data) for c in group)
+            compacted.append(TestRunLogChunk(
+                test_run_id=test_run_id,
+                seq=group[0].seq,
+                stream=group[0].stream,
+                data=zlib.compress(data, settings.LOG_COMPRESSION_LEVEL),
+                size=len(data),
+                offset=group[0].offset,
+                compressed=True
+            ))
+        TestRunLogChunk.objects.filter(id__in=[c.id for c in chunks]).delete()
+        TestRunLogChunk.objects.bulk_create(compacted)
+    return len(chunks)
+
+
+def log_size(test_run_id: int) -> int:
+    """Размер вывода прогона в байтах"""
+    last = TestRunLogChunk.objects.filter(test_run_id=test_run_id).order_by('-seq').values('offset', 'size').first()
+    return last['offset'] + last['size'] if last else 0
+
+
+def _char_boundary(data: bytes, position: int) -> int:
+    """Ближайшая к position не раньше нее граница символа UTF-8"""
+    while position < len(data) and data[position] & 0xC0 == 0x80:
+        position += 1
+    return position
+
+
+def read_log(test_run_id: int, offset: int = 0, limit: Optional[int] = None) -> Dict:
+    """
+    Читает вывод прогона начиная со смещения offset (в байтах; отрицательное -
+    от конца вывода) и не больше limit байт, но не меньше одной порции.
+    Смещение внутри многобайтового символа UTF-8 сдвигается к началу следующего
+    символа, offset ответа - фактическое начало прочитанного текста.
+    next_offset - смещение для следующего запроса при чтении хвоста.
+    """
+    limit = limit or settings.LOG_READ_LIMIT_BYTES
+    if offset < 0:
+        offset = max(log_size(test_run_id) + offset, 0)
+
+    chunks = TestRunLogChunk.objects.filter(test_run_id=test_run_id)
+    # Порция, в которую попадает offset: с нее начинается чтение
+    start = chunks.filter(offset__lte=offset).order_by('-offset').values_list('offset', flat=True).first()
+    if start is not None:
+        chunks = chunks.filter(offset__gte=start)
+
+    parts = []
+    read = 0
+    next_offset = offset
+    for chunk in chunks.order_by('seq').iterator():
+        content = chunk.content
+        # Порции пишутся целыми строками, граница символа может оказаться только внутри порции
+        skip = _char_boundary(content, offset - chunk.offset) if offset > chunk.offset else 0
+        data = content[skip:]
+        if not data:
+            continue
+        if parts and read + len(data) > limit:
+            break
+        parts.append({
+            'seq': chunk.seq,
+            'stream': chunk.stream,
+            'offset': chunk.offset + skip,
+            'text': data.decode('utf-8', errors='replace')
+        })
+        read += len(data)
+        next_offset = chunk.offset + chunk.size
+
+    return {
+        'offset': parts[0]['offset'] if parts else offset,
+        'next_offset': next_offset,
+        'text': ''.join(part['text'] for part in parts),
+        'chunks': parts
+    }
+
+
+def log_tail(test_run, limit: Optional[int] = None) -> str:
+    """
+    Последние limit байт вывода прогона (по умолчанию LOG_READ_LIMIT_BYTES);
+    для запусков без порций вывода - сохраненный вывод запуска
+    """
+    limit = limit or settings.LOG_READ_LIMIT_BYTES
+    return read_log(test_run.id, -limit, limit)['text'] or test_run.output_text or ''
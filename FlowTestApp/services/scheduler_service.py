@@ -6,7 +6,9 @@ from .batch_test_runner import BatchTestRunner
 
 class SchedulerService:
     def __init__(self):
-        self.batch_runner = BatchTestRunner()
+        # Плановые прогоны большие, поэтому pytest-тесты запускаются одной сессией на проект,
+        # а неизменившиеся тесты проектов с включенным кэшем результатов не выполняются
+        self.batch_runner = BatchTestRunner(batched=True, use_cache=True)
 
     def process_due_events(self):
         """
@@ -0,0 +1,83 @@
+import heapq
+import os
+import statistics
+from typing import Dict, List
+from django.db.models import Avg
+from ..models import AutomationProject, TestRun
+
+# Оценка длительности теста без истории запусков, в секундах
+DEFAULT_TEST_DURATION = 1.0
+
+
+def get_shard_count(project: AutomationProject, tests_count: int) -> int:
+    """Количество шардов: настройка проекта или число ядер, но не больше числа тестов"""
+    shard_count = project.shard_count or os.cpu_count() or 1
+    return max(1, min(shard_count, tests_count))
+
+
+def estimate_durations(project: AutomationProject, tests) -> Dict[int, float]:
+    """
+    Оценивает длительность каждого AutomationTest по истории TestRun.execution_time.
+    История хранится по файлу (TestCase.script_path), поэтому среднее время файла
+    делится между тестами этого файла. Для тестов без истории берется медиана.
+    """
+    tests = list(tests)
+    file_paths = {test.file_path for test in tests}
+    file_durations = dict(
+        TestRun.objects.filter(
+            test_case__automation_project=project,
+            test_case__script_path__in=file_paths,
+            execution_time__isnull=False
+        ).values('test_case__script_path').annotate(
+            avg=Avg('execution_time')
+        ).values_list('test_case__script_path', 'avg')
+    )
+
+    tests_per_file = {}
+    for test in tests:
+        tests_per_file[test.file_path] = tests_per_file.get(test.file_path, 0) + 1
+
+    known = {
+        test.id: file_durations[test.file_path] / tests_per_file[test.file_path]
+        for test in tests if file_durations.get(test.file_path)
+    }
+    fallback = statistics.median(known.values()) if known else DEFAULT_TEST_DURATION
+    return {test.id: known.get(test.id, fallback) for test in tests}
+
+
+def plan_shards(tests, durations: Dict[int, float], shard_count: int) -> List[Dict]:
+    """
+    Раскладывает тесты по шардам методом LPT: самые долгие тесты идут первыми,
+    каждый тест попадает в шард с наименьшей суммарной длительностью
+    """
+    shards = [{'tests': [], 'estimated_duration': 0.0} for _ in range(shard_count)]
+    heap = [(0.0, index) for index in range(shard_count)]
+    for test in sorted(tests, key=lambda t: durations.get(t.id, DEFAULT_TEST_DURATION), reverse=True):
+        load, index = heapq.heappop(heap)
+        duration = durations.get(test.id, DEFAULT_TEST_DURATION)
+        shards[index]['tests'].append(test)
+        shards[index]['estimated_duration'] += duration
+        heapq.heappush(heap, (load + duration, index))
+    return [shard for shard in shards if shard['tests']]
+
+
+def merge_shard_results(shards: List[Dict], results: List[Dict]) -> Dict:
+    """Объединяет результаты шардов в один ответ в формате AutomationService._run_command"""
+    output, errors, summary = [], [], []
+    for index, (shard, result) in enumerate(zip(shards, results), start=1):
+        header = f"===== Shard {index}/{len(shards)} ({len(shard['tests'])} tests) ====="
+        output.append(f"{header}\n{result.get('output', '')}")
+        if result.get('error'):
+            errors.append(f"{header}\n{result['error']}")
+        summary.append({
+            'tests': [getattr(test, 'name', test) for test in shard['tests']],
+            'estimated_duration': round(shard['estimated_duration'], 2),
+            'success': result.get('success', False)
+        })
+
+    return {
+        'success': all(result.get('success', False) for result in results),
+        'output': '\n'.join(output),
+        'error': '\n'.join(errors),
+        'shards': summary
+    }
@@ -0,0 +1,165 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from ..models import ExecutionProfile, SuiteRun, TestCase, TestEvent, TestReport, TestRun
+
+# Счетчик SuiteRun, в который попадает итоговый статус TestRun
+STATUS_COUNTERS = {
+    'passed': 'passed_tests',
+    'failed': 'failed_tests',
+    'error': 'failed_tests',
+    'skipped': 'skipped_tests',
+    'cancelled': 'skipped_tests',
+    'flaky': 'flaky_tests',
+}
+
+TEST_RUN_RESULT_FIELDS = ['status', 'finished_at', 'execution_time', 'error_message', 'output_blob', 'output_size']
+TEST_REPORT_RESULT_FIELDS = ['status', 'execution_time', 'actual_result_blob', 'actual_result_size', 'comments']
+
+
+def increment_counters(suite_run_id: int, statuses: Iterable[str]):
+    """Увеличивает счетчики прогона по итоговым статусам тестов одним UPDATE"""
+    counts = Counter(STATUS_COUNTERS[status] for status in statuses if status in STATUS_COUNTERS)
+    if not counts:
+        return
+    updates = {field: F(field) + count for field, count in counts.items()}
+    updates['completed_tests'] = F('completed_tests') + sum(counts.values())
+    SuiteRun.objects.filter(id=suite_run_id).update(**updates)
+
+
+class SuiteRecorder:
+    """
+    Записи пакетного прогона: родительский SuiteRun и дочерние TestRun, TestReport и TestEvent.
+
+    Дочерние записи группы тестов создаются bulk_create и после выполнения
+    обновляются bulk_update в одной транзакции вместо нескольких запросов на тест.
+    Счетчики SuiteRun увеличиваются выражениями F по первым попыткам тестов,
+    поэтому дашбордам не нужно пересчитывать дочерние записи.
+    Без SuiteRun рекордер только группирует записи.
+    """
+
+    def __init__(self, suite_run: Optional[SuiteRun] = None):
+        self.suite_run = suite_run
+
+    @classmethod
+    def start(cls, test_cases: List[TestCase], profile: Optional[ExecutionProfile] = None,
+              retry_of: Optional[SuiteRun] = None) -> 'SuiteRecorder':
+        """
+        Создает SuiteRun для набора тестов
+        :param retry_of: Прогон, упавшие тесты которого перезапускаются
+        """
+        automation_projects = {test_case.automation_project_id for test_case in test_cases}
+        suite_run = SuiteRun.objects.create(
+            project=test_cases[0].project if test_cases else None,
+            automation_project=test_cases[0].automation_project if len(automation_projects) == 1 else None,
+            execution_profile=profile,
+            retry_of=retry_of,
+            status='running',
+            started_at=timezone.now(),
+            total_tests=len(test_cases)
+        )
+        return cls(suite_run)
+
+    @staticmethod
+    def failed_test_cases(suite_run: SuiteRun) -> List[TestCase]:
+        """Тесты прогона BatchTestRunner, первая попытка которых упала или завершилась ошибкой"""
+        test_case_ids = (
+            TestRun.objects.filter(suite_run=suite_run, attempt=1, status__in=('failed', 'error'))
+            .values_list('test_case_id', flat=True)
+        )
+        return list(
+            TestCase.objects.filter(id__in=test_case_ids)
+            .select_related('project', 'automation_project')
+            .order_by('id')
+        )
+
+    def create_runs(self, test_cases: List[TestCase], profile: ExecutionProfile, status: str,
+                    retry_of: Optional[Dict[int, TestRun]] = None, attempt: int = 1,
+                    details: Optional[Dict] = None) -> Dict[int, Tuple[TestRun, TestReport]]:
+        """
+        Создает TestRun, TestReport и событие начала для каждого теста группы.
+        Возвращает записи по id TestCase.
+        """
+        retry_of = retry_of or {}
+        now = timezone.now()
+        with transaction.atomic():
+            test_runs = TestRun.objects.bulk_create([
+                TestRun(
+                    test_case=test_case,
+                    project_id=test_case.project_id,
+                    status=status,
+                    started_at=now,
+                    execution_profile=profile,
+                    retry_of=retry_of.get(test_case.id),
+                    attempt=attempt,
+                    suite_run=self.suite_run
+                )
+                for test_case in test_cases
+            ])
+            test_reports = TestReport.objects.bulk_create([
+                TestReport(test_case=test_case, status='in_progress') for test_case in test_cases
+            ])
+            TestEvent.objects.bulk_create([
+                TestEvent(
+                    test_case=test_case,
+                    test_report=test_report,
+                    event_type='start',
+                    description='Test execution started',
+                    severity='info',
+                    details={'framework': test_case.framework, 'profile': profile.name, **(details or {})}
+                )
+                for test_case, test_report in zip(test_cases, test_reports)
+            ])
+        return {
+            test_case.id: (test_run, test_report)
+            for test_case, test_run, test_report in zip(test_cases, test_runs, test_reports)
+        }
+
+    def save_results(self, test_runs: List[TestRun], test_reports: List[TestReport], events: List[TestEvent]):
+        """
+        Сохраняет результаты группы: TestRun и TestReport через bulk_update, события
+        завершения через bulk_create; затем обновляет счетчики прогона
+        """
+        for test_run in test_runs:
+            # bulk_update не вызывает TestRun.save, длительность считается здесь
+            if test_run.started_at and test_run.finished_at and not test_run.execution_time:
+                test_run.execution_time = (test_run.finished_at - test_run.started_at).total_seconds()
+        with transaction.atomic():
+            if test_runs:
+                TestRun.objects.bulk_update(test_runs, TEST_RUN_RESULT_FIELDS)
+            if test_reports:
+                TestReport.objects.bulk_update(test_reports, TEST_REPORT_RESULT_FIELDS)
+            if events:
+                TestEvent.objects.bulk_create(events)
+        self.count(test_run.status for test_run in test_runs if test_run.attempt == 1)
+
+    def count(self, statuses: Iterable[str]):
+        """Учитывает в счетчиках прогона тесты с итоговыми статусами statuses"""
+        if self.suite_run is not None:
+            increment_counters(self.suite_run.id, statuses)
+
+    def mark_flaky(self, test_runs: List[TestRun]):
+        """Переводит первые попытки тестов, прошедших при перезапуске, в статус flaky"""
+        if not test_runs:
+            return
+        TestRun.objects.filter(id__in=[test_run.id for test_run in test_runs]).update(status='flaky')
+        if self.suite_run is not None:
+            moved = Counter(STATUS_COUNTERS.get(test_run.status) for test_run in test_runs)
+            updates = {field: F(field) - count for field, count in moved.items() if field}
+            updates['flaky_tests'] = F('flaky_tests') + len(test_runs)
+            SuiteRun.objects.filter(id=self.suite_run.id).update(**updates)
+        for test_run in test_runs:
+            test_run.status = 'flaky'
+
+    def complete(self, status: Optional[str] = None, error: Optional[str] = None):
+        """Завершает прогон; без явного статуса - passed, если не упал ни один тест"""
+        if self.suite_run is None:
+            return
+        suite_run = self.suite_run
+        suite_run.refresh_from_db()
+        suite_run.status = status or ('failed' if suite_run.failed_tests else 'passed')
+        suite_run.error_message = error
+        suite_run.finished_at = timezone.now()
+        suite_run.save(update_fields=['status', 'error_message', 'finished_at'])
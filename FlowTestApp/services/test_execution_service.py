@@ -1,45 +1,94 @@
 import os
 import json
 import logging
+import platform
 import tempfile
 from datetime import datetime
 from selenium import webdriver
 from selenium.webdriver.support.events import EventFiringWebDriver, AbstractEventListener
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
-from ..models import TestRun
+from typing import Optional
+from ..models import TestEvent, TestRun
+from .process_tree import kill_process_tree
+from .timeouts import ExecutionTimeout, call_with_timeout, get_test_timeout
+from .zygote import run_isolated, use_zygote
+from .code_cache import compile_test_code
+from .event_buffer import EventBuffer, event_update
 from django.conf import settings
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
 class SeleniumEventListener(AbstractEventListener):
-    def __init__(self, test_run):
-        self.test_run = test_run
+    def __init__(self, test_case_id=None, events: Optional[EventBuffer] = None):
+        """
+        :param test_case_id: Тест, к которому относятся события действий
+        :param events: Буфер событий запуска; без него действия только попадают в журнал
+        """
+        self.test_case_id = test_case_id
+        self.events = events
         self.browser_logs = []
         self.start_time = None
+
+    def _log(self, entry, description):
+        self.browser_logs.append(entry)
+        if self.events:
+            event = TestEvent(
+                test_case_id=self.test_case_id,
+                event_type='step_complete',
+                description=description,
+                details=entry
+            )
+            self.events.add(event, event_update(event, 'running'))
         
     def before_navigate_to(self, url, driver):
-        self.browser_logs.append({
+        self._log({
             'action': 'navigate',
             'url': url,
             'timestamp': datetime.now().isoformat()
-        })
+        }, f'Navigate to {url}')
         
     def before_click(self, element, driver):
-        self.browser_logs.append({
+        self._log({
             'action': 'click',
             'element': element.tag_name,
             'text': element.text,
             'timestamp': datetime.now().isoformat()
-        })
+        }, f'Click {element.tag_name}')
         
     def before_change_value_of(self, element, driver):
-        self.browser_logs.append({
+        self._log({
             'action': 'input',
             'element': element.tag_name,
             'timestamp': datetime.now().isoformat()
-        })
+        }, f'Input into {element.tag_name}')
+
+def _run_selenium_code(test_code, chrome_arguments, test_run_id, test_case_id):
+    """
+    Выполняет код Selenium-теста в процессе зиготы и возвращает журнал действий браузера.
+    chromedriver и Chrome - потомки процесса и убиваются вместе с ним по таймауту.
+    События действий пишет буфер этого процесса: спул убитого процесса дописывает replay_spool.
+    """
+    code = compile_test_code(test_code)
+    chrome_options = Options()
+    for argument in chrome_arguments:
+        chrome_options.add_argument(argument)
+    events = EventBuffer(test_run_id)
+    try:
+        chrome_driver = webdriver.Chrome(options=chrome_options)
+        event_listener = SeleniumEventListener(test_case_id, events)
+        driver = EventFiringWebDriver(chrome_driver, event_listener)
+        try:
+            exec(code, {'webdriver': webdriver, 'driver': driver})
+            return event_listener.browser_logs
+        finally:
+            driver.quit()
+    finally:
+        events.close()
+
+def _run_api_code(test_code, temp_dir):
+    exec(compile_test_code(test_code), {'temp_dir': temp_dir})
 
 class TestExecutionService:
     def __init__(self):
@@ -90,27 +139,57 @@ class TestExecutionService:
         chrome_options.add_argument(f'--use-fake-ui-for-media-stream')
         chrome_options.add_argument(f'--enable-usermedia-screen-capturing')
         
-        driver = webdriver.Chrome(options=chrome_options)
-        event_listener = SeleniumEventListener(test_run)
-        driver = EventFiringWebDriver(driver, event_listener)
-        
         try:
-            # Выполняем тест
-            exec(test_run.test_case.test_code, {'webdriver': webdriver, 'driver': driver})
+            # Синтаксическая ошибка обнаруживается до запуска браузера
+            compile_test_code(test_run.test_case.test_code)
+            timeout = get_test_timeout(test_run.test_case)
+            if use_zygote():
+                # Тест и браузер выполняются в процессе зиготы: падение не затрагивает воркер
+                browser_logs = run_isolated(
+                    _run_selenium_code,
+                    (test_run.test_case.test_code, chrome_options.arguments, test_run.id, test_run.test_case_id),
+                    timeout=timeout
+                )
+            else:
+                browser_logs = self._run_selenium_inline(test_run, chrome_options, timeout)
             
             # Сохраняем результаты
             test_run.status = 'success'
-            test_run.browser_logs = event_listener.browser_logs
+            test_run.browser_logs = browser_logs
             test_run.selenium_video_path = video_path
             
+        except ExecutionTimeout as e:
+            test_run.status = 'error'
+            test_run.error_message = str(e)
+
         except Exception as e:
             test_run.status = 'failed'
             test_run.error_message = str(e)
             
         finally:
-            driver.quit()
             test_run.end_time = timezone.now()
             test_run.save()
+
+    def _run_selenium_inline(self, test_run, chrome_options, timeout):
+        """Выполняет Selenium тест в процессе воркера и возвращает журнал действий браузера"""
+        code = compile_test_code(test_run.test_case.test_code)
+        events = EventBuffer(test_run.id)
+        try:
+            chrome_driver = webdriver.Chrome(options=chrome_options)
+            event_listener = SeleniumEventListener(test_run.test_case_id, events)
+            driver = EventFiringWebDriver(chrome_driver, event_listener)
+            try:
+                # Зависший тест прерывается убийством chromedriver вместе с браузером
+                call_with_timeout(
+                    lambda: exec(code, {'webdriver': webdriver, 'driver': driver}),
+                    timeout,
+                    on_timeout=lambda: kill_process_tree(chrome_driver.service.process.pid)
+                )
+                return event_listener.browser_logs
+            finally:
+                driver.quit()
+        finally:
+            events.close()
             
     def execute_api_test(self, test_run):
         """
@@ -126,11 +205,20 @@ class TestExecutionService:
                     'timestamp': datetime.now().isoformat()
                 }
                 
-                # Выполняем тест
-                exec(test_run.test_case.test_code, {'temp_dir': temp_dir})
+                timeout = get_test_timeout(test_run.test_case)
+                if use_zygote():
+                    # Зависший процесс зиготы убивается по таймауту
+                    run_isolated(_run_api_code, (test_run.test_case.test_code, temp_dir), timeout=timeout)
+                else:
+                    # Зависший поток прервать нельзя, но слот воркера освобождается
+                    call_with_timeout(lambda: _run_api_code(test_run.test_case.test_code, temp_dir), timeout)
                 
                 test_run.status = 'success'
                 
+        except ExecutionTimeout as e:
+            test_run.status = 'error'
+            test_run.error_message = str(e)
+
         except Exception as e:
             test_run.status = 'failed'
             test_run.error_message = str(e)
@@ -1,23 +1,41 @@
 import os
-import subprocess
 import json
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from django.utils import timezone
-from ..models import TestCase, AutomationTest, TestRun, TestReport, TestEvent
+from ..models import TestCase, AutomationTest, TestRun, TestReport, TestEvent, ExecutionProfile
+from .process_runner import run_streaming
+from .cancellation import CANCEL_REASON
+from .timeouts import get_test_timeout, timeout_reason
+from .event_buffer import EventBuffer, event_update
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
 class TestRunner:
-    def __init__(self, test_case: TestCase):
+    def __init__(self, test_case: TestCase, profile: Optional[ExecutionProfile] = None,
+                 retry_of: Optional[TestRun] = None, attempt: int = 1):
+        """
+        :param retry_of: Первая попытка, если это перезапуск упавшего теста
+        :param attempt: Номер попытки
+        """
         self.test_case = test_case
+        self.profile = profile or ExecutionProfile.get_default()
+        self.retry_of = retry_of
+        self.attempt = attempt
         self.automation_test = AutomationTest.objects.get(project=test_case.automation_project, file_path=test_case.script_path)
-        self.repo_path = Path(f"temp_repos/{test_case.automation_project.project.id}/{hash(test_case.automation_project.repository_url)}")
+        self.repo_path = self.get_repo_path(test_case.automation_project)
+        self.timeout = get_test_timeout(test_case)
         self.test_run = None
         self.test_report = None
+        self.events = None
         self.channel_layer = get_channel_layer()
 
+    @staticmethod
+    def get_repo_path(automation_project) -> Path:
+        """Путь к локальной копии репозитория проекта автоматизации"""
+        return Path(f"temp_repos/{automation_project.project.id}/{hash(automation_project.repository_url)}")
+
     def _send_update(self, data):
         """Отправляет обновление через WebSocket"""
         if self.test_run:
@@ -30,46 +48,64 @@ class TestRunner:
             )
 
     def _create_event(self, event_type, description, severity='info', details=None):
-        """Создает событие и отправляет обновление через WebSocket"""
-        event = TestEvent.objects.create(
+        """
+        Создает событие и отправляет обновление через WebSocket. Если для запуска
+        открыт буфер событий, запись и отправка выполняются им с задержкой
+        """
+        self._record_event(TestEvent(
             test_case=self.test_case,
             test_report=self.test_report,
             event_type=event_type,
             description=description,
             severity=severity,
             details=details
-        )
-        
-        self._send_update({
-            'event': {
-                'type': event.event_type,
-                'description': event.description,
-                'severity': event.severity,
-                'timestamp': event.timestamp.isoformat()
-            },
-            'status': self.test_run.status if self.test_run else None
-        })
-
-    def _prepare_environment(self) -> bool:
+        ))
+
+    def _record_event(self, event: TestEvent):
+        if self.events:
+            self.events.add(event, self._event_update(event))
+            return
+        event.save()
+        self.notify_event(event)
+
+    def _event_update(self, event: TestEvent) -> Dict:
+        return event_update(event, self.test_run.status if self.test_run else None)
+
+    def notify_event(self, event: TestEvent):
+        """Отправляет сохраненное событие через WebSocket"""
+        self._send_update(self._event_update(event))
+
+    def _get_env(self) -> Dict:
+        """Окружение процесса теста с переменными профиля выполнения"""
+        env = os.environ.copy()
+        env.update(self.profile.environment())
+        return env
+
+    def prepare(self) -> bool:
         """Подготавливает окружение для запуска теста"""
         try:
             # Создаем TestRun и TestReport
             self.test_run = TestRun.objects.create(
                 test_case=self.test_case,
-                status='in_progress'
+                status='in_progress',
+                execution_profile=self.profile,
+                retry_of=self.retry_of,
+                attempt=self.attempt
             )
             
             self.test_report = TestReport.objects.create(
                 test_case=self.test_case,
                 status='in_progress'
             )
+            # События запуска пишутся пачками, спул сохраняет их при падении процесса
+            self.events = EventBuffer(self.test_run.id)
 
             # Логируем начало выполнения
             self._create_event(
                 'start',
                 'Test execution started',
                 'info',
-                {'framework': self.test_case.framework}
+                {'framework': self.test_case.framework, 'profile': self.profile.name}
             )
 
             return True
@@ -77,174 +113,181 @@ class TestRunner:
             print(f"Error preparing environment: {str(e)}")
             return False
 
-    def _run_pytest(self) -> Dict:
-        """Запускает тест с помощью pytest"""
-        try:
-            result = subprocess.run(
-                [
-                    'pytest',
-                    self.automation_test.file_path,
-                    '-v'
-                ],
-                cwd=str(self.repo_path),
-                capture_output=True,
-                text=True
-            )
+    def attach(self, test_run: TestRun, test_report: TestReport):
+        """Использует записи, созданные для группы тестов (SuiteRecorder.create_runs), вместо prepare"""
+        self.test_run = test_run
+        self.test_report = test_report
 
-            return {
-                'success': result.returncode == 0,
-                'output': result.stdout,
-                'error': result.stderr
-            }
-        except Exception as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
+    def build_command(self) -> Optional[Dict]:
+        """
+        Команда запуска теста для фреймворка: {'cmd', 'cwd', 'env', 'timeout'}.
+        Возвращает None, если фреймворк не поддерживается.
+        """
+        builders = {
+            'pytest': self._pytest_command,
+            'robot': self._robot_command,
+            'cypress': self._cypress_command,
+            'playwright': self._playwright_command
+        }
+        builder = builders.get(self.automation_test.framework)
+        if not builder:
+            return None
+        return {
+            'cmd': builder(),
+            'cwd': str(self.repo_path),
+            'env': self._get_env(),
+            'timeout': self.timeout
+        }
 
-    def _run_robot(self) -> Dict:
-        """Запускает тест с помощью Robot Framework"""
-        try:
-            output_dir = self.repo_path / 'results'
-            output_dir.mkdir(exist_ok=True)
-            
-            result = subprocess.run(
-                [
-                    'robot',
-                    '--outputdir', str(output_dir),
-                    '--output', 'output.xml',
-                    '--report', 'report.html',
-                    '--log', 'log.html',
-                    self.automation_test.file_path
-                ],
-                cwd=str(self.repo_path),
-                capture_output=True,
-                text=True
-            )
+    def _pytest_command(self) -> List[str]:
+        return [
+            'pytest',
+            self.automation_test.file_path,
+            '-v',
+            *self.profile.pytest_args(check_plugin=True)
+        ]
 
-            return {
-                'success': result.returncode == 0,
-                'output': result.stdout,
-                'error': result.stderr,
-                'report_dir': str(output_dir)
-            }
-        except Exception as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
+    def _robot_command(self) -> List[str]:
+        output_dir = self.repo_path / 'results'
+        output_dir.mkdir(exist_ok=True)
+        return [
+            'robot',
+            '--outputdir', str(output_dir),
+            '--output', 'output.xml',
+            '--report', 'report.html',
+            '--log', 'log.html',
+            self.automation_test.file_path
+        ]
 
-    def _run_cypress(self) -> Dict:
-        """Запускает тест с помощью Cypress"""
-        try:
-            result = subprocess.run(
-                [
-                    'npx',
-                    'cypress',
-                    'run',
-                    '--spec', self.automation_test.file_path,
-                    '--reporter', 'json'
-                ],
-                cwd=str(self.repo_path),
-                capture_output=True,
-                text=True
-            )
+    def _cypress_command(self) -> List[str]:
+        return [
+            'npx',
+            'cypress',
+            'run',
+            '--spec', self.automation_test.file_path,
+            '--reporter', 'json',
+            *([] if self.profile.headless else ['--headed'])
+        ]
 
-            try:
-                output = json.loads(result.stdout)
-            except:
-                output = {'stdout': result.stdout}
-
-            return {
-                'success': result.returncode == 0,
-                'output': output,
-                'error': result.stderr
-            }
-        except Exception as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
-
-    def _run_playwright(self) -> Dict:
-        """Запускает тест с помощью Playwright"""
-        try:
-            result = subprocess.run(
-                [
-                    'npx',
-                    'playwright',
-                    'test',
-                    self.automation_test.file_path,
-                    '--reporter', 'json'
-                ],
-                cwd=str(self.repo_path),
-                capture_output=True,
-                text=True
-            )
+    def _playwright_command(self) -> List[str]:
+        return [
+            'npx',
+            'playwright',
+            'test',
+            self.automation_test.file_path,
+            '--reporter', 'json',
+            *([] if self.profile.headless else ['--headed'])
+        ]
 
+    def parse_result(self, result: Dict) -> Dict:
+        """Приводит результат процесса к результату теста с учетом фреймворка"""
+        output = result['stdout']
+        if self.automation_test.framework in ('cypress', 'playwright'):
+            # Репортер json пишет отчет в stdout
             try:
-                output = json.loads(result.stdout)
+                output = json.loads(result['stdout'])
             except:
-                output = {'stdout': result.stdout}
+                output = {'stdout': result['stdout']}
 
-            return {
-                'success': result.returncode == 0,
-                'output': output,
-                'error': result.stderr
-            }
-        except Exception as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
+        results = {
+            'success': result['returncode'] == 0,
+            'output': output,
+            'error': result['stderr']
+        }
+        if result.get('timed_out'):
+            results['timed_out'] = True
+            results['error'] = f"{timeout_reason(self.timeout)}\n{result['stderr']}"
+        elif result.get('cancelled'):
+            results['cancelled'] = True
+            results['error'] = f"{CANCEL_REASON}\n{result['stderr']}"
+        if self.automation_test.framework == 'robot':
+            results['report_dir'] = str(self.repo_path / 'results')
+        return results
 
-    def _process_results(self, results: Dict):
+    def finalize(self, results: Dict):
         """Обрабатывает результаты выполнения теста"""
         try:
-            # Обновляем TestRun
-            self.test_run.status = 'passed' if results['success'] else 'failed'
+            event = self.apply_result(results)
             self.test_run.save()
-
-            # Обновляем TestReport
-            self.test_report.status = 'passed' if results['success'] else 'failed'
-            self.test_report.execution_time = timezone.now() - self.test_report.execution_date
-            
-            if 'error' in results and results['error']:
-                self.test_report.comments = results['error']
-            
             self.test_report.save()
 
             # Создаем событие о завершении
-            self._create_event(
-                'finish',
-                'Test execution finished',
-                'info' if results['success'] else 'error',
-                results
-            )
+            self._record_event(event)
 
         except Exception as e:
             print(f"Error processing results: {str(e)}")
+        finally:
+            self.close_events()
+
+    def close_events(self):
+        """Сбрасывает буфер событий запуска в конце теста"""
+        if self.events:
+            self.events.close()
+            self.events = None
+
+    def apply_result(self, results: Dict) -> TestEvent:
+        """
+        Переносит результат в TestRun и TestReport без сохранения и возвращает
+        несохраненное событие завершения; пакетный запуск сохраняет их группой
+        """
+        # Обновляем TestRun; тест, прерванный по таймауту, завершается ошибкой
+        if results.get('cancelled'):
+            self.test_run.status = 'cancelled'
+            self.test_run.error_message = CANCEL_REASON
+        elif results.get('skipped'):
+            # Тест не выполнен или прерван fail-fast после падений других тестов набора
+            self.test_run.status = 'skipped'
+            self.test_run.error_message = results.get('error')
+        elif results.get('timed_out'):
+            self.test_run.status = 'error'
+            self.test_run.error_message = timeout_reason(self.timeout)
+        else:
+            self.test_run.status = 'passed' if results['success'] else 'failed'
+        self.test_run.finished_at = timezone.now()
+
+        # Обновляем TestReport
+        self.test_report.status = 'passed' if results['success'] else 'failed'
+        self.test_report.execution_time = timezone.now() - self.test_report.execution_date
+
+        if 'error' in results and results['error']:
+            self.test_report.comments = results['error']
+
+        return TestEvent(
+            test_case=self.test_case,
+            test_report=self.test_report,
+            event_type='finish',
+            description='Test execution finished',
+            severity='info' if results['success'] else 'error',
+            details=results
+        )
 
     def run(self) -> Optional[Dict]:
         """Запускает тест и возвращает результаты"""
-        if not self._prepare_environment():
+        if not self.prepare():
             return None
 
-        # Выбираем подходящий runner в зависимости от фреймворка
-        runners = {
-            'pytest': self._run_pytest,
-            'robot': self._run_robot,
-            'cypress': self._run_cypress,
-            'playwright': self._run_playwright
-        }
-
-        runner = runners.get(self.automation_test.framework)
-        if not runner:
+        # Команда запуска зависит от фреймворка
+        command = self.build_command()
+        if not command:
+            self.close_events()
             return {
                 'success': False,
                 'error': f'Unsupported test framework: {self.automation_test.framework}'
             }
 
-        results = runner()
-        self._process_results(results)
+        try:
+            results = self.parse_result(run_streaming(
+                command['cmd'],
+                cwd=command['cwd'],
+                env=command['env'],
+                test_run=self.test_run,
+                timeout=command['timeout']
+            ))
+        except Exception as e:
+            results = {
+                'success': False,
+                'error': str(e)
+            }
+
+        self.finalize(results)
         return results
@@ -0,0 +1,125 @@
+import asyncio
+import sys
+import threading
+import time
+from unittest import mock
+from django.test import SimpleTestCase
+from ..async_engine import AsyncExecutionEngine, ProcessJob, _Slots
+
+
+def _job(key, code: str, timeout=None) -> ProcessJob:
+    return ProcessJob(key, [sys.executable, '-u', '-c', code], timeout=timeout)
+
+
+SLEEPER = "import time\nprint('started', flush=True)\ntime.sleep(60)"
+
+
+class SlotsTests(SimpleTestCase):
+    def test_raising_limit_releases_waiters(self):
+        async def scenario():
+            slots = _Slots(1)
+            entered = []
+
+            async def worker(name):
+                async with slots:
+                    entered.append(name)
+                    await asyncio.sleep(0.2)
+
+            tasks = [asyncio.create_task(worker(name)) for name in ('a', 'b')]
+            await asyncio.sleep(0.05)
+            blocked = list(entered)
+            await slots.set_limit(2)
+            await asyncio.sleep(0.05)
+            unblocked = list(entered)
+            await asyncio.gather(*tasks)
+            return blocked, unblocked, slots.in_flight
+
+        blocked, unblocked, in_flight = asyncio.run(scenario())
+
+        self.assertEqual(blocked, ['a'])
+        self.assertEqual(unblocked, ['a', 'b'])
+        self.assertEqual(in_flight, 0)
+
+    def test_lowering_limit_blocks_new_entries(self):
+        async def scenario():
+            slots = _Slots(2)
+            await slots.__aenter__()
+            await slots.set_limit(1)
+            waiter = asyncio.create_task(slots.__aenter__())
+            await asyncio.sleep(0.05)
+            blocked = not waiter.done()
+            await slots.__aexit__(None, None, None)
+            await asyncio.wait_for(waiter, 1)
+            return blocked, slots.in_flight
+
+        blocked, in_flight = asyncio.run(scenario())
+
+        self.assertTrue(blocked)
+        self.assertEqual(in_flight, 1)
+
+
+class AsyncExecutionEngineTests(SimpleTestCase):
+    def _engine(self, **kwargs) -> AsyncExecutionEngine:
+        return AsyncExecutionEngine(concurrency=kwargs.pop('concurrency', 4), flush_interval=0.05, **kwargs)
+
+    def test_output_and_return_codes(self):
+        results = self._engine().run([
+            _job('ok', "print('one')\nprint('two')"),
+            _job('fail', "import sys\nprint('err', file=sys.stderr)\nsys.exit(2)"),
+        ])
+
+        self.assertEqual((results['ok']['returncode'], results['ok']['stdout']), (0, 'one\ntwo\n'))
+        self.assertEqual((results['fail']['returncode'], results['fail']['stderr']), (2, 'err\n'))
+
+    def test_line_longer_than_read_limit_is_kept(self):
+        code = "print('я' * 3000)\nprint('tail', end='')"
+        with mock.patch('FlowTestApp.services.async_engine.READ_LIMIT', 1000):
+            result = self._engine().run([_job('long', code)])['long']
+
+        self.assertEqual(result['stdout'], 'я' * 3000 + '\ntail')
+
+    def test_timeout_kills_process(self):
+        started = time.monotonic()
+        result = self._engine().run([_job('slow', SLEEPER, timeout=0.5)])['slow']
+
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertTrue(result['timed_out'])
+        self.assertFalse(result['cancelled'])
+        self.assertEqual(result['stdout'], 'started\n')
+
+    def test_cancel_from_another_thread(self):
+        engine = self._engine()
+        timer = threading.Timer(0.5, engine.cancel, args=['slow'])
+        timer.start()
+        try:
+            results = engine.run([_job('slow', SLEEPER), _job('fast', "print('done')")])
+        finally:
+            timer.cancel()
+
+        self.assertTrue(results['slow']['cancelled'])
+        self.assertFalse(results['fast']['cancelled'])
+        self.assertEqual(results['fast']['stdout'], 'done\n')
+
+    def test_cancel_before_run(self):
+        engine = self._engine()
+        engine.cancel()
+
+        results = engine.run([_job('a', SLEEPER), _job('b', SLEEPER)])
+
+        self.assertTrue(all(result['cancelled'] for result in results.values()))
+
+    def test_fail_fast_callback_cancels_other_jobs(self):
+        results = self._engine().run(
+            [_job('fail', "import sys\nsys.exit(1)"), _job('slow', SLEEPER)],
+            on_result=lambda key, result: result['returncode'] != 0
+        )
+
+        self.assertEqual(results['fail']['returncode'], 1)
+        self.assertTrue(results['slow']['cancelled'])
+
+    def test_concurrency_limit_is_respected(self):
+        code = "import time\ntime.sleep(0.3)"
+        started = time.monotonic()
+        self._engine(concurrency=1).run([_job(index, code) for index in range(3)])
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.9)
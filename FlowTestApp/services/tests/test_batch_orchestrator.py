@@ -0,0 +1,99 @@
+from django.test import TestCase
+from ...models import AutomationProject, AutomationTest, Project, SuiteRun
+from ..batch_orchestrator import BatchOrchestrator
+
+
+def _passed(index, output=''):
+    return {'shard_index': index, 'success': True, 'output': output or f'shard {index} ok', 'error': ''}
+
+
+def _failed(index):
+    return {'shard_index': index, 'success': False, 'output': f'shard {index} failed', 'error': f'error {index}'}
+
+
+class CompleteShardTests(TestCase):
+    def setUp(self):
+        project = Project.objects.create(name='Project')
+        self.automation_project = AutomationProject.objects.create(
+            name='Automation', project=project, repository_url='https://example.com/repo.git'
+        )
+        tests = [
+            AutomationTest.objects.create(project=self.automation_project, name=f'test_{i}', file_path='tests/test_a.py')
+            for i in range(5)
+        ]
+        # Шарды по 2, 2 и 1 тесту
+        groups = [tests[0:2], tests[2:4], tests[4:5]]
+        self.suite_run = SuiteRun.objects.create(
+            project=project,
+            automation_project=self.automation_project,
+            status='running',
+            total_shards=len(groups),
+            total_tests=len(tests),
+            shards=[
+                {
+                    'index': index, 'task_id': f'task-{index}', 'test_ids': [test.id for test in group],
+                    'estimated_duration': 1.0, 'status': 'pending', 'worker': None, 'attempts': 0, 'success': None
+                }
+                for index, group in enumerate(groups)
+            ]
+        )
+
+    def _complete(self, index, result):
+        return BatchOrchestrator.complete_shard(self.suite_run.id, index, result)
+
+    def test_out_of_order_completion_triggers_aggregation_once(self):
+        self.assertFalse(self._complete(2, _passed(2)))
+        self.assertFalse(self._complete(0, _passed(0)))
+        self.assertTrue(self._complete(1, _failed(1)))
+
+        self.suite_run.refresh_from_db()
+        self.assertEqual(self.suite_run.completed_shards, 3)
+        self.assertEqual(self.suite_run.completed_tests, 5)
+        self.assertEqual(self.suite_run.passed_tests, 3)
+        self.assertEqual(self.suite_run.failed_tests, 2)
+        self.assertEqual([shard['status'] for shard in self.suite_run.shards], ['passed', 'failed', 'passed'])
+
+    def test_duplicate_completion_is_ignored(self):
+        self.assertFalse(self._complete(0, _passed(0, 'first delivery')))
+        self.assertFalse(self._complete(0, _failed(0)))
+        self.assertFalse(self._complete(2, _passed(2)))
+        self.assertTrue(self._complete(1, _passed(1)))
+        # Доставка после последнего шарда не запускает сборку повторно
+        self.assertFalse(self._complete(1, _passed(1)))
+
+        self.suite_run.refresh_from_db()
+        self.assertEqual(self.suite_run.completed_shards, 3)
+        self.assertEqual(self.suite_run.completed_tests, 5)
+        self.assertEqual(self.suite_run.passed_tests, 5)
+        self.assertEqual(self.suite_run.failed_tests, 0)
+        self.assertEqual(self.suite_run.shards[0]['output'], 'first delivery')
+        self.assertTrue(self.suite_run.shards[0]['success'])
+
+    def test_completed_shard_is_not_restarted(self):
+        self._complete(0, _passed(0))
+
+        BatchOrchestrator.update_shard(self.suite_run.id, 0, status='running', attempts=2)
+
+        self.suite_run.refresh_from_db()
+        self.assertEqual(self.suite_run.shards[0]['status'], 'passed')
+        self.assertEqual(self.suite_run.shards[0]['attempts'], 0)
+
+    def test_aggregate_orders_results_by_shard_index(self):
+        results = [_passed(2), _failed(1), _passed(0)]
+
+        suite_run = BatchOrchestrator.aggregate(self.suite_run.id, results)
+
+        self.assertEqual(suite_run.status, 'failed')
+        self.assertIsNotNone(suite_run.finished_at)
+        positions = [suite_run.output.index(f'shard {index}') for index in range(3)]
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(suite_run.error_message, '===== Shard 2/3 (2 tests) =====\nerror 1')
+
+    def test_repeated_aggregate_keeps_first_result(self):
+        first = BatchOrchestrator.aggregate(self.suite_run.id, [_passed(index) for index in range(3)])
+
+        second = BatchOrchestrator.aggregate(self.suite_run.id, [_failed(index) for index in range(3)])
+
+        self.assertEqual(second.status, 'passed')
+        self.assertEqual(second.finished_at, first.finished_at)
+        self.assertEqual(second.output, first.output)
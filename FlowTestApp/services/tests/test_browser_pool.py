@@ -0,0 +1,116 @@
+import subprocess
+import sys
+from types import SimpleNamespace
+from unittest import mock
+from django.test import SimpleTestCase
+from ..browser_pool import BrowserPool, _driver_pid
+from ..timeouts import ExecutionTimeout
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+
+    def is_connected(self):
+        return self.connected
+
+    def close(self):
+        self.closed = True
+
+    def new_context(self, **options):
+        return mock.Mock()
+
+
+class FakePlaywright:
+    """Playwright без Chromium: chromium.launch() возвращает FakeBrowser"""
+
+    def __init__(self, driver=None):
+        self.driver = driver
+        self.browsers = []
+        self.chromium = SimpleNamespace(launch=self._launch)
+
+    def _launch(self, **options):
+        browser = FakeBrowser()
+        self.browsers.append(browser)
+        return browser
+
+    def stop(self):
+        if self.driver is not None:
+            self.driver.kill()
+            self.driver.wait()
+
+
+class BrowserPoolTests(SimpleTestCase):
+    def _pool(self, start, **kwargs) -> BrowserPool:
+        patcher = mock.patch('playwright.sync_api.sync_playwright', return_value=mock.Mock(start=start))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        pool = BrowserPool(size=1, **kwargs)
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def test_browser_is_recycled_after_max_uses(self):
+        playwright = FakePlaywright()
+        pool = self._pool(lambda: playwright, max_uses=2)
+
+        browsers = [pool.run(lambda browser, context: browser) for _ in range(3)]
+
+        self.assertIs(browsers[0], browsers[1])
+        self.assertIsNot(browsers[1], browsers[2])
+        self.assertTrue(browsers[0].closed)
+        stats = pool.stats()
+        self.assertEqual((stats['launches'], stats['recycled'], stats['hits'], stats['misses']), (2, 1, 2, 1))
+
+    def test_disconnected_browser_is_relaunched(self):
+        playwright = FakePlaywright()
+        pool = self._pool(lambda: playwright)
+
+        first = pool.run(lambda browser, context: browser)
+        first.connected = False
+        second = pool.run(lambda browser, context: browser)
+
+        self.assertIsNot(first, second)
+        self.assertEqual(pool.stats()['crashed'], 1)
+
+    def test_job_errors_are_raised_to_caller(self):
+        pool = self._pool(FakePlaywright)
+
+        def fail(browser, context):
+            raise ValueError('broken test')
+
+        with self.assertRaises(ValueError):
+            pool.run(fail)
+        self.assertTrue(pool.run(lambda browser, context: browser.is_connected()))
+
+    def test_timeout_kills_driver_found_without_private_attributes(self):
+        # У FakePlaywright нет _impl_obj: драйвер определяется по дочернему процессу
+        started = []
+
+        def start():
+            driver = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+            started.append(driver)
+            return FakePlaywright(driver)
+
+        pool = self._pool(start)
+
+        with self.assertRaises(ExecutionTimeout):
+            pool.run(lambda browser, context: started[0].wait(), timeout=0.5)
+
+        self.assertIsNotNone(started[0].wait(timeout=10))
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+
+class DriverPidTests(SimpleTestCase):
+    def test_pid_from_playwright_transport(self):
+        transport = SimpleNamespace(_proc=SimpleNamespace(pid=42))
+        playwright = SimpleNamespace(_impl_obj=SimpleNamespace(_connection=SimpleNamespace(_transport=transport)))
+
+        self.assertEqual(_driver_pid(playwright, {7}), 42)
+
+    def test_single_started_child_is_used_without_private_attributes(self):
+        self.assertEqual(_driver_pid(SimpleNamespace(), {7}), 7)
+
+    def test_unknown_driver_returns_none(self):
+        self.assertIsNone(_driver_pid(SimpleNamespace()))
+        self.assertIsNone(_driver_pid(SimpleNamespace(), {7, 8}))
@@ -0,0 +1,86 @@
+from unittest import mock
+from django.test import TestCase
+from ...models import Project, TestCase as TestCaseModel, TestRun
+from ...tasks import execute_test
+from ..cancellation import mark_finished, mark_running
+
+
+class MarkRunningTests(TestCase):
+    def setUp(self):
+        project = Project.objects.create(name='Project')
+        self.test_case = TestCaseModel.objects.create(project=project, title='Case')
+
+    def _run(self, status: str) -> TestRun:
+        return TestRun.objects.create(test_case=self.test_case, status=status)
+
+    def test_pending_run_starts(self):
+        test_run = self._run('pending')
+
+        self.assertTrue(mark_running(test_run.id))
+        test_run.refresh_from_db()
+        self.assertEqual(test_run.status, 'running')
+        self.assertIsNotNone(test_run.started_at)
+
+    def test_run_starts_only_once(self):
+        test_run = self._run('pending')
+
+        self.assertTrue(mark_running(test_run.id))
+        # Повторная доставка задачи не должна выполнить запуск еще раз
+        self.assertFalse(mark_running(test_run.id))
+
+    def test_cancelled_and_finished_runs_do_not_start(self):
+        for status in ('cancelled', 'passed', 'failed'):
+            test_run = self._run(status)
+
+            self.assertFalse(mark_running(test_run.id))
+            test_run.refresh_from_db()
+            self.assertEqual(test_run.status, status)
+            self.assertIsNone(test_run.started_at)
+
+    def test_finish_does_not_overwrite_cancel(self):
+        test_run = self._run('cancelled')
+
+        self.assertFalse(mark_finished(test_run.id, 'passed', error_message=None))
+        test_run.refresh_from_db()
+        self.assertEqual(test_run.status, 'cancelled')
+
+    def test_running_run_finishes(self):
+        test_run = self._run('running')
+
+        self.assertTrue(mark_finished(test_run.id, 'error', error_message='boom'))
+        test_run.refresh_from_db()
+        self.assertEqual((test_run.status, test_run.error_message), ('error', 'boom'))
+
+
+class ExecuteTestFinishTests(TestCase):
+    def setUp(self):
+        project = Project.objects.create(name='Project')
+        test_case = TestCaseModel.objects.create(project=project, title='Case', test_code='pass')
+        # Запуск создан без started_at: его выставляет mark_running
+        self.test_run = TestRun.objects.create(test_case=test_case, status='pending')
+
+    def _execute(self, run_test_code):
+        with mock.patch('FlowTestApp.tasks.run_test_code', side_effect=run_test_code):
+            return execute_test(self.test_run.id)
+
+    def test_result_is_written_for_running_test(self):
+        result = self._execute(lambda *args, **kwargs: {'success': True, 'error': None, 'cancelled': False})
+
+        self.test_run.refresh_from_db()
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual(self.test_run.status, 'completed')
+        self.assertIsNotNone(self.test_run.finished_at)
+        self.assertIsNotNone(self.test_run.execution_time)
+
+    def test_cancel_after_process_end_is_kept(self):
+        def cancelled_after_finish(*args, **kwargs):
+            # Отмена через API пришла, когда процесс теста уже завершился
+            TestRun.objects.filter(id=self.test_run.id).update(status='cancelled')
+            return {'success': False, 'error': 'boom', 'cancelled': False}
+
+        result = self._execute(cancelled_after_finish)
+
+        self.test_run.refresh_from_db()
+        self.assertEqual(result['status'], 'cancelled')
+        self.assertEqual(self.test_run.status, 'cancelled')
+        self.assertNotEqual(self.test_run.error_message, 'boom')
@@ -0,0 +1,69 @@
+from unittest import mock
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from ...models import Project, TestCase as TestCaseModel, TestRun
+from ..coalescing import IdempotencyKey, IdempotencyKeyReused, start_test_run
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'execution': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'coalescing-tests'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StartTestRunTests(TestCase):
+    def setUp(self):
+        # Идентификаторы строк повторяются между тестами, реестр запусков - нет
+        caches['execution'].clear()
+        project = Project.objects.create(name='Project')
+        self.test_case = TestCaseModel.objects.create(project=project, title='Case', test_code='print(1)')
+        patcher = mock.patch('FlowTestApp.tasks.execute_test.apply_async')
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_same_work_is_coalesced(self):
+        first, first_coalesced = start_test_run(self.test_case)
+        second, second_coalesced = start_test_run(self.test_case)
+
+        self.assertFalse(first_coalesced)
+        self.assertTrue(second_coalesced)
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(TestRun.objects.count(), 1)
+        self.apply_async.assert_called_once_with(args=[first.id], task_id=first.celery_task_id)
+
+    def test_finished_run_is_not_reused(self):
+        first, _ = start_test_run(self.test_case)
+        TestRun.objects.filter(id=first.id).update(status='passed')
+
+        second, coalesced = start_test_run(self.test_case)
+
+        self.assertFalse(coalesced)
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(self.apply_async.call_count, 2)
+
+    def test_changed_code_starts_new_run(self):
+        first, _ = start_test_run(self.test_case)
+        self.test_case.test_code = 'print(2)'
+        self.test_case.save()
+
+        second, coalesced = start_test_run(self.test_case)
+
+        self.assertFalse(coalesced)
+        self.assertNotEqual(first.id, second.id)
+
+    def test_idempotent_repeat_returns_finished_run(self):
+        key = IdempotencyKey(key='execution:idempotency:1:scope', fingerprint='request')
+        first, _ = start_test_run(self.test_case, idempotency_key=key)
+        TestRun.objects.filter(id=first.id).update(status='passed')
+
+        repeated, coalesced = start_test_run(self.test_case, idempotency_key=key)
+
+        self.assertTrue(coalesced)
+        self.assertEqual(repeated.id, first.id)
+        self.apply_async.assert_called_once()
+
+    def test_reused_key_with_other_request_is_rejected(self):
+        start_test_run(self.test_case, idempotency_key=IdempotencyKey(key='execution:idempotency:1:scope', fingerprint='a'))
+
+        with self.assertRaises(IdempotencyKeyReused):
+            start_test_run(self.test_case, idempotency_key=IdempotencyKey(key='execution:idempotency:1:scope', fingerprint='b'))
@@ -0,0 +1,119 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+from django.test import TestCase
+from django.utils import timezone
+from ...models import Project, TestCase as TestCaseModel, TestEvent
+from ..event_buffer import SPOOL_SUFFIX, EventBuffer, _serialize, event_update, replay_spool
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+class EventBufferTests(TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp(prefix='event-buffer-tests-')
+        self.addCleanup(shutil.rmtree, self.spool_dir, ignore_errors=True)
+        project = Project.objects.create(name='Project')
+        self.test_case = TestCaseModel.objects.create(project=project, title='Case')
+
+    def _buffer(self, **kwargs) -> EventBuffer:
+        # Таймер не должен срабатывать во время теста: сброс проверяется явно
+        buffer = EventBuffer(1, spool_dir=self.spool_dir, flush_interval=kwargs.pop('flush_interval', 60), **kwargs)
+        buffer.channel_layer = mock.Mock(group_send=mock.AsyncMock())
+        self.addCleanup(lambda: buffer._timer and buffer._timer.cancel())
+        self.addCleanup(buffer._spool.close)
+        return buffer
+
+    def _event(self, description) -> TestEvent:
+        return TestEvent(test_case=self.test_case, event_type='step_complete', description=description)
+
+    def _spool_lines(self, path):
+        with open(path, encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_full_buffer_is_flushed_with_one_insert(self):
+        buffer = self._buffer(max_events=3)
+        buffer.add(self._event('one'))
+        buffer.add(self._event('two'))
+        self.assertFalse(TestEvent.objects.exists())
+        self.assertEqual(len(self._spool_lines(buffer.spool_path)), 2)
+
+        with mock.patch('FlowTestApp.services.event_buffer._insert', wraps=TestEvent.objects.bulk_create) as insert:
+            buffer.add(self._event('three'))
+
+        insert.assert_called_once()
+        self.assertEqual(list(TestEvent.objects.order_by('id').values_list('description', flat=True)), ['one', 'two', 'three'])
+        self.assertEqual(self._spool_lines(buffer.spool_path), [])
+
+    def test_updates_are_coalesced_into_one_message(self):
+        buffer = self._buffer(max_events=10)
+        for description in ('one', 'two'):
+            event = self._event(description)
+            event.timestamp = timezone.now()
+            buffer.add(event, event_update(event, 'running'))
+        buffer.add(None, {'status': 'passed'})
+
+        buffer.close()
+
+        buffer.channel_layer.group_send.assert_awaited_once()
+        group, message = buffer.channel_layer.group_send.await_args.args
+        self.assertEqual(group, 'test_execution_1')
+        self.assertEqual(message['data']['status'], 'passed')
+        self.assertEqual([event['description'] for event in message['data']['events']], ['one', 'two'])
+        self.assertEqual(TestEvent.objects.count(), 2)
+        self.assertFalse(os.path.exists(buffer.spool_path))
+
+    def test_failed_flush_keeps_events_and_spool(self):
+        buffer = self._buffer(max_events=10)
+        buffer.add(self._event('one'))
+
+        with mock.patch('FlowTestApp.services.event_buffer._insert', side_effect=RuntimeError('database is down')):
+            buffer.close()
+
+        self.assertFalse(TestEvent.objects.exists())
+        self.assertEqual(len(self._spool_lines(buffer.spool_path)), 1)
+        with self.assertRaises(RuntimeError):
+            buffer.add(self._event('two'))
+
+    def test_replay_spool_of_dead_process(self):
+        events = [self._event('one'), self._event('two')]
+        for event in events:
+            event.timestamp = timezone.now()
+        path = os.path.join(self.spool_dir, f'{socket.gethostname()}-{_dead_pid()}-1{SPOOL_SUFFIX}')
+        with open(path, 'w', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(_serialize(event)) + '\n')
+            # Строка, которую процесс не успел дописать
+            f.write('{"test_case_id": ')
+
+        replayed = replay_spool(self.spool_dir)
+
+        self.assertEqual(replayed, 2)
+        self.assertEqual(
+            list(TestEvent.objects.order_by('id').values_list('description', 'timestamp')),
+            [(event.description, event.timestamp) for event in events]
+        )
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_replay_skips_spools_of_live_processes_and_other_hosts(self):
+        buffer = self._buffer(max_events=10)
+        buffer.add(self._event('live'))
+        remote = os.path.join(self.spool_dir, f'other-host-1-2{SPOOL_SUFFIX}')
+        with open(remote, 'w', encoding='utf-8') as f:
+            event = self._event('remote')
+            event.timestamp = timezone.now()
+            f.write(json.dumps(_serialize(event)) + '\n')
+
+        self.assertEqual(replay_spool(self.spool_dir), 0)
+        self.assertEqual(replay_spool(self.spool_dir, force=True), 1)
+        self.assertEqual(list(TestEvent.objects.values_list('description', flat=True)), ['remote'])
+        self.assertTrue(os.path.exists(buffer.spool_path))
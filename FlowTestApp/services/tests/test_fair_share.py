@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+from unittest import mock
+from celery.signals import task_postrun, task_revoked
+from django.test import TestCase, override_settings
+from ...models import AutomationProject, DispatchQueueItem, Project
+from ..execution_cache import cache
+from ..fair_share import POLICY_ROUND_ROBIN, POLICY_WEIGHTED, FairShareDispatcher
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'execution': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fair-share-tests'},
+}
+
+TASK = SimpleNamespace(name='FlowTestApp.tasks.run_test_shard')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, FAIR_SHARE_DEFAULT_QUOTA=0)
+class FairShareDispatcherTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        send_task = mock.patch('FlowTestApp.services.fair_share.app.send_task')
+        self.send_task = send_task.start()
+        self.addCleanup(send_task.stop)
+
+    def _project(self, name, **fields) -> AutomationProject:
+        project = Project.objects.create(name=name, **fields)
+        return AutomationProject.objects.create(name=name, project=project, repository_url='https://example.com/repo.git')
+
+    def _queue(self, automation_project, count):
+        for index in range(count):
+            DispatchQueueItem.objects.create(
+                project=automation_project.project,
+                automation_project=automation_project,
+                task_name=TASK.name,
+                task_id=f'{automation_project.name}-{index}'
+            )
+
+    def _sent(self):
+        return [call.kwargs['task_id'].split('-')[0] for call in self.send_task.call_args_list]
+
+    def test_weighted_policy_shares_slots_by_weight(self):
+        heavy = self._project('heavy', scheduling_weight=2)
+        light = self._project('light', scheduling_weight=1)
+        self._queue(heavy, 5)
+        self._queue(light, 5)
+
+        dispatched = FairShareDispatcher(slots=3, policy=POLICY_WEIGHTED).dispatch()
+
+        self.assertEqual(dispatched, 3)
+        self.assertEqual(sorted(self._sent()), ['heavy', 'heavy', 'light'])
+        self.assertEqual(DispatchQueueItem.objects.filter(status='queued').count(), 7)
+
+    def test_round_robin_policy_alternates_projects(self):
+        first = self._project('first', scheduling_weight=5)
+        second = self._project('second')
+        self._queue(first, 4)
+        self._queue(second, 4)
+
+        FairShareDispatcher(slots=4, policy=POLICY_ROUND_ROBIN).dispatch()
+
+        self.assertEqual(self._sent(), ['first', 'second', 'first', 'second'])
+
+    def test_project_quota_limits_slots(self):
+        limited = self._project('limited', max_concurrent_runs=1)
+        self._queue(limited, 3)
+
+        dispatched = FairShareDispatcher(slots=3).dispatch()
+
+        self.assertEqual(dispatched, 1)
+        self.assertEqual(DispatchQueueItem.objects.filter(status='dispatched').count(), 1)
+
+    def test_task_postrun_releases_slot_to_next_task(self):
+        project = self._project('project')
+        self._queue(project, 2)
+
+        with self.settings(FAIR_SHARE_SLOTS=1):
+            FairShareDispatcher().dispatch()
+            task_postrun.send(sender=None, task_id='project-0')
+
+        statuses = dict(DispatchQueueItem.objects.values_list('task_id', 'status'))
+        self.assertEqual(statuses, {'project-0': 'finished', 'project-1': 'dispatched'})
+        self.assertEqual(self.send_task.call_count, 2)
+
+    def test_task_revoked_releases_slot_as_cancelled(self):
+        project = self._project('project')
+        self._queue(project, 2)
+
+        with self.settings(FAIR_SHARE_SLOTS=1):
+            FairShareDispatcher().dispatch()
+            task_revoked.send(sender=None, request=SimpleNamespace(id='project-0'))
+
+        statuses = dict(DispatchQueueItem.objects.values_list('task_id', 'status'))
+        self.assertEqual(statuses, {'project-0': 'cancelled', 'project-1': 'dispatched'})
+
+    def test_release_of_unknown_task_does_nothing(self):
+        self.assertFalse(FairShareDispatcher.release('unknown'))
+
+    def test_failed_send_returns_task_to_queue(self):
+        project = self._project('project')
+        self._queue(project, 1)
+        self.send_task.side_effect = ConnectionError('broker is down')
+
+        dispatched = FairShareDispatcher(slots=1).dispatch()
+
+        self.assertEqual(dispatched, 0)
+        item = DispatchQueueItem.objects.get()
+        self.assertEqual(item.status, 'queued')
+        self.assertIsNone(item.dispatched_at)
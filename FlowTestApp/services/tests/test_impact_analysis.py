@@ -0,0 +1,28 @@
+from django.test import SimpleTestCase
+from ..impact_analysis import ImpactAnalyzer
+
+
+class AffectedFilesTests(SimpleTestCase):
+    graph = {
+        'app/models.py': [],
+        'app/utils.py': ['app/models.py'],
+        'tests/test_models.py': ['app/models.py'],
+        'tests/test_utils.py': ['app/utils.py'],
+        'tests/test_other.py': [],
+    }
+
+    def test_transitive_importers_are_affected(self):
+        affected = ImpactAnalyzer._affected_files(self.graph, ['app/models.py'])
+
+        self.assertEqual(affected, {'app/models.py', 'app/utils.py', 'tests/test_models.py', 'tests/test_utils.py'})
+
+    def test_leaf_change_affects_only_itself(self):
+        self.assertEqual(ImpactAnalyzer._affected_files(self.graph, ['tests/test_other.py']), {'tests/test_other.py'})
+
+    def test_import_cycle_terminates(self):
+        graph = {'a.py': ['b.py'], 'b.py': ['a.py'], 'c.py': ['a.py']}
+
+        self.assertEqual(ImpactAnalyzer._affected_files(graph, ['a.py']), {'a.py', 'b.py', 'c.py'})
+
+    def test_no_changes(self):
+        self.assertEqual(ImpactAnalyzer._affected_files(self.graph, []), set())
@@ -0,0 +1,69 @@
+from unittest import mock, skipIf
+from django.test import TestCase
+from ...models import OutputBlob, Project, TestCase as TestCaseModel, TestRun
+from .. import output_store
+from ..output_store import CODEC_ZLIB, CODEC_ZSTD, compress, decompress, output_hash, store_output, store_outputs
+
+OUTPUT = ''.join(f'tests/test_login.py::test_{i} PASSED — шаг {i}\n' for i in range(200))
+
+
+class OutputStoreTests(TestCase):
+    def test_same_output_is_stored_once(self):
+        first = store_output(OUTPUT)
+        second = store_output(OUTPUT)
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(OutputBlob.objects.count(), 1)
+        self.assertEqual(first.hash, output_hash(OUTPUT))
+
+    def test_compressed_output_round_trip(self):
+        blob = OutputBlob.objects.get(id=store_output(OUTPUT).id)
+
+        self.assertEqual(blob.text, OUTPUT)
+        self.assertEqual(blob.size, len(OUTPUT.encode('utf-8')))
+        self.assertLess(len(bytes(blob.data)), blob.size)
+
+    def test_empty_output_is_not_stored(self):
+        self.assertIsNone(store_output(''))
+        self.assertIsNone(store_output(None))
+        self.assertFalse(OutputBlob.objects.exists())
+
+    def test_store_outputs_deduplicates_group(self):
+        existing = store_output('existing')
+
+        blobs = store_outputs(['existing', 'new', 'new', '', None])
+
+        self.assertEqual(set(blobs), {output_hash('existing'), output_hash('new')})
+        self.assertEqual(blobs[output_hash('existing')].id, existing.id)
+        self.assertEqual(OutputBlob.objects.count(), 2)
+
+    def test_test_run_reads_output_from_blob(self):
+        project = Project.objects.create(name='Project')
+        test_case = TestCaseModel.objects.create(project=project, title='Case')
+        blob = store_output(OUTPUT)
+        test_run = TestRun.objects.create(test_case=test_case, status='passed', output_blob=blob)
+
+        self.assertEqual(TestRun.objects.get(id=test_run.id).output_text, OUTPUT)
+
+    def test_zlib_is_used_without_zstandard(self):
+        with mock.patch.object(output_store, 'zstandard', None):
+            codec, data = compress(OUTPUT.encode('utf-8'))
+
+        self.assertEqual(codec, CODEC_ZLIB)
+        self.assertEqual(decompress(codec, data).decode('utf-8'), OUTPUT)
+
+    @skipIf(output_store.zstandard is None, 'zstandard is not installed')
+    def test_zstd_round_trip(self):
+        codec, data = compress(OUTPUT.encode('utf-8'))
+
+        self.assertEqual(codec, CODEC_ZSTD)
+        self.assertEqual(decompress(codec, data).decode('utf-8'), OUTPUT)
+
+    def test_zstd_output_without_zstandard_raises(self):
+        with mock.patch.object(output_store, 'zstandard', None):
+            with self.assertRaises(RuntimeError):
+                decompress(CODEC_ZSTD, b'data')
+
+    def test_unknown_codec_raises(self):
+        with self.assertRaises(ValueError):
+            decompress('lz4', b'data')
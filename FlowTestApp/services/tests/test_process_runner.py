@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+from unittest import skipUnless
+from django.test import TestCase, override_settings
+from ...models import Project, TestCase as TestCaseModel, TestRun, TestRunLogChunk
+from ..cancellation import TEST_RUN_CANCEL_KEY
+from ..execution_cache import cache
+from ..process_runner import StreamingProcess, run_streaming
+from ..run_log import read_log
+
+
+def _is_alive(pid: int) -> bool:
+    """Процесс существует и не зомби (по /proc)"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        return False
+
+
+def _python(code: str):
+    return [sys.executable, '-u', '-c', code]
+
+
+# Бесконечный процесс: останавливается только по таймауту или отмене
+SLEEPER = "import time\nprint('started', flush=True)\ntime.sleep(60)"
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'execution': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'process-runner-tests'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EXECUTION_STREAM_FLUSH_INTERVAL=0.05, EXECUTION_CANCEL_POLL_INTERVAL=0.05)
+class StreamingProcessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        project = Project.objects.create(name='Project')
+        test_case = TestCaseModel.objects.create(project=project, title='Case')
+        self.test_run = TestRun.objects.create(test_case=test_case, status='running')
+
+    def test_output_is_read_line_by_line(self):
+        result = run_streaming(_python(
+            "import sys\nprint('one')\nprint('two')\nprint('err', file=sys.stderr)\nsys.exit(3)"
+        ))
+
+        self.assertEqual(result['returncode'], 3)
+        self.assertEqual(result['stdout'], 'one\ntwo\n')
+        self.assertEqual(result['stderr'], 'err\n')
+        self.assertFalse(result['timed_out'])
+        self.assertFalse(result['cancelled'])
+
+    def test_output_is_flushed_to_log_chunks(self):
+        run_streaming(_python(
+            "import sys, time\nprint('first')\ntime.sleep(0.3)\nprint('oops', file=sys.stderr)\n"
+            "time.sleep(0.3)\nprint('второй')"
+        ), test_run=self.test_run)
+
+        log = read_log(self.test_run.id)
+        self.assertEqual(log['text'], 'first\noops\nвторой\n')
+        self.assertEqual([chunk['stream'] for chunk in log['chunks']], ['stdout', 'stderr', 'stdout'])
+        # После завершения процесса порции сжимаются
+        self.assertFalse(TestRunLogChunk.objects.filter(test_run=self.test_run, compressed=False).exists())
+
+    def test_tail_limit_keeps_last_lines_and_full_log(self):
+        process = StreamingProcess(
+            _python("for i in range(5):\n    print(f'line {i}')"), test_run=self.test_run, tail_limit=14
+        )
+        result = process.run()
+
+        self.assertTrue(result['truncated'])
+        self.assertEqual(result['stdout'], 'line 3\nline 4\n')
+        self.assertEqual(read_log(self.test_run.id)['text'], ''.join(f'line {i}\n' for i in range(5)))
+
+    def test_timeout_kills_process(self):
+        started = time.monotonic()
+        result = run_streaming(_python(SLEEPER), timeout=0.5)
+
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertTrue(result['timed_out'])
+        self.assertFalse(result['cancelled'])
+        self.assertNotEqual(result['returncode'], 0)
+        self.assertEqual(result['stdout'], 'started\n')
+
+    @skipUnless(os.path.isdir('/proc'), 'requires /proc')
+    def test_timeout_kills_descendants(self):
+        result = run_streaming(_python(
+            "import subprocess, sys, time\n"
+            "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+            "print(child.pid, flush=True)\ntime.sleep(60)"
+        ), timeout=0.5)
+
+        child_pid = int(result['stdout'])
+        deadline = time.monotonic() + 5
+        while _is_alive(child_pid) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(_is_alive(child_pid))
+
+    def test_cancel_check_kills_process(self):
+        cancel_at = time.monotonic() + 0.5
+        started = time.monotonic()
+        result = run_streaming(_python(SLEEPER), cancel_check=lambda: time.monotonic() >= cancel_at)
+
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertTrue(result['cancelled'])
+        self.assertFalse(result['timed_out'])
+        self.assertNotEqual(result['returncode'], 0)
+
+    def test_cancel_flag_of_test_run_kills_process(self):
+        # Без cancel_check процесс опрашивает флаг отмены запуска
+        cache.set(TEST_RUN_CANCEL_KEY.format(id=self.test_run.id), True)
+
+        result = run_streaming(_python(SLEEPER), test_run=self.test_run)
+
+        self.assertTrue(result['cancelled'])
@@ -0,0 +1,58 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from ...models import AutomationProject, ResultCacheEntry
+from ..result_cache import ResultCache
+
+
+class ResultCacheLookupTests(TestCase):
+    def setUp(self):
+        self.project = AutomationProject.objects.create(
+            name='Automation',
+            repository_url='https://example.com/repo.git',
+            last_commit_sha='a' * 40,
+            result_cache_enabled=True,
+            result_cache_ttl=2,
+            result_cache_max_age=10
+        )
+        self.cache = ResultCache(self.project)
+
+    def _store(self, recorded_ago: timedelta, expires_in: timedelta) -> ResultCacheEntry:
+        entry = self.cache.store('key')
+        now = timezone.now()
+        ResultCacheEntry.objects.filter(id=entry.id).update(recorded_at=now - recorded_ago, expires_at=now + expires_in)
+        return entry
+
+    def test_hit_extends_ttl_and_counts(self):
+        self._store(timedelta(hours=1), timedelta(minutes=10))
+
+        entry = self.cache.lookup('key')
+
+        self.assertIsNotNone(entry)
+        entry.refresh_from_db()
+        self.assertEqual(entry.hits, 1)
+        self.assertAlmostEqual(
+            (entry.expires_at - timezone.now()).total_seconds(), timedelta(hours=2).total_seconds(), delta=60
+        )
+
+    def test_expired_ttl_is_a_miss(self):
+        self._store(timedelta(hours=1), -timedelta(minutes=1))
+
+        self.assertIsNone(self.cache.lookup('key'))
+
+    def test_entry_older_than_max_age_is_a_miss(self):
+        # Продленная запись с исходным запуском старше max-age
+        self._store(timedelta(hours=11), timedelta(hours=1))
+
+        self.assertIsNone(self.cache.lookup('key'))
+
+    def test_extension_is_capped_by_max_age(self):
+        entry = self._store(timedelta(hours=9), timedelta(minutes=10))
+
+        self.cache.lookup('key')
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.expires_at, entry.recorded_at + timedelta(hours=10))
+
+    def test_unknown_key_is_a_miss(self):
+        self.assertIsNone(self.cache.lookup('missing'))
@@ -0,0 +1,168 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from ...models import OutputBlob, Project, TestCase as TestCaseModel, TestEvent, TestReport, TestRun
+from ..output_store import store_output
+from ..partitioning import ensure_partitions, is_partitioned, list_partitions, month_start, partition_name
+from ..retention import RetentionPolicy
+
+
+def _read_archive(directory: str):
+    rows = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            with gzip.open(os.path.join(root, name), 'rt', encoding='utf-8') as f:
+                rows.extend(json.loads(line) for line in f)
+    return rows
+
+
+@override_settings(RUN_RETENTION_DAYS=None)
+class RetentionPolicyTests(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp(prefix='retention-tests-')
+        self.now = timezone.now()
+        self.old = self.now - timedelta(days=40)
+        self.project = Project.objects.create(name='Limited', retention_days=30)
+        self.unlimited = Project.objects.create(name='Unlimited')
+        self.test_case = TestCaseModel.objects.create(project=self.project, title='Case')
+        self.other_case = TestCaseModel.objects.create(project=self.unlimited, title='Other')
+
+    def tearDown(self):
+        shutil.rmtree(self.archive_dir, ignore_errors=True)
+
+    def _policy(self) -> RetentionPolicy:
+        return RetentionPolicy(archive_dir=self.archive_dir, batch_size=2, now=self.now)
+
+    def _run(self, test_case, started_at, output=None) -> TestRun:
+        blob = store_output(output)
+        return TestRun.objects.create(
+            test_case=test_case, status='passed', started_at=started_at, output_blob=blob
+        )
+
+    def _report(self, test_case, execution_date, output=None) -> TestReport:
+        report = TestReport.objects.create(test_case=test_case, status='passed', actual_result_blob=store_output(output))
+        TestReport.objects.filter(id=report.id).update(execution_date=execution_date)
+        return report
+
+    def _age_blobs(self):
+        # Свежие blob-ы не удаляются: их могли еще не привязать к запуску
+        OutputBlob.objects.update(created_at=self.now - timedelta(days=2))
+
+    def test_archive_test_runs_keeps_recent_runs(self):
+        old_runs = [self._run(self.test_case, self.old, f'old output {i}') for i in range(3)]
+        recent = self._run(self.test_case, self.now - timedelta(days=1))
+
+        archived = self._policy().archive_test_runs(self.project.id, self.now - timedelta(days=30))
+
+        self.assertEqual(archived, 3)
+        self.assertEqual(list(TestRun.objects.values_list('id', flat=True)), [recent.id])
+        rows = _read_archive(os.path.join(self.archive_dir, 'test_runs'))
+        self.assertEqual(sorted(row['id'] for row in rows), [run.id for run in old_runs])
+        self.assertEqual(sorted(row['output'] for row in rows), [f'old output {i}' for i in range(3)])
+
+    def test_archive_test_reports_skips_reports_with_events(self):
+        report = self._report(self.test_case, self.old, 'actual result')
+        with_events = self._report(self.test_case, self.old)
+        TestEvent.objects.create(test_case=self.test_case, test_report=with_events, event_type='step_complete')
+        recent = self._report(self.test_case, self.now)
+
+        archived = self._policy().archive_test_reports(self.project.id, self.now - timedelta(days=30))
+
+        self.assertEqual(archived, 1)
+        self.assertEqual(set(TestReport.objects.values_list('id', flat=True)), {with_events.id, recent.id})
+        [row] = _read_archive(os.path.join(self.archive_dir, 'test_reports'))
+        self.assertEqual(row['id'], report.id)
+        self.assertEqual(row['actual_result'], 'actual result')
+
+    def test_delete_orphan_blobs_keeps_referenced_and_fresh_blobs(self):
+        run = self._run(self.test_case, self.now, 'run output')
+        report = self._report(self.test_case, self.now, 'report output')
+        orphan = store_output('orphan output')
+        self._age_blobs()
+        fresh = store_output('fresh output')
+
+        deleted = self._policy().delete_orphan_blobs()
+
+        self.assertEqual(deleted, 1)
+        self.assertFalse(OutputBlob.objects.filter(id=orphan.id).exists())
+        self.assertEqual(
+            set(OutputBlob.objects.values_list('id', flat=True)),
+            {run.output_blob_id, report.actual_result_blob_id, fresh.id}
+        )
+
+    def test_apply_archives_only_projects_with_retention(self):
+        self._run(self.test_case, self.old, 'shared output')
+        self._report(self.test_case, self.old, 'shared output')
+        kept_run = self._run(self.other_case, self.old, 'unlimited output')
+        kept_report = self._report(self.other_case, self.old)
+        old_event = TestEvent.objects.create(test_case=self.test_case, event_type='step_complete')
+        kept_event = TestEvent.objects.create(test_case=self.other_case, event_type='step_complete')
+        TestEvent.objects.filter(id__in=[old_event.id, kept_event.id]).update(timestamp=self.old)
+        self._age_blobs()
+
+        stats = self._policy().apply()
+
+        self.assertEqual(stats['test_runs'], 1)
+        self.assertEqual(stats['test_reports'], 1)
+        self.assertEqual(stats['test_events'], 1)
+        # blob запуска и отчета общий и удаляется, когда на него не осталось ссылок
+        self.assertEqual(stats['output_blobs'], 1)
+        self.assertEqual(list(TestRun.objects.values_list('id', flat=True)), [kept_run.id])
+        self.assertEqual(list(TestReport.objects.values_list('id', flat=True)), [kept_report.id])
+        self.assertEqual(list(TestEvent.objects.values_list('id', flat=True)), [kept_event.id])
+
+    def test_apply_without_limits_does_nothing(self):
+        self.project.retention_days = None
+        self.project.save()
+        self._run(self.test_case, self.old)
+
+        stats = self._policy().apply()
+
+        self.assertEqual(stats['test_runs'], 0)
+        self.assertEqual(TestRun.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'TestEvent is partitioned only on PostgreSQL')
+@override_settings(RUN_RETENTION_DAYS=None)
+class RetentionPartitionTests(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp(prefix='retention-tests-')
+        self.table = TestEvent._meta.db_table
+        self.now = timezone.now()
+        self.old_month = month_start((self.now - timedelta(days=400)).date())
+        ensure_partitions(self.table, since=self.old_month)
+        self.project = Project.objects.create(name='Limited', retention_days=30)
+        self.test_case = TestCaseModel.objects.create(project=self.project, title='Case')
+        event = TestEvent.objects.create(test_case=self.test_case, event_type='step_complete')
+        TestEvent.objects.filter(id=event.id).update(timestamp=self.now - timedelta(days=400))
+
+    def tearDown(self):
+        shutil.rmtree(self.archive_dir, ignore_errors=True)
+
+    def test_expired_partition_is_dropped(self):
+        self.assertTrue(is_partitioned(self.table))
+
+        stats = RetentionPolicy(archive_dir=self.archive_dir, now=self.now).apply()
+
+        self.assertGreaterEqual(stats['partitions'], 1)
+        self.assertNotIn(partition_name(self.table, self.old_month), [name for name, _ in list_partitions(self.table)])
+        self.assertFalse(TestEvent.objects.exists())
+
+    def test_partition_with_events_of_unlimited_project_is_kept(self):
+        unlimited = Project.objects.create(name='Unlimited')
+        other_case = TestCaseModel.objects.create(project=unlimited, title='Other')
+        event = TestEvent.objects.create(test_case=other_case, event_type='step_complete')
+        TestEvent.objects.filter(id=event.id).update(timestamp=self.now - timedelta(days=400))
+
+        stats = RetentionPolicy(archive_dir=self.archive_dir, now=self.now).apply()
+
+        self.assertIn(partition_name(self.table, self.old_month), [name for name, _ in list_partitions(self.table)])
+        self.assertEqual(stats['test_events'], 1)
+        self.assertEqual(list(TestEvent.objects.values_list('id', flat=True)), [event.id])
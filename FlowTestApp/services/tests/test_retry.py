@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+from django.test import SimpleTestCase
+from ..retry import RetryPolicy
+
+
+class RetryPolicySelectTests(SimpleTestCase):
+    def test_fastest_tests_fit_into_budget(self):
+        durations = {'slow': 30.0, 'fast': 5.0, 'medium': 10.0}
+
+        selected = RetryPolicy.select(['slow', 'fast', 'medium'], durations, 20.0)
+
+        self.assertEqual(selected, ['fast', 'medium'])
+
+    def test_nothing_selected_when_budget_is_too_small(self):
+        self.assertEqual(RetryPolicy.select(['a'], {'a': 5.0}, 1.0), [])
+
+    def test_key_maps_items_to_durations(self):
+        tests = [SimpleNamespace(id=1), SimpleNamespace(id=2)]
+
+        selected = RetryPolicy.select(tests, {1: 8.0, 2: 2.0}, 10.0, key=lambda test: test.id)
+
+        self.assertEqual([test.id for test in selected], [2, 1])
+
+    def test_policy_without_profile_is_disabled(self):
+        policy = RetryPolicy(None)
+
+        self.assertFalse(policy.enabled)
+        self.assertEqual(policy.budget(100.0), 0)
+
+    def test_budget_is_percent_of_batch_time(self):
+        policy = RetryPolicy(SimpleNamespace(max_retries=2, retry_budget_percent=25))
+
+        self.assertTrue(policy.enabled)
+        self.assertEqual(policy.budget(200.0), 50.0)
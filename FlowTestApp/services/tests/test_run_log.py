@@ -0,0 +1,51 @@
+from django.test import TestCase, override_settings
+from ...models import Project, TestCase as TestCaseModel, TestRun, TestRunLogChunk
+from ..run_log import RunLog, compact_log, log_size, read_log
+
+
+class RunLogTests(TestCase):
+    def setUp(self):
+        project = Project.objects.create(name='Project')
+        test_case = TestCaseModel.objects.create(project=project, title='Case')
+        self.test_run = TestRun.objects.create(test_case=test_case, status='running')
+        self.log = RunLog(self.test_run.id)
+        self.parts = [('stdout', 'первая строка\n'), ('stderr', 'warning\n'), ('stdout', 'вторая строка ✓\n')]
+        for stream, text in self.parts:
+            self.log.append(stream, text)
+        self.text = ''.join(text for _, text in self.parts)
+
+    def test_read_returns_appended_text(self):
+        result = read_log(self.test_run.id)
+
+        self.assertEqual(result['text'], self.text)
+        self.assertEqual(result['next_offset'], len(self.text.encode('utf-8')))
+        self.assertEqual([chunk['stream'] for chunk in result['chunks']], ['stdout', 'stderr', 'stdout'])
+
+    @override_settings(LOG_COMPACT_CHUNK_BYTES=1024)
+    def test_compaction_keeps_text_and_offsets(self):
+        before = read_log(self.test_run.id)
+
+        self.assertEqual(compact_log(self.test_run.id), 3)
+        after = read_log(self.test_run.id)
+
+        self.assertTrue(TestRunLogChunk.objects.filter(test_run=self.test_run, compressed=True).exists())
+        self.assertEqual(after['text'], before['text'])
+        self.assertEqual(after['next_offset'], before['next_offset'])
+        self.assertEqual(log_size(self.test_run.id), len(self.text.encode('utf-8')))
+
+    def test_append_after_compaction_continues_offsets(self):
+        compact_log(self.test_run.id)
+        RunLog(self.test_run.id).append('stdout', 'хвост\n')
+
+        self.assertEqual(read_log(self.test_run.id)['text'], self.text + 'хвост\n')
+
+    def test_tail_never_splits_characters(self):
+        compact_log(self.test_run.id)
+        size = log_size(self.test_run.id)
+        for offset in range(size):
+            result = read_log(self.test_run.id, offset)
+            self.assertNotIn('�', result['text'])
+            self.assertTrue(self.text.encode('utf-8')[result['offset']:].decode('utf-8').startswith(result['text']))
+
+    def test_negative_offset_reads_from_end(self):
+        self.assertEqual(read_log(self.test_run.id, -len('✓\n'.encode('utf-8')))['text'], '✓\n')
@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+from django.test import SimpleTestCase
+from ..sharding import DEFAULT_TEST_DURATION, plan_shards
+
+
+def _tests(count):
+    return [SimpleNamespace(id=test_id, name=f'test_{test_id}') for test_id in range(1, count + 1)]
+
+
+class PlanShardsTests(SimpleTestCase):
+    def test_longest_tests_are_spread_across_shards(self):
+        tests = _tests(6)
+        durations = {1: 10.0, 2: 9.0, 3: 4.0, 4: 3.0, 5: 2.0, 6: 1.0}
+        shards = plan_shards(tests, durations, 2)
+
+        self.assertEqual(len(shards), 2)
+        self.assertEqual(sorted(test.id for shard in shards for test in shard['tests']), [1, 2, 3, 4, 5, 6])
+        # LPT: 10+3+2 и 9+4+1
+        self.assertEqual(sorted(shard['estimated_duration'] for shard in shards), [14.0, 15.0])
+        longest = next(shard for shard in shards if any(test.id == 1 for test in shard['tests']))
+        self.assertNotIn(2, [test.id for test in longest['tests']])
+
+    def test_empty_shards_are_dropped(self):
+        shards = plan_shards(_tests(2), {1: 5.0, 2: 5.0}, 4)
+
+        self.assertEqual(len(shards), 2)
+        self.assertTrue(all(len(shard['tests']) == 1 for shard in shards))
+
+    def test_unknown_duration_uses_default(self):
+        shards = plan_shards(_tests(1), {}, 1)
+
+        self.assertEqual(shards[0]['estimated_duration'], DEFAULT_TEST_DURATION)
@@ -0,0 +1,91 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from ...models import ExecutionProfile, Project, SuiteRun, TestCase as TestCaseModel, TestEvent, TestReport, TestRun
+from ..suite_recorder import SuiteRecorder
+
+
+class SuiteRecorderTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name='Project')
+        self.profile = ExecutionProfile.objects.create(name='recorder-tests')
+        self.test_cases = [
+            TestCaseModel.objects.create(project=self.project, title=f'Case {i}') for i in range(6)
+        ]
+
+    def _queries(self, func) -> int:
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return len(context.captured_queries)
+
+    def _finish(self, records, statuses):
+        test_runs, test_reports, events = [], [], []
+        for (test_run, test_report), status in zip(records.values(), statuses):
+            test_run.status = status
+            test_run.finished_at = timezone.now()
+            test_report.status = 'passed' if status == 'passed' else 'failed'
+            test_runs.append(test_run)
+            test_reports.append(test_report)
+            events.append(TestEvent(test_case=test_run.test_case, test_report=test_report, event_type='complete'))
+        return test_runs, test_reports, events
+
+    def test_create_runs_query_count_does_not_depend_on_group_size(self):
+        recorder = SuiteRecorder.start(self.test_cases, self.profile)
+
+        small = self._queries(lambda: recorder.create_runs(self.test_cases[:2], self.profile, 'running'))
+        large = self._queries(lambda: recorder.create_runs(self.test_cases, self.profile, 'running'))
+
+        self.assertEqual(small, large)
+        self.assertEqual(TestRun.objects.filter(suite_run=recorder.suite_run).count(), 8)
+        self.assertEqual(TestReport.objects.count(), 8)
+        self.assertEqual(TestEvent.objects.filter(event_type='start').count(), 8)
+
+    def test_save_results_query_count_does_not_depend_on_group_size(self):
+        recorder = SuiteRecorder.start(self.test_cases, self.profile)
+        small = self._finish(recorder.create_runs(self.test_cases[:2], self.profile, 'running'), ['passed'] * 2)
+        large = self._finish(recorder.create_runs(self.test_cases, self.profile, 'running'), ['passed'] * 6)
+
+        self.assertEqual(
+            self._queries(lambda: recorder.save_results(*small)),
+            self._queries(lambda: recorder.save_results(*large))
+        )
+        self.assertEqual(TestRun.objects.filter(status='passed').count(), 8)
+        self.assertFalse(TestRun.objects.filter(execution_time__isnull=True).exists())
+        self.assertEqual(TestEvent.objects.filter(event_type='complete').count(), 8)
+
+    def test_counters_follow_first_attempts(self):
+        recorder = SuiteRecorder.start(self.test_cases[:4], self.profile)
+        records = recorder.create_runs(self.test_cases[:4], self.profile, 'running')
+        recorder.save_results(*self._finish(records, ['passed', 'failed', 'error', 'skipped']))
+        retry = recorder.create_runs(self.test_cases[1:2], self.profile, 'running', attempt=2)
+        recorder.save_results(*self._finish(retry, ['passed']))
+
+        suite_run = SuiteRun.objects.get(id=recorder.suite_run.id)
+        self.assertEqual(
+            (suite_run.completed_tests, suite_run.passed_tests, suite_run.failed_tests, suite_run.skipped_tests),
+            (4, 1, 2, 1)
+        )
+
+    def test_mark_flaky_moves_counters(self):
+        recorder = SuiteRecorder.start(self.test_cases[:2], self.profile)
+        records = recorder.create_runs(self.test_cases[:2], self.profile, 'running')
+        test_runs, test_reports, events = self._finish(records, ['passed', 'failed'])
+        recorder.save_results(test_runs, test_reports, events)
+
+        recorder.mark_flaky([test_runs[1]])
+        recorder.complete()
+
+        suite_run = SuiteRun.objects.get(id=recorder.suite_run.id)
+        self.assertEqual((suite_run.passed_tests, suite_run.failed_tests, suite_run.flaky_tests), (1, 0, 1))
+        self.assertEqual(suite_run.status, 'passed')
+        self.assertEqual(TestRun.objects.get(id=test_runs[1].id).status, 'flaky')
+
+    def test_recorder_without_suite_run_only_groups_records(self):
+        recorder = SuiteRecorder()
+        records = recorder.create_runs(self.test_cases[:2], self.profile, 'running')
+        recorder.save_results(*self._finish(records, ['failed', 'failed']))
+        recorder.complete()
+
+        self.assertFalse(SuiteRun.objects.exists())
+        self.assertEqual(TestRun.objects.filter(status='failed', suite_run__isnull=True).count(), 2)
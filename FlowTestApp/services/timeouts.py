@@ -0,0 +1,100 @@
+import math
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Optional
+from django.conf import settings
+from ..models import AutomationProject, TestCase, TestRun
+
+
+class ExecutionTimeout(Exception):
+    """Выполнение теста превысило отведенное время"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        super().__init__(timeout_reason(timeout))
+
+
+def timeout_reason(timeout: float) -> str:
+    return f"Test execution timed out after {timeout:.0f}s"
+
+
+def percentile(values, q: float) -> Optional[float]:
+    """Перцентиль q (0..100) методом ближайшего ранга"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+def _timeout_from_history(durations) -> float:
+    """
+    Таймаут по p99 длительности: с запасом EXECUTION_TIMEOUT_MULTIPLIER,
+    не меньше EXECUTION_TIMEOUT_MIN и не больше EXECUTION_TEST_TIMEOUT.
+    Без достаточной истории возвращается EXECUTION_TEST_TIMEOUT.
+    """
+    default = settings.EXECUTION_TEST_TIMEOUT
+    durations = [d for d in durations if d]
+    if len(durations) < settings.EXECUTION_TIMEOUT_MIN_SAMPLES:
+        return default
+    p99 = percentile(durations, 99)
+    return min(default, max(settings.EXECUTION_TIMEOUT_MIN, p99 * settings.EXECUTION_TIMEOUT_MULTIPLIER))
+
+
+def get_test_timeout(test_case: TestCase) -> float:
+    """Таймаут теста по истории его последних запусков"""
+    durations = TestRun.objects.filter(
+        test_case=test_case,
+        status__in=['passed', 'failed'],
+        execution_time__isnull=False
+    ).order_by('-id').values_list('execution_time', flat=True)[:settings.EXECUTION_TIMEOUT_HISTORY]
+    return _timeout_from_history(durations)
+
+
+def get_path_timeouts(project: AutomationProject, file_paths: Iterable[str]) -> Dict[str, float]:
+    """Таймауты файлов тестов проекта автоматизации по истории TestRun"""
+    file_paths = set(file_paths)
+    history = defaultdict(list)
+    rows = TestRun.objects.filter(
+        test_case__automation_project=project,
+        test_case__script_path__in=file_paths,
+        status__in=['passed', 'failed'],
+        execution_time__isnull=False
+    ).order_by('-id').values_list('test_case__script_path', 'execution_time')
+    for path, duration in rows[:settings.EXECUTION_TIMEOUT_HISTORY * max(1, len(file_paths))]:
+        if len(history[path]) < settings.EXECUTION_TIMEOUT_HISTORY:
+            history[path].append(duration)
+    return {path: _timeout_from_history(history[path]) for path in file_paths}
+
+
+def get_batch_timeout(timeouts: Iterable[float]) -> float:
+    """Таймаут группы тестов в одном процессе: сумма таймаутов, но не больше EXECUTION_BATCH_TIMEOUT"""
+    return min(settings.EXECUTION_BATCH_TIMEOUT, sum(timeouts) or settings.EXECUTION_TEST_TIMEOUT)
+
+
+def call_with_timeout(func: Callable, timeout: float, on_timeout: Optional[Callable] = None):
+    """
+    Выполняет func в отдельном потоке и ждет не дольше timeout секунд.
+    Поток нельзя прервать, поэтому по истечении времени вызывается on_timeout,
+    который должен освободить ресурсы (например, убить процесс браузера),
+    и выбрасывается ExecutionTimeout.
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = func()
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        if on_timeout:
+            on_timeout()
+            thread.join(5)
+        raise ExecutionTimeout(timeout)
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome.get('result')
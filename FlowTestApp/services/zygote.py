@@ -0,0 +1,258 @@
+import logging
+import os
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+import billiard
+from celery.signals import worker_process_init
+from django.conf import settings
+from .cancellation import ExecutionCancelled, get_poll_interval
+from .process_tree import kill_process_tree
+from .timeouts import ExecutionTimeout
+
+logger = logging.getLogger(__name__)
+
+ISOLATION_INLINE = 'inline'
+ISOLATION_ZYGOTE = 'zygote'
+
+_context = None
+_lock = threading.Lock()
+# Свободные процессы-хосты текущего процесса воркера
+_hosts = []
+_hosts_lock = threading.Lock()
+
+
+class IsolatedExecutionError(Exception):
+    """Код теста упал в дочернем процессе зиготы или процесс завершился без результата"""
+
+    def __init__(self, message: str, exc_type: Optional[str] = None, details: Optional[str] = None):
+        self.exc_type = exc_type
+        self.details = details
+        super().__init__(message)
+
+
+def use_zygote() -> bool:
+    """Выполнять код тестов в процессах зиготы; на платформах без fork - в процессе воркера"""
+    return settings.EXEC_ISOLATION == ISOLATION_ZYGOTE and 'forkserver' in billiard.get_all_start_methods()
+
+
+def _get_context():
+    """
+    Контекст billiard с зиготой. Зигота - сервер forkserver: отдельный
+    однопоточный процесс, который один раз импортирует модули EXEC_ZYGOTE_PRELOAD
+    (playwright, selenium, requests, модели Django) и порождает fork() процесс на каждый тест.
+    Дочерний процесс получает готовые модули без запуска нового интерпретатора,
+    а его падение не затрагивает воркер.
+
+    Используется billiard, а не multiprocessing: процессы prefork-пула Celery - демоны,
+    и multiprocessing запрещает им порождать дочерние процессы.
+    """
+    global _context
+    with _lock:
+        if _context is None:
+            context = billiard.get_context('forkserver')
+            context.set_forkserver_preload(list(settings.EXEC_ZYGOTE_PRELOAD))
+            _context = context
+    return _context
+
+
+def warm_up():
+    """Запускает зиготу заранее, чтобы первый тест не ждал импорта модулей"""
+    from billiard import forkserver
+
+    _get_context()
+    started = time.monotonic()
+    forkserver.ensure_running()
+    logger.info(f"Zygote started in {time.monotonic() - started:.2f}s")
+
+
+@worker_process_init.connect
+def _start_zygote(**kwargs):
+    # У каждого процесса воркера своя зигота: сервер, запущенный до форка воркеров, им недоступен
+    if use_zygote():
+        try:
+            warm_up()
+        except Exception as e:
+            logger.warning(f"Failed to start zygote: {e}")
+
+
+def _child_main(conn, target: Callable, args: tuple):
+    """Точка входа дочернего процесса: выполняет target и передает результат через pipe"""
+    try:
+        conn.send(('ok', target(*args)))
+    except BaseException as e:
+        conn.send(('error', type(e).__name__, str(e), traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def run_isolated(target: Callable, args: tuple = (), timeout: Optional[float] = None,
+                 cancel_check: Optional[Callable[[], bool]] = None):
+    """
+    Выполняет target(*args) в процессе, порожденном зиготой, и возвращает его результат.
+    target должен быть функцией уровня модуля, аргументы и результат - сериализуемыми pickle.
+    По таймауту или отмене процесс убивается вместе с потомками (браузер, драйвер)
+    и выбрасывается ExecutionTimeout или ExecutionCancelled. Исключение кода теста
+    и аварийное завершение процесса выбрасываются как IsolatedExecutionError.
+    """
+    context = _get_context()
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_child_main, args=(child_conn, target, args), daemon=True)
+    process.start()
+    child_conn.close()
+
+    deadline = time.monotonic() + timeout if timeout else None
+    try:
+        while not parent_conn.poll(get_poll_interval()):
+            if cancel_check and cancel_check():
+                raise ExecutionCancelled()
+            if deadline and time.monotonic() >= deadline:
+                raise ExecutionTimeout(timeout)
+            if not process.is_alive() and not parent_conn.poll(0):
+                raise IsolatedExecutionError(f"Test process exited with code {process.exitcode} without a result")
+        message = parent_conn.recv()
+    except EOFError:
+        process.join(get_poll_interval())
+        raise IsolatedExecutionError(f"Test process exited with code {process.exitcode} without a result")
+    except (ExecutionCancelled, ExecutionTimeout):
+        kill_process_tree(process.pid)
+        raise
+    finally:
+        parent_conn.close()
+
+    process.join(get_poll_interval())
+    if process.is_alive():
+        # Результат получен, но процесс не завершился (например, завис поток теста)
+        kill_process_tree(process.pid)
+    if message[0] == 'ok':
+        return message[1]
+    _, exc_type, text, details = message
+    logger.debug(f"Isolated test code failed:\n{details}")
+    raise IsolatedExecutionError(text or exc_type, exc_type=exc_type, details=details)
+
+
+class _Host:
+    """Долгоживущий процесс, порожденный зиготой, и pipe для передачи ему заданий"""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.owner = os.getpid()
+        self.tasks = 0
+
+
+def _host_main(conn):
+    """
+    Цикл процесса-хоста: выполняет задания (target, args), пока воркер не закроет pipe.
+    Состояние процесса (например, пул теплых браузеров) сохраняется между заданиями
+    """
+    try:
+        while True:
+            try:
+                target, args = conn.recv()
+            except EOFError:
+                break
+            try:
+                conn.send(('ok', target(*args)))
+            except ExecutionTimeout as e:
+                conn.send(('timeout', e.timeout))
+            except ExecutionCancelled:
+                conn.send(('cancelled',))
+            except BaseException as e:
+                conn.send(('error', type(e).__name__, str(e), traceback.format_exc()))
+    finally:
+        from .browser_pool import shutdown_browser_pools
+
+        shutdown_browser_pools()
+        conn.close()
+
+
+def _start_host() -> _Host:
+    context = _get_context()
+    parent_conn, child_conn = context.Pipe(duplex=True)
+    process = context.Process(target=_host_main, args=(child_conn,), daemon=True)
+    process.start()
+    child_conn.close()
+    logger.info(f"Zygote host {process.pid} started")
+    return _Host(process, parent_conn)
+
+
+def _acquire_host() -> _Host:
+    with _hosts_lock:
+        # Хосты, унаследованные от родителя при fork, принадлежат ему
+        _hosts[:] = [host for host in _hosts if host.owner == os.getpid()]
+        while _hosts:
+            host = _hosts.pop()
+            if host.process.is_alive():
+                return host
+            _discard_host(host)
+    return _start_host()
+
+
+def _release_host(host: _Host):
+    if host.tasks >= settings.EXEC_HOST_MAX_TASKS:
+        logger.info(f"Zygote host {host.process.pid} retired after {host.tasks} tasks")
+        _retire_host(host)
+        return
+    with _hosts_lock:
+        _hosts.append(host)
+
+
+def _retire_host(host: _Host):
+    """Останавливает хост: по закрытию pipe он закрывает браузеры и завершается"""
+    host.conn.close()
+    host.process.join(10)
+    if host.process.is_alive():
+        kill_process_tree(host.process.pid)
+
+
+def _discard_host(host: _Host):
+    """Убивает хост вместе с потомками (браузеры, драйверы Playwright)"""
+    try:
+        host.conn.close()
+    except OSError:
+        pass
+    kill_process_tree(host.process.pid)
+    host.process.join(get_poll_interval())
+
+
+def run_in_host(target: Callable, args: tuple = (), timeout: Optional[float] = None,
+                cancel_check: Optional[Callable[[], bool]] = None):
+    """
+    Выполняет target(*args) в процессе-хосте, порожденном зиготой. В отличие от
+    run_isolated, хост переиспользуется следующими тестами, поэтому теплые ресурсы
+    (пул браузеров) переживают тест; после EXEC_HOST_MAX_TASKS заданий хост заменяется.
+    Исключение target хост не завершает. По таймауту или отмене хост убивается вместе
+    с потомками, а аварийное завершение хоста выбрасывается как IsolatedExecutionError.
+    """
+    host = _acquire_host()
+    host.tasks += 1
+    deadline = time.monotonic() + timeout if timeout else None
+    try:
+        host.conn.send((target, args))
+        while not host.conn.poll(get_poll_interval()):
+            if cancel_check and cancel_check():
+                raise ExecutionCancelled()
+            if deadline and time.monotonic() >= deadline:
+                raise ExecutionTimeout(timeout)
+            if not host.process.is_alive() and not host.conn.poll(0):
+                raise EOFError()
+        message = host.conn.recv()
+    except (EOFError, OSError):
+        _discard_host(host)
+        raise IsolatedExecutionError(f"Test host exited with code {host.process.exitcode} without a result")
+    except BaseException:
+        _discard_host(host)
+        raise
+
+    _release_host(host)
+    if message[0] == 'ok':
+        return message[1]
+    if message[0] == 'timeout':
+        raise ExecutionTimeout(message[1])
+    if message[0] == 'cancelled':
+        raise ExecutionCancelled()
+    _, exc_type, text, details = message
+    logger.debug(f"Test code failed in zygote host:\n{details}")
+    raise IsolatedExecutionError(text or exc_type, exc_type=exc_type, details=details)
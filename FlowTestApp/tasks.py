@@ -1,7 +1,20 @@
 from celery import shared_task
 from django.utils import timezone
-from .models import AutomationProject, TestSchedule, TestRun, TestEvent, TestReport
+from django.conf import settings
+from .models import AutomationProject, AutomationTest, TestCase, TestSchedule, TestRun, TestEvent, TestReport, ExecutionProfile, SuiteRun, DispatchQueueItem
 from .services.automation_service import AutomationService
+from .services.batch_orchestrator import BatchOrchestrator, SHARD_DONE_STATUSES
+from .services.batch_test_runner import BatchTestRunner
+from .services.fair_share import FairShareDispatcher
+from .services.result_cache import ResultCache
+from .services.impact_analysis import ImpactAnalyzer
+from .services.timeouts import ExecutionTimeout, get_test_timeout, timeout_reason
+from .services.cancellation import CANCEL_REASON, ExecutionCancelled, is_cancel_requested, is_suite_cancel_requested, mark_finished, mark_running
+from .services.process_runner import run_streaming
+from .services.output_store import blob_size, store_output
+from .services.partitioning import ensure_all_partitions
+from .services.retention import RetentionPolicy
+from .services.event_buffer import EventBuffer, event_update
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 import subprocess
@@ -10,7 +23,9 @@ import os
 from datetime import datetime
 import logging
 from FlowTest.celery import app
-from playwright.sync_api import sync_playwright
+from .services.browser_pool import get_browser_pool
+from .services.zygote import run_in_host, use_zygote
+from .services.code_cache import compile_test_code
 import threading
 
 logger = logging.getLogger(__name__)
@@ -30,16 +45,58 @@ def run_scheduled_tests(schedule_id):
         schedule = TestSchedule.objects.get(id=schedule_id)
         project = schedule.project
         service = AutomationService()
+        # Запуски по расписанию по умолчанию идут в быстром профиле
+        profile = schedule.execution_profile or ExecutionProfile.get_default(scheduled=True)
 
         # Если тесты не указаны, запускаем все доступные тесты
         if schedule.tests.exists():
-            test_ids = schedule.tests.values_list('id', flat=True)
-            result = service.run_tests(project, test_ids)
+            tests = schedule.tests.filter(is_available=True)
         else:
-            result = service.run_all_tests(project)
+            tests = project.tests.filter(is_available=True)
+        if not tests.exists():
+            raise Exception("No available tests found")
+
+        # Только тесты, затронутые изменениями с коммита, проверенного прошлым прогоном
+        notes = ''
+        tested_commit = schedule.last_affected_commit_sha
+        if schedule.only_affected:
+            selection = ImpactAnalyzer(project).select(tests, schedule.last_affected_commit_sha)
+            tests = selection['tests']
+            notes += f"Impact analysis: {selection['reason']}\n"
+            tested_commit = selection['commit']
+
+        # Тесты, не изменившиеся с последнего успешного прогона, не выполняются
+        result_cache = ResultCache(project, profile)
+        partition = result_cache.partition_automation_tests(tests)
+        tests = partition['pending']
+        if partition['cached']:
+            notes += f"{len(partition['cached'])} unchanged tests skipped (result cache)\n"
+        if not tests:
+            schedule.last_run = timezone.now()
+            schedule.last_affected_commit_sha = tested_commit
+            schedule.last_status = 'success'
+            schedule.last_result = notes
+            schedule.save()
+            return {'success': True, 'output': notes, 'cached_tests': len(partition['cached'])}
+
+        # Большие прогоны делятся на шарды и распределяются по воркерам,
+        # статус расписания обновит aggregate_suite_run
+        if len(tests) > settings.DISTRIBUTED_BATCH_THRESHOLD:
+            suite_run = BatchOrchestrator().dispatch(project, tests, profile=profile, schedule=schedule)
+            schedule.last_run = timezone.now()
+            schedule.last_affected_commit_sha = tested_commit
+            schedule.save()
+            return {'success': True, 'suite_run_id': suite_run.id, 'cached_tests': len(partition['cached'])}
+
+        result = service.run_tests(project, [test.id for test in tests], profile=profile)
+        result_cache.store_automation_tests(tests, result)
+        if notes:
+            result['output'] = notes + (result.get('output') or '')
+            result['cached_tests'] = len(partition['cached'])
 
         # Обновляем статус расписания
         schedule.last_run = timezone.now()
+        schedule.last_affected_commit_sha = tested_commit
         schedule.last_status = 'success' if result.get('success') else 'error'
         schedule.last_result = result.get('output', '')
         schedule.save()
@@ -52,6 +109,97 @@ def run_scheduled_tests(schedule_id):
             schedule.save()
         return {'success': False, 'error': str(e)}
 
+@app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def run_test_shard(self, suite_run_id, shard_index):
+    """
+    Выполнение одного шарда SuiteRun.
+    Задача подтверждается после выполнения, поэтому при гибели воркера
+    брокер возвращает шард в очередь и его забирает другой воркер.
+    """
+    suite_run = SuiteRun.objects.select_related('automation_project', 'execution_profile').get(id=suite_run_id)
+    shard = suite_run.shards[shard_index]
+    if shard['status'] in SHARD_DONE_STATUSES:
+        # Повторная доставка уже выполненного шарда (acks_late): результат уже учтен
+        logger.warning(f"Suite run {suite_run_id}: shard {shard_index} already completed, skipping")
+        return BatchOrchestrator.shard_results(suite_run)[shard_index]
+    if suite_run.status == 'cancelled':
+        result = {'success': False, 'cancelled': True, 'output': '', 'error': CANCEL_REASON}
+        if BatchOrchestrator.complete_shard(suite_run_id, shard_index, result):
+            _aggregate_when_complete(suite_run_id)
+        return {'shard_index': shard_index, **result}
+
+    attempts = shard['attempts'] + 1
+    if attempts > 1:
+        logger.warning(
+            f"Suite run {suite_run_id}: shard {shard_index} rebalanced from {shard['worker']} "
+            f"to {self.request.hostname} (attempt {attempts})"
+        )
+    BatchOrchestrator.update_shard(
+        suite_run_id, shard_index,
+        status='running',
+        worker=self.request.hostname,
+        attempts=attempts,
+        started_at=timezone.now().isoformat()
+    )
+
+    tests = AutomationTest.objects.filter(id__in=shard['test_ids'])
+    project = suite_run.automation_project
+    try:
+        service = AutomationService(cancel_check=lambda: is_suite_cancel_requested(suite_run_id))
+        if suite_run.commit_sha:
+            # Шард выполняется на коммите прогона в рабочей копии этого узла,
+            # а не на той, что осталась от последней синхронизации
+            project.local_path = service.checkout_commit(project, suite_run.commit_sha)
+        result = service._execute_tests(project, tests, suite_run.execution_profile)
+    except Exception as e:
+        logger.error(f"Suite run {suite_run_id}: shard {shard_index} failed: {e}")
+        result = {'success': False, 'output': '', 'error': str(e)}
+
+    ResultCache(project, suite_run.execution_profile).store_automation_tests(tests, result)
+    if BatchOrchestrator.complete_shard(suite_run_id, shard_index, result):
+        _aggregate_when_complete(suite_run_id)
+    return {
+        'shard_index': shard_index,
+        'cancelled': result.get('cancelled', False),
+        'success': result.get('success', False),
+        'output': result.get('output', ''),
+        'error': result.get('error', '')
+    }
+
+def _aggregate_when_complete(suite_run_id):
+    suite_run = SuiteRun.objects.get(id=suite_run_id)
+    aggregate_suite_run.delay(BatchOrchestrator.shard_results(suite_run), suite_run_id)
+
+@app.task
+def aggregate_suite_run(results, suite_run_id):
+    """Сбор результатов шардов в SuiteRun после завершения последнего шарда"""
+    suite_run = BatchOrchestrator.aggregate(suite_run_id, results)
+    return {'success': suite_run.status == 'passed', 'suite_run_id': suite_run.id}
+
+@app.task
+def run_suite_test_cases(suite_run_id, test_case_ids):
+    """Выполнение тестов в созданном заранее SuiteRun через BatchTestRunner (перезапуск упавших)"""
+    suite_run = SuiteRun.objects.select_related('execution_profile').get(id=suite_run_id)
+    test_cases = TestCase.objects.filter(id__in=test_case_ids).select_related('project', 'automation_project')
+    try:
+        results = BatchTestRunner(batched=True).run_tests(test_cases, suite_run.execution_profile, suite_run=suite_run)
+    except Exception as e:
+        logger.error(f"Suite run {suite_run_id} failed: {e}")
+        return {'success': False, 'suite_run_id': suite_run_id, 'error': str(e)}
+    suite_run.refresh_from_db()
+    return {'success': suite_run.status == 'passed', 'suite_run_id': suite_run_id, 'tests': len(results)}
+
+@app.task
+def sync_automation_project(project_id):
+    """Синхронизация репозитория проекта автоматизации в очереди sync"""
+    project = AutomationProject.objects.get(id=project_id)
+    try:
+        AutomationService().sync_repository(project)
+        return {'success': True}
+    except Exception as e:
+        logger.error(f"Failed to sync automation project {project_id}: {e}")
+        return {'success': False, 'error': str(e)}
+
 @app.task
 def check_scheduled_tests():
     """Проверка и запуск тестов по расписанию"""
@@ -63,8 +211,30 @@ def check_scheduled_tests():
         last_run__date=now.date()  # Исключаем уже запущенные сегодня
     )
 
+    # Запуски ставятся в очередь справедливого распределения, чтобы большой
+    # прогон одного проекта не занимал все воркеры; расписание, уже ждущее
+    # слот, повторно не ставится
+    dispatcher = FairShareDispatcher()
     for schedule in schedules:
-        run_scheduled_tests.delay(schedule.id)
+        waiting = DispatchQueueItem.objects.filter(
+            task_name=run_scheduled_tests.name,
+            args=[schedule.id],
+            status__in=['queued', 'dispatched']
+        ).exists()
+        if not waiting:
+            dispatcher.submit(schedule.project, run_scheduled_tests, args=[schedule.id])
+
+@app.task
+def dispatch_fair_share_queue():
+    """Периодическая раздача слотов: подстраховка, если сигнал завершения задачи потерян"""
+    return {'dispatched': FairShareDispatcher().dispatch()}
+
+@app.task
+def maintain_run_storage():
+    """Ежедневное обслуживание истории: секции TestEvent на следующие месяцы и сроки хранения проектов"""
+    created = ensure_all_partitions()
+    stats = RetentionPolicy().apply()
+    return {'partitions_created': len(created), **stats}
 
 @app.task
 def run_test(test_run_id):
@@ -82,6 +252,7 @@ def run_test(test_run_id):
     logger = logging.getLogger(__name__)
     logger.info(f"Starting test execution for test_run_id: {test_run_id}")
 
+    events = None
     try:
         # Получаем объекты
         test_run = get_test_run(test_run_id)
@@ -99,20 +270,18 @@ def run_test(test_run_id):
             subprocess.run([sys.executable, '-m', 'playwright', 'install', 'chromium'])
             logger.info("Installed Playwright and browsers")
 
-        # Обновляем статус на "running"
-        update_test_run(test_run, status='running')
-        
-        # Отправляем обновление через WebSocket
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                'type': 'test_update',
-                'data': {
-                    'status': 'running',
-                    'message': 'Starting test execution'
-                }
-            }
-        )
+        # Обновляем статус на "running", если запуск не отменили, пока он был в очереди
+        if not mark_running(test_run_id):
+            logger.info(f"Test run {test_run_id} was cancelled before start")
+            return {'success': False, 'cancelled': True, 'error': CANCEL_REASON}
+        test_run.status = 'running'
+
+        # События и обновления запуска пишутся и отправляются пачками через буфер
+        events = EventBuffer(test_run_id)
+        events.add(None, {
+            'status': 'running',
+            'message': 'Starting test execution'
+        })
 
         # Создаем временный файл для теста
         with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
@@ -127,16 +296,10 @@ def run_test(test_run_id):
         )
 
         # Отправляем обновление о начале выполнения
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                'type': 'test_update',
-                'data': {
-                    'status': 'running',
-                    'message': 'Executing test with Playwright...'
-                }
-            }
-        )
+        events.add(None, {
+            'status': 'running',
+            'message': 'Executing test with Playwright...'
+        })
 
         start_time = datetime.now()
         logger.info("Starting pytest execution with Playwright...")
@@ -145,74 +308,87 @@ def run_test(test_run_id):
         env = os.environ.copy()
         env['PYTHONUNBUFFERED'] = '1'  # Отключаем буферизацию вывода
         
-        result = subprocess.run(
+        # Режим браузера и запись видео определяются профилем выполнения
+        profile = test_run.execution_profile or ExecutionProfile.get_default()
+        env.update(profile.environment())
+        
+        # Таймаут по истории длительности теста, по истечении убивается все дерево процессов
+        timeout = get_test_timeout(test_case)
+
+        # Вывод читается построчно и по мере появления уходит в WebSocket и TestRunLogChunk
+        result = run_streaming(
             [
                 sys.executable, '-m', 'pytest',
                 test_file,
-                '--headed',  # Показываем браузер
-                '--video=on',  # Записываем видео
+                *profile.pytest_args(),
                 '-v',  # Подробный вывод
                 '--capture=tee-sys',  # Захватываем весь вывод
                 '--log-cli-level=INFO'  # Включаем логи
             ],
-            capture_output=True,
-            text=True,
-            env=env
+            env=env,
+            test_run=test_run,
+            timeout=timeout
         )
         
-        logger.info(f"Pytest execution completed with return code: {result.returncode}")
-        logger.info(f"Test output: {result.stdout}")
-        if result.stderr:
-            logger.error(f"Test errors: {result.stderr}")
+        logger.info(f"Pytest execution completed with return code: {result['returncode']}")
+        if result['stderr']:
+            logger.error(f"Test errors: {result['stderr']}")
 
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
 
-        # Обновляем статус и результат
-        success = result.returncode == 0
+        if result['cancelled']:
+            # Строка уже переведена в cancelled через API
+            test_report.status = 'failed'
+            test_report.comments = CANCEL_REASON
+            test_report.save()
+            os.unlink(test_file)
+            return {'success': False, 'cancelled': True, 'error': CANCEL_REASON}
+
+        # Обновляем статус и результат; тест, прерванный по таймауту, завершается ошибкой
+        success = result['returncode'] == 0 and not result['timed_out']
         status = 'passed' if success else 'failed'
+        if result['timed_out']:
+            status = 'error'
+            result['stderr'] = f"{timeout_reason(timeout)}\n{result['stderr']}"
         
+        # Вывод сохраняется один раз, запуск, отчет и событие ссылаются на него
+        output_blob = store_output(result['stdout'])
         update_test_run(
             test_run,
             status=status,
             finished_at=end_time,
             duration=duration,
-            log_output=result.stdout,
-            error_message=result.stderr if not success else None
+            output_blob=output_blob,
+            output_size=blob_size(output_blob),
+            error_message=result['stderr'] if not success else None
         )
 
         test_report.status = status
         test_report.execution_time = duration
-        test_report.actual_result = result.stdout
+        test_report.actual_result_blob = output_blob
+        test_report.actual_result_size = blob_size(output_blob)
         test_report.save()
 
-        # Создаем событие о завершении теста
-        TestEvent.objects.create(
+        # Событие о завершении теста и финальное обновление
+        finish_event = TestEvent(
             test_case=test_case,
             test_report=test_report,
             event_type='finish',
             description=f'Test {status}',
             details={
-                'stdout': result.stdout,
-                'stderr': result.stderr,
+                'output_blob': output_blob.id if output_blob else None,
+                'stderr': result['stderr'],
                 'duration': duration
             }
         )
-
-        # Отправляем финальное обновление через WebSocket
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                'type': 'test_update',
-                'data': {
-                    'status': status,
-                    'duration': duration,
-                    'output': result.stdout,
-                    'error': result.stderr if not success else None,
-                    'message': f'Test {status} in {duration:.2f} seconds'
-                }
-            }
-        )
+        events.add(finish_event, {
+            **event_update(finish_event, status),
+            'duration': duration,
+            'output': result['stdout'],
+            'error': result['stderr'] if not success else None,
+            'message': f'Test {status} in {duration:.2f} seconds'
+        })
 
         # Удаляем временный файл
         os.unlink(test_file)
@@ -220,8 +396,8 @@ def run_test(test_run_id):
 
         return {
             'success': success,
-            'output': result.stdout,
-            'error': result.stderr if not success else None
+            'output': result['stdout'],
+            'error': result['stderr'] if not success else None
         }
 
     except Exception as e:
@@ -230,67 +406,121 @@ def run_test(test_run_id):
             update_test_run(test_run, status='error', error_message=str(e))
 
             # Отправляем сообщение об ошибке через WebSocket
-            async_to_sync(channel_layer.group_send)(
-                group_name,
-                {
-                    'type': 'test_update',
-                    'data': {
-                        'status': 'error',
-                        'error': str(e),
-                        'message': f'Error: {str(e)}'
+            error_update = {
+                'status': 'error',
+                'error': str(e),
+                'message': f'Error: {str(e)}'
+            }
+            if events:
+                events.add(None, error_update)
+            else:
+                async_to_sync(channel_layer.group_send)(
+                    group_name,
+                    {
+                        'type': 'test_update',
+                        'data': error_update
                     }
-                }
-            )
+                )
 
         return {'success': False, 'error': str(e)}
+    finally:
+        if events:
+            events.close()
+
+def _execute_page_code(context, test_code, highlight_actions, headless):
+    """Выполняет код теста на новой странице контекста и возвращает страницу"""
+    page = context.new_page()
+
+    if highlight_actions:
+        # Добавляем базовые функции для подсветки элементов
+        page.add_init_script("""
+            window.highlight = function(selector) {
+                const element = document.querySelector(selector);
+                if (element) {
+                    const oldOutline = element.style.outline;
+                    element.style.outline = '3px solid red';
+                    setTimeout(() => {
+                        element.style.outline = oldOutline;
+                    }, 1000);
+                }
+            }
+        """)
+
+        # Перехватываем вызовы методов page для добавления подсветки
+        original_click = page.click
+        async def click_with_highlight(*args, **kwargs):
+            if args:
+                await page.evaluate('highlight("' + args[0] + '")')
+                await page.wait_for_timeout(500)  # Ждем, чтобы увидеть подсветку
+            return await original_click(*args, **kwargs)
+        page.click = click_with_highlight
+
+    # Выполняем тестовый код
+    exec(compile_test_code(test_code), {'page': page})
+
+    if not headless:
+        # Даем время на просмотр результата
+        page.wait_for_timeout(2000)
+
+    return page
+
+def _run_test_code_pooled(test_code, launch_options, context_options, highlight_actions, headless, timeout):
+    """Выполняет код теста в процессе-хосте зиготы на теплом браузере из пула хоста"""
+    def execute(browser, context):
+        page = _execute_page_code(context, test_code, highlight_actions, headless)
+        return page.video.path() if page.video else None
+
+    pool = get_browser_pool(**launch_options)
+    video_path = pool.run(execute, context_options=context_options, timeout=timeout)
+    logger.info(f"Browser pool stats: {pool.stats()}")
+    return video_path
+
+def run_test_code(test_code, profile=None, timeout=None, cancel_check=None):
+    result = {'success': False, 'error': None, 'timed_out': False, 'cancelled': False}
+    profile = profile or ExecutionProfile.get_default()
+    video_dir = os.path.join(settings.MEDIA_ROOT, 'test_videos')
+
+    def execute(browser, context):
+        page = _execute_page_code(context, test_code, profile.highlight_actions, profile.headless)
+        return page.video.path() if page.video else None
 
-def run_test_code(test_code):
-    result = {'success': False, 'error': None}
-    
     try:
-        with sync_playwright() as p:
-            # Запускаем браузер в видимом режиме с замедлением
-            browser = p.chromium.launch(
-                headless=False,  # Делаем браузер видимым
-                slow_mo=1000,    # Замедляем действия на 1 секунду
+        # Синтаксическая ошибка обнаруживается до запуска браузера
+        compile_test_code(test_code)
+        if use_zygote():
+            # Падение теста или браузера завершает только процесс-хост зиготы,
+            # пул теплых браузеров хоста переиспользуется следующими тестами
+            video_path = run_in_host(
+                _run_test_code_pooled,
+                (test_code, profile.launch_options(), profile.context_options(video_dir),
+                 profile.highlight_actions, profile.headless, timeout),
+                timeout=timeout,
+                cancel_check=cancel_check
             )
-            context = browser.new_context(
-                viewport={'width': 1280, 'height': 720}  # Устанавливаем размер окна
+        else:
+            # Берем теплый браузер из пула вместо запуска нового на каждый тест
+            pool = get_browser_pool(**profile.launch_options())
+            video_path = pool.run(
+                execute,
+                context_options=profile.context_options(video_dir),
+                timeout=timeout,
+                cancel_check=cancel_check
             )
-            page = context.new_page()
-            
-            # Добавляем базовые функции для подсветки элементов
-            page.add_init_script("""
-                window.highlight = function(selector) {
-                    const element = document.querySelector(selector);
-                    if (element) {
-                        const oldOutline = element.style.outline;
-                        element.style.outline = '3px solid red';
-                        setTimeout(() => {
-                            element.style.outline = oldOutline;
-                        }, 1000);
-                    }
-                }
-            """)
-            
-            # Перехватываем вызовы методов page для добавления подсветки
-            original_click = page.click
-            async def click_with_highlight(*args, **kwargs):
-                if args:
-                    await page.evaluate('highlight("' + args[0] + '")')
-                    await page.wait_for_timeout(500)  # Ждем, чтобы увидеть подсветку
-                return await original_click(*args, **kwargs)
-            page.click = click_with_highlight
-
-            # Выполняем тестовый код
-            exec(test_code, {'page': page})
-            
-            # Даем время на просмотр результата
-            page.wait_for_timeout(2000)
-            
-            browser.close()
-            result['success'] = True
-            
+            logger.info(f"Browser pool stats: {pool.stats()}")
+        result['success'] = True
+
+        # Видео успешного теста не нужно, если профиль пишет его только при падении
+        if video_path and profile.video == 'retain-on-failure' and os.path.exists(video_path):
+            os.unlink(video_path)
+
+    except ExecutionTimeout as e:
+        result['error'] = str(e)
+        result['timed_out'] = True
+        logger.error(f"Test code timed out: {e}")
+    except ExecutionCancelled as e:
+        result['error'] = str(e)
+        result['cancelled'] = True
+        logger.info("Test code cancelled")
     except Exception as e:
         result['error'] = str(e)
         logger.error(f"Error running test code: {e}")
@@ -309,13 +539,23 @@ def execute_test(test_run_id):
         test_code = test_run.test_case.test_code
         logger.info(f"Test code: {test_code}")
         
-        # Обновляем статус
-        test_run.status = 'running'
-        test_run.save()
+        # Обновляем статус, если запуск не отменили, пока он был в очереди
+        if not mark_running(test_run_id):
+            logger.info(f"Test run {test_run_id} was cancelled before start")
+            return {'status': 'cancelled', 'error': CANCEL_REASON}
+        test_run.refresh_from_db(fields=['status', 'started_at'])
         logger.info("Updated status to running")
 
         # Запускаем тест в отдельном потоке
-        result = run_test_code(test_code)
+        result = run_test_code(
+            test_code,
+            test_run.execution_profile,
+            timeout=get_test_timeout(test_run.test_case),
+            cancel_check=lambda: is_cancel_requested(test_run_id)
+        )
+        if result['cancelled']:
+            # Строка уже переведена в cancelled через API
+            return {'status': 'cancelled', 'error': CANCEL_REASON}
         
         # Обновляем результат
         test_run.finished_at = timezone.now()
@@ -330,7 +570,16 @@ def execute_test(test_run_id):
             test_run.error_message = result['error']
             logger.error(f"Test execution error: {result['error']}")
         
-        test_run.save()
+        # Отмена, пришедшая после завершения теста, не перезаписывается итогом
+        if not mark_finished(
+            test_run_id,
+            test_run.status,
+            finished_at=test_run.finished_at,
+            execution_time=test_run.duration,
+            error_message=test_run.error_message
+        ):
+            logger.info(f"Test run {test_run_id} was cancelled after the test finished")
+            return {'status': 'cancelled', 'error': CANCEL_REASON}
         logger.info(f"Test run finished. Status: {test_run.status}")
                 
         return {
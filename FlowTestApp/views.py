@@ -29,19 +29,34 @@ import asyncio
 from .models import (
     Project, Folder, TestCase, Role, CustomUser, Permission,
     AutomationProject, TestRun, SchedulerEvent, ReportTemplate,
-    TestReport
+    TestReport, ExecutionProfile, SuiteRun
 )
 from .serializers import (
     ProjectSerializer, FolderSerializer, TestCaseSerializer,
     RoleSerializer, CustomUserSerializer, PermissionSerializer, AutomationProjectSerializer,
-    TestRunSerializer, SchedulerEventSerializer, ReportTemplateSerializer,
+    TestRunSerializer, TestRunListSerializer, SchedulerEventSerializer, ReportTemplateSerializer,
     ReportMetricsSerializer, ReportChartDataSerializer,
-    TestReportSerializer, AnalyticsResponseSerializer
+    TestReportSerializer, AnalyticsResponseSerializer, ExecutionProfileSerializer,
+    SuiteRunSerializer
 )
 from .services.automation_service import AutomationService
+from .services.batch_orchestrator import BatchOrchestrator
+from .services.suite_recorder import SuiteRecorder
 from .services.repository_service import RepositoryService
 from .services.scheduler_service import SchedulerService
-from .tasks import execute_test
+from .services.browser_pool import get_browser_pool
+from .services.code_cache import compile_test_code, describe_syntax_error
+from .services.concurrency import get_concurrency_states
+from .services.fair_share import FairShareDispatcher
+from .services.impact_analysis import ImpactAnalyzer
+from .services.timeouts import ExecutionTimeout, get_test_timeout
+from .services.cancellation import cancel_suite_run, cancel_test_runs
+from .services.run_log import RunLog, compact_log, log_tail, read_log
+from .services.queues import QUEUE_INTERACTIVE, QUEUE_SYNC, estimate_queue_position
+from .services.coalescing import (
+    IdempotencyKeyReused, batch_fingerprint, channel_group, get_idempotency_key, run_coalesced, start_test_run
+)
+from .tasks import execute_test, run_suite_test_cases
 from FlowTest.celery import app
 
 # Валидаторы для аватара
@@ -88,10 +103,10 @@ def create_test_run(test_case):
     test_run = TestRun(
         test_case=test_case,
         status='pending',
-        started_at=timezone.now(),
-        log_output='Test execution started...\n'
+        started_at=timezone.now()
     )
     test_run.save()
+    RunLog(test_run.id).append('stdout', 'Test execution started...\n')
     return test_run
 
 @sync_to_async
@@ -110,57 +125,65 @@ async def run_test_in_thread(test_run_id):
         print(f"Starting test execution in thread for test run {test_run_id}")
         test_run = await sync_to_async(TestRun.objects.get)(id=test_run_id)
         test_case = test_run.test_case
+        # Лог пишется порциями в TestRunLogChunk, строка TestRun не перезаписывается на каждую строку
+        log = RunLog(test_run.id)
+        append_log = sync_to_async(log.append)
         
         test_run.status = 'running'
-        test_run.log_output = 'Initializing browser...\n'
         await sync_to_async(test_run.save)()
+        await append_log('stdout', 'Initializing browser...\n')
+        profile = await sync_to_async(
+            lambda: test_run.execution_profile or ExecutionProfile.get_default()
+        )()
         
-        from playwright.sync_api import sync_playwright
-        import threading
-        
-        def run_playwright_test():
+        def run_playwright_test(browser, context):
             try:
-                with sync_playwright() as p:
-                    browser = p.chromium.launch(headless=False, args=['--start-maximized'])
-                    try:
-                        context = browser.new_context(viewport={'width': 1920, 'height': 1080})
-                        page = context.new_page()
-                        test_locals = {
-                            'page': page,
-                            'context': context,
-                            'browser': browser,
-                            'test_run': test_run,
-                            'logger': None,
-                        }
-                        exec(test_case.test_code, test_locals)
-                        test_run.status = 'success'
-                        test_run.finished_at = timezone.now()
-                        test_run.duration = (test_run.finished_at - test_run.started_at).total_seconds()
-                        test_run.log_output += '\nTest completed successfully\n'
-                    except Exception as e:
-                        import traceback
-                        error_details = f'\nTest failed: {str(e)}\n{traceback.format_exc()}'
-                        test_run.status = 'failure'
-                        test_run.finished_at = timezone.now()
-                        test_run.duration = (test_run.finished_at - test_run.started_at).total_seconds()
-                        test_run.error_message = str(e)
-                        test_run.log_output += error_details
-                    finally:
-                        if 'context' in locals():
-                            context.close()
-                        browser.close()
+                page = context.new_page()
+                test_locals = {
+                    'page': page,
+                    'context': context,
+                    'browser': browser,
+                    'test_run': test_run,
+                    'logger': None,
+                }
+                exec(compile_test_code(test_case.test_code), test_locals)
+                test_run.status = 'success'
+                test_run.finished_at = timezone.now()
+                test_run.duration = (test_run.finished_at - test_run.started_at).total_seconds()
+                log.append('stdout', '\nTest completed successfully\n')
             except Exception as e:
-                print(f"Error initializing Playwright: {str(e)}", exc_info=True)
-                test_run.status = 'error'
+                import traceback
+                error_details = f'\nTest failed: {str(e)}\n{traceback.format_exc()}'
+                test_run.status = 'failure'
                 test_run.finished_at = timezone.now()
                 test_run.duration = (test_run.finished_at - test_run.started_at).total_seconds()
-                test_run.error_message = f'Failed to initialize Playwright: {str(e)}'
-                test_run.log_output += '\nFailed to initialize browser\n'
-        
-        thread = threading.Thread(target=run_playwright_test)
-        thread.start()
-        thread.join()
+                test_run.error_message = str(e)
+                log.append('stderr', error_details)
+
+        try:
+            # Браузер берется из пула теплых браузеров, контекст создается заново
+            pool = get_browser_pool(**profile.launch_options())
+            timeout = await sync_to_async(get_test_timeout)(test_case)
+            await sync_to_async(pool.run, thread_sensitive=False)(
+                run_playwright_test,
+                context_options=profile.context_options(),
+                timeout=timeout
+            )
+        except ExecutionTimeout as e:
+            test_run.status = 'error'
+            test_run.finished_at = timezone.now()
+            test_run.duration = (test_run.finished_at - test_run.started_at).total_seconds()
+            test_run.error_message = str(e)
+            await append_log('stderr', f'\n{e}\n')
+        except Exception as e:
+            print(f"Error initializing Playwright: {str(e)}")
+            test_run.status = 'error'
+            test_run.finished_at = timezone.now()
+            test_run.duration = (test_run.finished_at - test_run.started_at).total_seconds()
+            test_run.error_message = f'Failed to initialize Playwright: {str(e)}'
+            await append_log('stderr', '\nFailed to initialize browser\n')
         await sync_to_async(test_run.save)()
+        await sync_to_async(compact_log)(test_run.id)
     except Exception as e:
         print(f"Error during test execution: {str(e)}", exc_info=True)
         try:
@@ -169,7 +192,7 @@ async def run_test_in_thread(test_run_id):
             test_run.finished_at = timezone.now()
             test_run.duration = (test_run.finished_at - test_run.started_at).total_seconds()
             test_run.error_message = f'Failed to initialize test: {str(e)}'
-            test_run.log_output = 'Test initialization failed\n'
+            await sync_to_async(RunLog(test_run.id).append)('stderr', 'Test initialization failed\n')
             await sync_to_async(test_run.save)()
         except Exception as e2:
             print(f"Failed to update test run status: {str(e2)}", exc_info=True)
@@ -199,10 +222,18 @@ class TestCaseViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def execute(self, request, pk=None):
-        return Response({
-            'status': 'error',
-            'error': 'Please use /api/execute-test/<test_id>/ endpoint'
-        }, status=400)
+        test_case = self.get_object()
+        try:
+            test_run, coalesced = start_test_run(
+                test_case, _get_execution_profile(request), idempotency_key=get_idempotency_key(request)
+            )
+            return Response(_test_run_started(test_run, coalesced))
+        except ExecutionProfile.DoesNotExist as e:
+            return Response({'status': 'error', 'error': str(e)}, status=400)
+        except IdempotencyKeyReused as e:
+            return Response({'status': 'error', 'error': str(e)}, status=422)
+        except Exception as e:
+            return Response({'status': 'error', 'error': str(e)}, status=500)
 
     @action(detail=True, methods=['get'])
     def get_test_status(self, request, pk=None):
@@ -213,8 +244,8 @@ class TestCaseViewSet(viewsets.ModelViewSet):
                 'status': test_run.status,
                 'started_at': test_run.started_at,
                 'finished_at': test_run.finished_at,
-                'duration': test_run.duration,
-                'output': test_run.log_output,
+                'duration': test_run.execution_time,
+                'output': log_tail(test_run),
                 'error': test_run.error_message
             })
         except TestRun.DoesNotExist:
@@ -291,6 +322,15 @@ class TestCaseViewSet(viewsets.ModelViewSet):
         test_code = request.data.get('test_code')
         if test_code is None:
             return Response({'error': 'Test code is required'}, status=400)
+        # Код компилируется при сохранении: синтаксическая ошибка возвращается сразу, а не при запуске
+        try:
+            compile_test_code(test_code)
+        except (SyntaxError, ValueError) as e:
+            return Response({
+                'error': f'Syntax error: {describe_syntax_error(e)}',
+                'line': getattr(e, 'lineno', None),
+                'offset': getattr(e, 'offset', None)
+            }, status=400)
         test_case.test_code = test_code
         test_case.save()
         return Response({'test_code': test_case.test_code})
@@ -499,8 +539,54 @@ class TestRunViewSet(viewsets.ModelViewSet):
         test_case_id = self.request.query_params.get('test_case', None)
         if test_case_id is not None:
             queryset = queryset.filter(test_case_id=test_case_id)
+        if self.action == 'list':
+            # Вывод старых запусков хранится в строке, в списке его не читаем
+            queryset = queryset.defer('output')
         return queryset
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return TestRunListSerializer
+        return TestRunSerializer
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        test_run = self.get_object()
+        if not cancel_test_runs([test_run.id]):
+            return Response(
+                {'error': f'Test run is already {test_run.status}'},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response({'status': 'cancelled', 'test_run_id': test_run.id})
+
+    @action(detail=False, methods=['post'], url_path='cancel')
+    def cancel_many(self, request):
+        test_run_ids = request.data.get('test_run_ids', [])
+        if not test_run_ids:
+            return Response({'error': 'No test runs selected'}, status=status.HTTP_400_BAD_REQUEST)
+        cancelled = cancel_test_runs(test_run_ids)
+        return Response({'status': 'success', 'cancelled': cancelled})
+
+    @action(detail=True, methods=['get'])
+    def log(self, request, pk=None):
+        """
+        Вывод прогона со смещения offset в байтах (отрицательное - от конца) не больше limit байт.
+        Для чтения хвоста клиент повторяет запрос с offset=next_offset, пока прогон не завершен
+        """
+        test_run = self.get_object()
+        try:
+            offset = int(request.query_params.get('offset', 0))
+            limit = int(request.query_params['limit']) if 'limit' in request.query_params else None
+        except ValueError:
+            return Response({'error': 'offset and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit is not None and limit <= 0:
+            return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = read_log(test_run.id, offset, limit)
+        data['status'] = test_run.status
+        data['finished'] = test_run.finished_at is not None
+        return Response(data)
+
     @action(detail=True, methods=['get'], url_path='status')
     def get_test_status(self, request, pk=None):
         print(f"Getting status for test run {pk}")
@@ -508,10 +594,10 @@ class TestRunViewSet(viewsets.ModelViewSet):
             test_run = TestRun.objects.get(id=pk)
             return Response({
                 'status': test_run.status,
-                'started_at': test_run.created_at,
+                'started_at': test_run.started_at,
                 'finished_at': test_run.finished_at,
-                'duration': test_run.duration,
-                'output': test_run.log_output,
+                'duration': test_run.execution_time,
+                'output': log_tail(test_run),
                 'error': test_run.error_message
             })
         except TestRun.DoesNotExist:
@@ -520,6 +606,86 @@ class TestRunViewSet(viewsets.ModelViewSet):
             print(f"Error getting test status: {str(e)}", exc_info=True)
             return Response({'status': 'error', 'error': str(e)}, status=500)
 
+# ViewSet для ExecutionProfile
+class ExecutionProfileViewSet(viewsets.ModelViewSet):
+    queryset = ExecutionProfile.objects.all()
+    serializer_class = ExecutionProfileSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication, SessionAuthentication]
+
+# ViewSet для SuiteRun
+class SuiteRunViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = SuiteRun.objects.all()
+    serializer_class = SuiteRunSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication, SessionAuthentication]
+
+    def get_queryset(self):
+        queryset = SuiteRun.objects.all()
+        automation_project_id = self.request.query_params.get('automation_project', None)
+        if automation_project_id is not None:
+            queryset = queryset.filter(automation_project_id=automation_project_id)
+        return queryset
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        suite_run = self.get_object()
+        if not cancel_suite_run(suite_run):
+            return Response(
+                {'error': f'Suite run is already {suite_run.status}'},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response({'status': 'cancelled', 'suite_run_id': suite_run.id})
+
+    @action(detail=True, methods=['post'])
+    def rerun_failed(self, request, pk=None):
+        """
+        Перезапуск упавших тестов прогона новым прогоном: распределенного - по шардам,
+        прогона BatchTestRunner (без шардов) - по упавшим первым попыткам его TestRun
+        """
+        suite_run = self.get_object()
+        if suite_run.status not in ('passed', 'failed', 'cancelled', 'error'):
+            return Response(
+                {'error': f'Suite run is still {suite_run.status}'},
+                status=status.HTTP_409_CONFLICT
+            )
+        if not suite_run.shards:
+            return self._rerun_failed_test_cases(suite_run)
+        tests = BatchOrchestrator.failed_tests(suite_run)
+        if not tests:
+            return Response({'status': 'success', 'suite_run_id': None, 'message': 'No failed tests to rerun'})
+
+        try:
+            rerun = BatchOrchestrator().dispatch(
+                suite_run.automation_project, tests, profile=suite_run.execution_profile, retry_of=suite_run
+            )
+        except Exception as e:
+            return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({
+            'status': 'success',
+            'suite_run_id': rerun.id,
+            'total_shards': rerun.total_shards,
+            'test_ids': [test.id for test in tests]
+        })
+
+    def _rerun_failed_test_cases(self, suite_run):
+        test_cases = SuiteRecorder.failed_test_cases(suite_run)
+        if not test_cases:
+            return Response({'status': 'success', 'suite_run_id': None, 'message': 'No failed tests to rerun'})
+
+        try:
+            rerun = SuiteRecorder.start(test_cases, suite_run.execution_profile, retry_of=suite_run).suite_run
+            rerun.task_id = run_suite_test_cases.delay(rerun.id, [test_case.id for test_case in test_cases]).id
+            rerun.save(update_fields=['task_id'])
+        except Exception as e:
+            return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({
+            'status': 'success',
+            'suite_run_id': rerun.id,
+            'total_shards': 0,
+            'test_case_ids': [test_case.id for test_case in test_cases]
+        })
+
 # ViewSet для SchedulerEvent
 class SchedulerEventViewSet(viewsets.ModelViewSet):
     queryset = SchedulerEvent.objects.all()
@@ -687,6 +853,15 @@ class AutomationProjectViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def sync(self, request, pk=None):
         project = self.get_object()
+        if request.data.get('background'):
+            # Синхронизация в очереди sync, не занимая веб-процесс
+            from .tasks import sync_automation_project
+            task = sync_automation_project.delay(project.id)
+            return Response({
+                'status': 'queued',
+                'task_id': task.id,
+                'queue': estimate_queue_position(QUEUE_SYNC)
+            }, status=status.HTTP_202_ACCEPTED)
         automation_service = AutomationService()
         try:
             automation_service.sync_repository(project)
@@ -708,18 +883,62 @@ class AutomationProjectViewSet(viewsets.ModelViewSet):
         if not test_ids:
             return Response({'error': 'No tests selected'}, status=status.HTTP_400_BAD_REQUEST)
         automation_service = AutomationService()
+        distributed = _get_distributed(request)
         try:
-            results = automation_service.run_tests(project, test_ids)
-            return Response({'status': 'success', 'results': results})
+            # Одинаковые одновременные запросы (двойной клик, повтор клиента) выполняются один раз
+            results, coalesced = run_coalesced(
+                batch_fingerprint(project, test_ids, distributed=distributed),
+                lambda: automation_service.run_tests(project, test_ids, distributed=distributed),
+                idempotency_key=get_idempotency_key(request)
+            )
+            return Response({'status': 'success', 'results': results, 'coalesced': coalesced})
+        except IdempotencyKeyReused as e:
+            return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except Exception as e:
+            return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=True, methods=['post'])
+    def run_affected(self, request, pk=None):
+        """Запуск только тестов, затронутых изменениями с коммита, проверенного прошлым запуском"""
+        project = self.get_object()
+        distributed = _get_distributed(request)
+        selection = ImpactAnalyzer(project).select(
+            project.tests.filter(is_available=True), project.last_affected_commit_sha
+        )
+        test_ids = [test.id for test in selection['tests']]
+        summary = {
+            'full': selection['full'],
+            'reason': selection['reason'],
+            'changed_files': selection['changed_files'],
+            'test_ids': test_ids
+        }
+        if not test_ids:
+            _record_affected_commit(project, selection['commit'])
+            return Response({'status': 'success', 'selection': summary, 'results': None})
+
+        automation_service = AutomationService()
+        try:
+            results, coalesced = run_coalesced(
+                batch_fingerprint(project, test_ids, distributed=distributed),
+                lambda: automation_service.run_tests(project, test_ids, distributed=distributed),
+                idempotency_key=get_idempotency_key(request)
+            )
+            # Следующий запуск выберет тесты по изменениям после проверенного коммита;
+            # распределенный прогон выполняет шарды на коммите SuiteRun, то есть на нем же
+            _record_affected_commit(project, selection['commit'])
+            return Response({'status': 'success', 'selection': summary, 'results': results, 'coalesced': coalesced})
+        except IdempotencyKeyReused as e:
+            return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         except Exception as e:
             return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=True, methods=['post'])
     def run_all(self, request, pk=None):
         project = self.get_object()
+        distributed = _get_distributed(request)
         automation_service = AutomationService()
         try:
-            results = automation_service.run_all_tests(project)
+            results = automation_service.run_all_tests(project, distributed=distributed)
             return Response({'status': 'success', 'results': results})
         except Exception as e:
             return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -875,26 +1094,22 @@ class TestExecutionView(AsyncAuthMixin):
     async def post(self, request, test_id):
         print(f"Executing test {test_id}")
         try:
-            test_case = await sync_to_async(TestCase.objects.get)(id=test_id)
+            test_case = await sync_to_async(TestCase.objects.select_related('automation_project').get)(id=test_id)
             print(f"Found test case: {test_case}")
-            test_run = await sync_to_async(TestRun.objects.create)(
-                test_case=test_case,
-                status='pending',
-                started_at=timezone.now()
+            profile = await sync_to_async(_get_execution_profile)(request)
+            test_run, coalesced = await sync_to_async(start_test_run)(
+                test_case, profile, idempotency_key=get_idempotency_key(request)
             )
-            print(f"Created test run: {test_run}")
-            from .tasks import execute_test
-            task = execute_test.delay(test_run.id)
-            print(f"Started Celery task: {task.id}")
-            return Response({
-                'status': 'success',
-                'message': 'Test execution started',
-                'test_run_id': test_run.id,
-                'task_id': task.id
-            })
+            print(f"Test run: {test_run} (coalesced: {coalesced})")
+            data = await sync_to_async(_test_run_started)(test_run, coalesced)
+            return Response({'status': 'success', 'message': 'Test execution started', **data})
         except TestCase.DoesNotExist:
             print(f"Test case {test_id} not found")
             return Response({'status': 'error', 'error': f'Test case {test_id} not found'}, status=status.HTTP_404_NOT_FOUND)
+        except ExecutionProfile.DoesNotExist as e:
+            return Response({'status': 'error', 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except IdempotencyKeyReused as e:
+            return Response({'status': 'error', 'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         except Exception as e:
             print(f"Error executing test {test_id}: {str(e)}", exc_info=True)
             return Response({'status': 'error', 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -921,9 +1136,9 @@ class TestStatusView(AsyncAuthMixin):
                 'test_case_title': test_run.test_case.title if test_run.test_case else None,
                 'started_at': test_run.started_at.isoformat() if test_run.started_at else None,
                 'finished_at': test_run.finished_at.isoformat() if test_run.finished_at else None,
-                'duration': test_run.duration,
+                'duration': test_run.execution_time,
                 'error_message': test_run.error_message,
-                'log_output': test_run.log_output
+                'log_output': await sync_to_async(log_tail)(test_run)
             }
             return Response(response_data)
         except TestRun.DoesNotExist:
@@ -952,15 +1167,54 @@ class CheckTestExistenceView(APIView):
             print(f"Error checking test existence: {str(e)}", exc_info=True)
             return Response({'status': 'error', 'error': str(e)}, status=500)
 
+def _get_distributed(request) -> bool:
+    """Флаг distributed из тела запроса: 'false' и '0' - False, неизвестное значение - ошибка 400"""
+    return serializers.BooleanField().to_internal_value(request.data.get('distributed', False))
+
+def _record_affected_commit(project, commit):
+    """Запоминает коммит, проверенный запуском затронутых тестов"""
+    project.last_affected_commit_sha = commit
+    project.save(update_fields=['last_affected_commit_sha'])
+
+def _get_execution_profile(request):
+    """Профиль из поля profile запроса; неизвестное имя - ExecutionProfile.DoesNotExist"""
+    profile_name = request.data.get('profile') if hasattr(request.data, 'get') else None
+    if profile_name:
+        try:
+            return ExecutionProfile.objects.get(name=profile_name)
+        except ExecutionProfile.DoesNotExist:
+            raise ExecutionProfile.DoesNotExist(f"Execution profile '{profile_name}' not found")
+    return ExecutionProfile.get_default()
+
+def _test_run_started(test_run, coalesced):
+    """
+    Ответ на запрос запуска. Если запрос присоединен к уже выполняющемуся
+    запуску, клиент подписывается на его группу channels и получает тот же результат.
+    """
+    return {
+        'test_run_id': test_run.id,
+        'task_id': test_run.celery_task_id,
+        'coalesced': coalesced,
+        'run_status': test_run.status,
+        'channel_group': channel_group(test_run.id),
+        'queue': estimate_queue_position(QUEUE_INTERACTIVE)
+    }
+
 # API для запуска теста
 @api_view(['POST'])
 def execute_test_api(request, test_id):
     try:
-        test_case = TestCase.objects.get(id=test_id)
-        test_run = TestRun.objects.create(test_case=test_case, status='pending')
-        return Response({'test_run_id': test_run.id})
+        test_case = TestCase.objects.select_related('automation_project').get(id=test_id)
+        test_run, coalesced = start_test_run(
+            test_case, _get_execution_profile(request), idempotency_key=get_idempotency_key(request)
+        )
+        return Response(_test_run_started(test_run, coalesced))
     except TestCase.DoesNotExist:
         return Response({'error': 'Test not found'}, status=404)
+    except ExecutionProfile.DoesNotExist as e:
+        return Response({'error': str(e)}, status=400)
+    except IdempotencyKeyReused as e:
+        return Response({'error': str(e)}, status=422)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
@@ -979,7 +1233,7 @@ def results_distribution(request, project_id=None):
         
         queryset = TestRun.objects.all()
         if project_id:
-            queryset = queryset.filter(test_case__folder__project_id=project_id)
+            queryset = queryset.filter(project_id=project_id)
             
         stats = queryset.values('status').annotate(
             count=Count('id')
@@ -1063,7 +1317,7 @@ def test_execution_stats(request, project_id=None):
         total_tests = TestCase.objects.filter(folder__project_id=project_id).count()
 
         # Get all test runs
-        test_runs = TestRun.objects.filter(test_case__folder__project_id=project_id)
+        test_runs = TestRun.objects.filter(project_id=project_id)
         total_executions = test_runs.count()
 
         # Calculate distribution by status
@@ -1316,7 +1570,7 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
             project = Project.objects.get(id=project_id)
             test_cases = TestCase.objects.filter(folder__project=project)
             test_runs = TestRun.objects.filter(
-                test_case__in=test_cases,
+                project=project,
                 started_at__range=(start_date, end_date)
             ).order_by('-started_at')
             
@@ -1424,7 +1678,7 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
             # Получаем тест-кейсы и тест-ранны
             test_cases = TestCase.objects.filter(folder__project_id=project_id)
             test_runs = TestRun.objects.filter(
-                test_case__in=test_cases,
+                project_id=project_id,
                 started_at__range=(start_date, end_date)
             )
             
@@ -1471,7 +1725,7 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
                 
             # Получаем тест-ранны
             test_runs = TestRun.objects.filter(
-                test_case__folder__project_id=project_id,
+                project_id=project_id,
                 started_at__range=(start_date, end_date)
             )
             
@@ -1518,7 +1772,7 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
         try:
             # Получаем тест-ранны
             test_runs = TestRun.objects.filter(
-                test_case__folder__project_id=project_id,
+                project_id=project_id,
                 started_at__range=(start_date, end_date)
             )
             
@@ -1554,7 +1808,7 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
         try:
             # Получаем последние тест-ранны
             test_runs = TestRun.objects.filter(
-                test_case__folder__project_id=project_id
+                project_id=project_id
             ).order_by('-started_at')[:limit]
             
             # Формируем данные
@@ -1876,7 +2130,7 @@ def tests_over_time(request):
 
         # Get test runs for the project
         test_runs = TestRun.objects.filter(
-            test_case__folder__project_id=project_id,
+            project_id=project_id,
             started_at__range=(start_date, end_date)
         )
 
@@ -1932,7 +2186,7 @@ def results_distribution(request):
             return Response([])
 
         # Получаем все тест-раны для данного проекта
-        test_runs = TestRun.objects.filter(test_case__folder__project_id=project_id)
+        test_runs = TestRun.objects.filter(project_id=project_id)
         
         # Группируем и считаем по статусам
         status_counts = test_runs.values('status').annotate(count=Count('id'))
@@ -2034,7 +2288,7 @@ def test_execution_stats(request, project_id=None):
         total_tests = TestCase.objects.filter(folder__project_id=project_id).count()
 
         # Get all test runs
-        test_runs = TestRun.objects.filter(test_case__folder__project_id=project_id)
+        test_runs = TestRun.objects.filter(project_id=project_id)
         total_executions = test_runs.count()
 
         # Calculate distribution by status
@@ -2081,4 +2335,22 @@ def test_execution_stats(request, project_id=None):
                 'pending': 0
             },
             'avg_execution_time': 0
-        })
\ No newline at end of file
+        })
+
+# Текущий лимит одновременных тестов на воркерах и причины его изменения
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def execution_concurrency(request):
+    try:
+        return Response({'workers': get_concurrency_states()})
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# Доли проектов в общем пуле воркеров и очереди задач, ждущих слота
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def execution_fair_share(request):
+    try:
+        return Response(FairShareDispatcher().snapshot())
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -28,12 +28,13 @@ def start_redis():
     print("Redis already running")
     return None
 
-def start_celery():
+def start_celery(queues="scheduled,sync,interactive", name="bulk"):
     """Start Celery worker"""
-    print("Starting Celery worker...")
+    print(f"Starting Celery worker {name} ({queues})...")
     # Запускаем Celery в фоновом режиме
     celery = subprocess.Popen(
-        ["celery", "-A", "FlowTest", "worker", "--pool=solo", "--loglevel=info"],
+        ["celery", "-A", "FlowTest", "worker", "--pool=solo", "--loglevel=info",
+         "-Q", queues, "-n", f"{name}@%h"],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         creationflags=subprocess.CREATE_NO_WINDOW
@@ -69,6 +70,10 @@ def main():
         
         celery_process = start_celery()
         processes.append(celery_process)
+
+        # Отдельный воркер только для интерактивных запусков, чтобы они не ждали расписание
+        interactive_process = start_celery("interactive", "interactive")
+        processes.append(interactive_process)
         
         django_process = start_django()
         processes.append(django_process)